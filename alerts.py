@@ -0,0 +1,487 @@
+import argparse
+import heapq
+import json
+import os
+import smtplib
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import pandas as pd
+from logly import logger
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from database import (
+    SessionLocal,
+    USE_DATABASE,
+    change_bus,
+    EquipmentModel,
+    Equipment,
+    SparePart,
+    ReplacementRecord,
+    WearThresholdEvent,
+    WearEventDirtyPosition,
+    AlertLog,
+)
+from utils import configure_logging
+from wear_events import refresh_wear_events
+
+# Уведомления о переходе позиций (VIN, запчасть) в желтую/красную зону и
+# о наступлении крайнего срока закупки. Даты событий уже рассчитаны
+# (wear_events.py); в куче хранится ближайшее событие каждой позиции, и
+# процесс спит до него. После записи замен пересчитываются только затронутые
+# позиции, поэтому работа пропорциональна количеству событий, а не размеру
+# парка. Уведомления собираются в пачки, повторные отсекаются по alert_log.
+# В alert_log пачка записывается, только если ее принял хотя бы один
+# приемник; иначе она остается в очереди и отправляется повторно.
+
+# Куда отправлять: через запятую log, file:<путь>, webhook:<url>, email:<адрес>
+ALERT_SINKS = os.getenv("ALERT_SINKS", "log")
+# Сколько секунд собирать уведомления в одну пачку
+ALERT_BATCH_SECONDS = float(os.getenv("ALERT_BATCH_SECONDS", "60"))
+# Максимальный размер пачки
+ALERT_BATCH_MAX = int(os.getenv("ALERT_BATCH_MAX", "100"))
+# События, наступившие за это время до запуска, тоже отправляются (ч.)
+ALERT_LOOKBACK_HOURS = float(os.getenv("ALERT_LOOKBACK_HOURS", "24"))
+# Как часто проверять шину изменений (с)
+ALERT_POLL_SECONDS = float(os.getenv("ALERT_POLL_SECONDS", "5"))
+# Полная сверка кучи с таблицей событий (мин.): на случай пропущенных изменений
+ALERT_RESYNC_MINUTES = float(os.getenv("ALERT_RESYNC_MINUTES", "60"))
+# Через сколько секунд повторять отправку в приемник, который ее не принял
+ALERT_RETRY_SECONDS = float(os.getenv("ALERT_RETRY_SECONDS", "300"))
+# Сколько уведомлений хранить для повторной отправки в один приемник
+ALERT_RETRY_MAX = int(os.getenv("ALERT_RETRY_MAX", "10000"))
+ALERT_SMTP_HOST = os.getenv("ALERT_SMTP_HOST", "localhost")
+ALERT_SMTP_PORT = int(os.getenv("ALERT_SMTP_PORT", "1025"))
+ALERT_EMAIL_FROM = os.getenv("ALERT_EMAIL_FROM", "gpmech@localhost")
+
+ALERT_TITLES = {
+    "yellow": "переход в желтую зону",
+    "red": "переход в красную зону",
+    "deadline": "крайний срок закупки",
+}
+
+
+class LogSink:
+    """Уведомления в журнал приложения"""
+
+    def send(self, alerts):
+        for alert in alerts:
+            logger.warning(
+                f"{alert['event_date']:%d.%m.%Y}: {ALERT_TITLES[alert['threshold']]} - "
+                f"{alert['equipment_model']} {alert['vin']}, {alert['spare_part_name']}"
+            )
+
+
+class FileSink:
+    """Уведомления в файл JSON Lines (для проверки без почты и веб-хуков)"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, alerts):
+        with open(self.path, "a", encoding="utf-8") as file:
+            for alert in alerts:
+                file.write(json.dumps(alert, ensure_ascii=False, default=str) + "\n")
+
+
+class WebhookSink:
+    """Пачка уведомлений одним POST-запросом с телом JSON"""
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alerts):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"alerts": alerts}, ensure_ascii=False, default=str).encode(
+                "utf-8"
+            ),
+            headers={"Content-Type": "application/json; charset=utf-8"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class EmailSink:
+    """
+    Пачка уведомлений одним письмом через SMTP
+    (для проверки - локальный сервер, например python -m aiosmtpd -n)
+    """
+
+    def __init__(self, recipient, host=ALERT_SMTP_HOST, port=ALERT_SMTP_PORT):
+        self.recipient = recipient
+        self.host = host
+        self.port = port
+
+    def send(self, alerts):
+        message = EmailMessage()
+        message["Subject"] = f"Износ запчастей: уведомлений - {len(alerts)}"
+        message["From"] = ALERT_EMAIL_FROM
+        message["To"] = self.recipient
+        message.set_content(
+            "\n".join(
+                f"{alert['event_date']:%d.%m.%Y} {ALERT_TITLES[alert['threshold']]}: "
+                f"{alert['equipment_model']} {alert['vin']}, "
+                f"{alert['spare_part_name']}"
+                for alert in alerts
+            )
+        )
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.send_message(message)
+
+
+def create_sinks(spec=ALERT_SINKS):
+    """Приемники уведомлений по строке вида 'log,file:alerts.jsonl,webhook:http://...'"""
+    sinks = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, target = item.partition(":")
+        if kind == "log":
+            sinks.append(LogSink())
+        elif kind == "file":
+            sinks.append(FileSink(target))
+        elif kind == "webhook":
+            sinks.append(WebhookSink(target))
+        elif kind == "email":
+            sinks.append(EmailSink(target))
+        else:
+            raise ValueError(f"Неизвестный приемник уведомлений: {item}")
+    return sinks
+
+
+def _event_rows(db: Session, since: datetime, positions=None):
+    """События с датой не раньше since (для позиций positions или для всех)"""
+    stmt = select(
+        WearThresholdEvent.event_date,
+        WearThresholdEvent.equipment_id,
+        WearThresholdEvent.spare_part_id,
+        WearThresholdEvent.threshold,
+        WearThresholdEvent.last_replacement,
+    ).where(WearThresholdEvent.event_date >= since)
+    if positions is not None:
+        stmt = stmt.where(
+            tuple_(
+                WearThresholdEvent.equipment_id, WearThresholdEvent.spare_part_id
+            ).in_(positions)
+        )
+    return [tuple(row) for row in db.execute(stmt)]
+
+
+class AlertEngine:
+    """
+    Куча ближайших событий по позициям. Элемент кучи - (дата, equipment_id,
+    spare_part_id, порог, последняя замена); для каждой позиции действителен
+    только элемент из self.expected, остальные (устаревшие после пересчета
+    позиции) пропускаются при извлечении.
+    """
+
+    def __init__(
+        self,
+        sinks,
+        batch_seconds=ALERT_BATCH_SECONDS,
+        batch_max=ALERT_BATCH_MAX,
+        lookback_hours=ALERT_LOOKBACK_HOURS,
+        retry_seconds=ALERT_RETRY_SECONDS,
+    ):
+        self.sinks = sinks
+        self.batch_seconds = batch_seconds
+        self.batch_max = batch_max
+        self.lookback = timedelta(hours=lookback_hours)
+        self.retry = timedelta(seconds=retry_seconds)
+        self.heap = []
+        self.expected = {}
+        self.pending = {}
+        self.pending_since = None
+        # Уведомления, уже записанные в alert_log, но не принятые приемником:
+        # {номер приемника: [уведомления]}, повтор не раньше retry_at
+        self.undelivered = {}
+        self.retry_at = None
+        self.changes = change_bus.subscribe() if change_bus is not None else None
+
+    def _push_next(self, position, rows, after=None):
+        """Ближайшее событие позиции из rows, следующее за after"""
+        candidates = sorted(
+            row
+            for row in rows
+            if (row[1], row[2]) == position
+            and (after is None or (row[0], row[3]) > (after[0], after[3]))
+        )
+        if candidates:
+            self.expected[position] = candidates[0]
+            heapq.heappush(self.heap, candidates[0])
+        else:
+            self.expected.pop(position, None)
+
+    def load(self, db: Session, now=None):
+        """Полная загрузка кучи из таблицы событий"""
+        now = datetime.now() if now is None else now
+        refresh_wear_events(db)
+        self.heap, self.expected = [], {}
+        for row in sorted(_event_rows(db, now - self.lookback)):
+            position = (row[1], row[2])
+            if position not in self.expected:
+                self.expected[position] = row
+                self.heap.append(row)
+        heapq.heapify(self.heap)
+
+    def apply_changes(self, db: Session, replacement_ids, now=None):
+        """
+        Пересчет позиций, затронутых записью замен или правкой справочников:
+        отмеченные к пересчету и позиции существующих измененных записей. Если отметки уже сняты
+        другим пересчетом (precompute.py), удаленные записи учтет только
+        плановая сверка (ALERT_RESYNC_MINUTES).
+        """
+        now = datetime.now() if now is None else now
+        positions = set(
+            tuple(row)
+            for row in db.execute(
+                select(
+                    WearEventDirtyPosition.equipment_id,
+                    WearEventDirtyPosition.spare_part_id,
+                )
+            )
+        )
+        if replacement_ids:
+            positions.update(
+                tuple(row)
+                for row in db.execute(
+                    select(
+                        ReplacementRecord.equipment_id, ReplacementRecord.spare_part_id
+                    ).where(ReplacementRecord.id.in_(replacement_ids))
+                )
+            )
+        refresh_wear_events(db)
+        positions = sorted(positions)
+        for start in range(0, len(positions), 1000):
+            chunk = positions[start : start + 1000]
+            rows = _event_rows(db, now - self.lookback, chunk)
+            for position in chunk:
+                self._push_next(position, rows)
+
+    def collect_due(self, db: Session, now=None):
+        """Извлечение наступивших событий в пачку (без повторов)"""
+        now = datetime.now() if now is None else now
+        while self.heap and self.heap[0][0] <= now:
+            row = heapq.heappop(self.heap)
+            position = (row[1], row[2])
+            if self.expected.get(position) != row:
+                continue
+            key = (*position, row[3], row[4])
+            if key not in self.pending and db.get(AlertLog, key) is None:
+                self.pending[key] = row
+                if self.pending_since is None:
+                    self.pending_since = now
+            # Следующее событие той же позиции
+            self._push_next(position, _event_rows(db, row[0], [position]), row)
+
+    def flush_due(self, now=None):
+        now = datetime.now() if now is None else now
+        if self.retry_at is not None and now < self.retry_at:
+            return False
+        if self.undelivered:
+            return True
+        return bool(self.pending) and (
+            len(self.pending) >= self.batch_max
+            or (now - self.pending_since).total_seconds() >= self.batch_seconds
+        )
+
+    def _send(self, alerts):
+        """
+        Отправка во все приемники; приемник получает и уведомления, которые
+        не принял раньше. Возвращает номера приемников, не принявших пачку.
+        Если пачку не принял ни один приемник, очереди повтора не меняются.
+        """
+        failed = []
+        for index, sink in enumerate(self.sinks):
+            batch = self.undelivered.get(index, []) + alerts
+            if not batch:
+                continue
+            try:
+                sink.send(batch)
+            except Exception as error:
+                logger.error(
+                    f"Уведомления не отправлены ({type(sink).__name__}): {error}"
+                )
+                failed.append(index)
+            else:
+                self.undelivered.pop(index, None)
+        if alerts and len(failed) < len(self.sinks):
+            for index in failed:
+                queue = self.undelivered.get(index, []) + alerts
+                if len(queue) > ALERT_RETRY_MAX:
+                    logger.error(
+                        f"Очередь повтора {type(self.sinks[index]).__name__} "
+                        f"переполнена: пропущено уведомлений - "
+                        f"{len(queue) - ALERT_RETRY_MAX}"
+                    )
+                    queue = queue[-ALERT_RETRY_MAX:]
+                self.undelivered[index] = queue
+        self.retry_at = datetime.now() + self.retry if failed else None
+        return failed
+
+    def flush(self, db: Session):
+        """
+        Отправка накопленной пачки во все приемники и запись в alert_log.
+        Пачка, которую не принял ни один приемник, остается в pending.
+        """
+        if not self.pending:
+            if self.undelivered:
+                self._send([])
+            return 0
+        rows = list(self.pending.values())
+        names = {
+            (equipment_id, spare_part_id): (vin, model_name, part_name)
+            for equipment_id, spare_part_id, vin, model_name, part_name in db.execute(
+                select(
+                    Equipment.id,
+                    SparePart.id,
+                    Equipment.vin,
+                    EquipmentModel.name,
+                    SparePart.name,
+                )
+                .join(EquipmentModel, EquipmentModel.id == Equipment.model_id)
+                .join(SparePart, SparePart.equipment_model_id == Equipment.model_id)
+                .where(
+                    tuple_(Equipment.id, SparePart.id).in_(
+                        list({(row[1], row[2]) for row in rows})
+                    )
+                )
+            )
+        }
+        alerts = []
+        for event_date, equipment_id, spare_part_id, threshold, last in rows:
+            vin, model_name, part_name = names.get(
+                (equipment_id, spare_part_id), (None, None, None)
+            )
+            alerts.append(
+                {
+                    "threshold": threshold,
+                    "event_date": pd.Timestamp(event_date).to_pydatetime(),
+                    "vin": vin,
+                    "equipment_model": model_name,
+                    "spare_part_name": part_name,
+                    "last_replacement": last,
+                }
+            )
+        if self.sinks and len(self._send(alerts)) == len(self.sinks):
+            return 0
+        sent_at = datetime.now()
+        db.add_all(
+            AlertLog(
+                equipment_id=equipment_id,
+                spare_part_id=spare_part_id,
+                threshold=threshold,
+                last_replacement=last,
+                event_date=event_date,
+                sent_at=sent_at,
+            )
+            for event_date, equipment_id, spare_part_id, threshold, last in rows
+        )
+        db.commit()
+        self.pending, self.pending_since = {}, None
+        return len(alerts)
+
+    def next_wakeup(self, now=None):
+        """Сколько секунд спать: до ближайшего события, отправки пачки или опроса"""
+        now = datetime.now() if now is None else now
+        wait = ALERT_POLL_SECONDS
+        if self.heap:
+            wait = min(wait, (self.heap[0][0] - now).total_seconds())
+        if self.retry_at is not None:
+            wait = min(wait, (self.retry_at - now).total_seconds())
+        elif self.pending_since is not None:
+            wait = min(
+                wait,
+                self.batch_seconds - (now - self.pending_since).total_seconds(),
+            )
+        return max(wait, 0)
+
+    def run_once(self):
+        """Одна проверка: наступившие события - сразу одной пачкой"""
+        db = SessionLocal()
+        try:
+            self.load(db)
+            self.collect_due(db)
+            return self.flush(db)
+        finally:
+            db.close()
+            self._report_undelivered()
+
+    def run(self):
+        db = SessionLocal()
+        try:
+            self.load(db)
+            loaded_at = time.monotonic()
+            while True:
+                if self.changes is not None:
+                    events, overflowed = self.changes.drain()
+                    replacement_ids = [
+                        event.id
+                        for event in events
+                        if event.table == "replacement_records"
+                    ]
+                    if overflowed:
+                        loaded_at = 0.0
+                    elif replacement_ids or any(
+                        event.table in ("equipment_models", "equipment", "spare_parts")
+                        for event in events
+                    ):
+                        # Правка справочников отмечает позиции к пересчету (crud.py)
+                        self.apply_changes(db, replacement_ids)
+                if time.monotonic() - loaded_at >= ALERT_RESYNC_MINUTES * 60:
+                    self.load(db)
+                    loaded_at = time.monotonic()
+                self.collect_due(db)
+                if self.flush_due():
+                    self.flush(db)
+                time.sleep(self.next_wakeup())
+        finally:
+            self.flush(db)
+            db.close()
+            self._report_undelivered()
+
+    def _report_undelivered(self):
+        """При завершении: что не удалось отправить (в alert_log уже записано)"""
+        for index, queue in self.undelivered.items():
+            logger.error(
+                f"Не отправлено в {type(self.sinks[index]).__name__} "
+                f"уведомлений: {len(queue)}"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Уведомления о переходе запчастей в желтую/красную зону"
+    )
+    parser.add_argument(
+        "--sinks",
+        default=ALERT_SINKS,
+        help="Приемники через запятую: log, file:<путь>, webhook:<url>, email:<адрес>",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Отправить наступившие события и завершить работу (для cron)",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not USE_DATABASE:
+        parser.error("Уведомления требуют базу данных (USE_DATABASE=true)")
+
+    engine = AlertEngine(create_sinks(args.sinks))
+    if args.once:
+        print(f"Отправлено уведомлений: {engine.run_once()}")
+        return
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
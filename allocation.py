@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from utils import get_next_procurement_dates
+
+# Распределение общего складского остатка между моделями оборудования.
+# Одна и та же запчасть (например, "Шина") числится в справочнике отдельно для
+# каждой модели, но на складе это общий запас. Запас делится между строками
+# потребности в порядке приоритета: зона износа (красная -> желтая -> зеленая),
+# затем крайний срок закупки.
+
+ZONE_PRIORITY = {"red": 0, "yellow": 1, "green": 2}
+
+
+def _nearest_window(today):
+    """Ближайшая дата закупки (10-е или 25-е число), начиная с today"""
+    if today.day <= 10:
+        return today.replace(day=10)
+    if today.day <= 25:
+        return today.replace(day=25)
+    return get_next_procurement_dates(today)[0]
+
+
+def _first_windows(deadlines, today):
+    """
+    Первая дата закупки для каждой строки: 10-е число месяца, следующего за
+    крайним сроком (как в get_next_procurement_dates). Если срок прошел или
+    неизвестен - ближайшая дата закупки.
+    """
+    deadlines = pd.to_datetime(deadlines)
+    next_month = (deadlines.dt.to_period("M") + 1).dt.to_timestamp()
+    windows = next_month + pd.Timedelta(days=9)
+    overdue = deadlines.isna() | (deadlines < today)
+    return windows.where(~overdue, _nearest_window(today))
+
+
+def allocate_shared_stock(procurement_data, as_of=None):
+    """
+    Распределение общего запаса по строкам потребности.
+    procurement_data - результат calculate_total_parts_needed (или его часть).
+    Возвращает:
+      lines   - строки потребности с выделенным количеством и дефицитом;
+      windows - дефицит по запчасти и дате закупки.
+    """
+    line_columns = [
+        "equipment_name",
+        "part_name",
+        "wear_level",
+        "procurement_deadline",
+        "total_needed",
+        "pool_stock",
+        "allocated",
+        "shortfall",
+        "purchase_window",
+    ]
+    window_columns = ["purchase_window", "part_name", "shortfall", "lines"]
+    if procurement_data.empty:
+        return (
+            pd.DataFrame(columns=line_columns),
+            pd.DataFrame(columns=window_columns),
+        )
+
+    today = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+    today = today.normalize()
+
+    lines = procurement_data.copy()
+    # Общий запас по физической запчасти - сумма остатков по всем моделям
+    lines["pool_stock"] = lines.groupby("part_name")["qty_in_stock"].transform("sum")
+    lines["zone_priority"] = lines["wear_level"].map(ZONE_PRIORITY).fillna(0)
+    # Строки без даты (замен не было) - самые срочные внутри своей зоны
+    lines["deadline_key"] = pd.to_datetime(lines["procurement_deadline"]).fillna(
+        pd.Timestamp.min
+    )
+
+    # Приоритетная очередь внутри каждой запчасти: сортировка по
+    # (запчасть, зона, срок) и накопленная сумма потребности. Строка получает
+    # остаток запаса после всех более приоритетных строк той же запчасти.
+    lines = lines.sort_values(
+        ["part_name", "zone_priority", "deadline_key", "equipment_name"],
+        kind="stable",
+    )
+    demand = lines["total_needed"].to_numpy()
+    demand_before = (
+        lines.groupby("part_name")["total_needed"].cumsum().to_numpy() - demand
+    )
+    lines["allocated"] = np.clip(
+        lines["pool_stock"].to_numpy() - demand_before, 0, demand
+    )
+    lines["shortfall"] = demand - lines["allocated"]
+
+    # Окно закупки считается только для строк с дефицитом
+    short = lines["shortfall"] > 0
+    lines["purchase_window"] = _first_windows(
+        lines["procurement_deadline"], today
+    ).where(short)
+
+    windows = (
+        lines[short]
+        .groupby(["purchase_window", "part_name"])
+        .agg(shortfall=("shortfall", "sum"), lines=("shortfall", "size"))
+        .reset_index()
+        .sort_values(["purchase_window", "part_name"])
+    )
+
+    lines = lines.sort_values(
+        ["zone_priority", "deadline_key", "part_name", "equipment_name"],
+        kind="stable",
+    )
+    return lines[line_columns].reset_index(drop=True), windows[
+        window_columns
+    ].reset_index(drop=True)
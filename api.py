@@ -0,0 +1,406 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+from logly import logger
+
+from crud import (
+    count_replacement_history,
+    get_data_version,
+    get_equipment_model_by_name,
+    get_replacement_history_page,
+)
+from database import ReadSessionLocal, USE_DATABASE, change_bus
+from export import EXPORT_FORMATS, export_history
+from utils import configure_logging, get_replacement_type_display
+from wear_engine import iter_fleet_results
+
+# HTTP API для смежных систем (склад, закупки): данные страниц
+# "Анализ износа" и "План закупок" и история замен в формате JSON.
+
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8502"))
+# Как часто (сек.) проверять версию данных в БД
+API_VERSION_TTL = float(os.getenv("API_VERSION_TTL", "2"))
+# Максимальный возраст закэшированного ответа (сек.), даже если версия не менялась
+API_CACHE_TTL = float(os.getenv("API_CACHE_TTL", "300"))
+API_CACHE_SIZE = int(os.getenv("API_CACHE_SIZE", "512"))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Ответы меньше этого размера не сжимаем
+GZIP_MIN_BYTES = 1024
+# Размер блока при передаче файла выгрузки
+EXPORT_BLOCK_BYTES = 64 * 1024
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class CachedResponse:
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.gzipped = (
+            gzip.compress(body, compresslevel=5)
+            if len(body) >= GZIP_MIN_BYTES
+            else None
+        )
+        self.created_at = time.monotonic()
+
+
+class ResponseCache:
+    """LRU-кэш готовых (в т.ч. сжатых) ответов с ключом по версии данных"""
+
+    def __init__(self, max_size=API_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.created_at > API_CACHE_TTL:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+class DataStore:
+    """
+    Версия данных и рассчитанные по ней таблицы износа и плана закупок.
+    Версия - ревизии таблиц (get_data_version), перечитывается из БД не чаще
+    раза в API_VERSION_TTL секунд или сразу после события шины изменений
+    (change_bus.py).
+    Расчет по парку выполняется один раз на версию - пачками моделей по
+    последним заменам (iter_fleet_results, как batch.py), без чтения всей
+    истории замен.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fleet_lock = threading.Lock()
+        self.version = None
+        self.checked_at = 0.0
+        self.changes = change_bus.subscribe() if change_bus is not None else None
+        self.fleet_version = None
+        self.fleet = None
+
+    def current_version(self):
+        with self.lock:
+            if self.changes is not None:
+                events, overflowed = self.changes.drain()
+                if events or overflowed:
+                    self.checked_at = 0.0
+            if time.monotonic() - self.checked_at > API_VERSION_TTL:
+                db = ReadSessionLocal()
+                try:
+                    # Износ зависит от текущей даты, поэтому она входит в версию
+                    self.version = f"{get_data_version(db)}-{date.today().isoformat()}"
+                finally:
+                    db.close()
+                self.checked_at = time.monotonic()
+            return self.version
+
+    def fleet_frames(self, version):
+        with self.fleet_lock:
+            if self.fleet_version != version:
+                db = ReadSessionLocal()
+                try:
+                    results = list(iter_fleet_results(db))
+                finally:
+                    db.close()
+                self.fleet = tuple(
+                    (pd.concat(frames, ignore_index=True) if frames else pd.DataFrame())
+                    for frames in (
+                        [wear_df for wear_df, _ in results if not wear_df.empty],
+                        [plan_df for _, plan_df in results if not plan_df.empty],
+                    )
+                )
+                self.fleet_version = version
+            return self.fleet
+
+
+store = DataStore()
+cache = ResponseCache()
+
+
+def _paginate(params):
+    try:
+        page = int(params.get("page", "1"))
+        page_size = int(params.get("page_size", str(DEFAULT_PAGE_SIZE)))
+    except ValueError:
+        raise ApiError(400, "page и page_size должны быть целыми числами")
+    if page < 1 or page_size < 1:
+        raise ApiError(400, "page и page_size должны быть положительными")
+    return page, min(page_size, MAX_PAGE_SIZE)
+
+
+def _model_id(db, params):
+    """id модели из параметра model (None - без фильтра); неизвестная модель - 404"""
+    if "model" not in params:
+        return None
+    model = get_equipment_model_by_name(db, params["model"])
+    if model is None:
+        raise ApiError(404, f"Модель оборудования '{params['model']}' не найдена")
+    return model.id
+
+
+def _frame_page(frame, params, version):
+    page, page_size = _paginate(params)
+    model = params.get("model")
+    if model is not None:
+        db = ReadSessionLocal()
+        try:
+            _model_id(db, params)
+        finally:
+            db.close()
+    if model is not None and not frame.empty:
+        column = "equipment_name" if "equipment_name" in frame.columns else "equipment"
+        frame = frame[frame[column] == model]
+    items = frame.iloc[(page - 1) * page_size : page * page_size]
+    return {
+        "version": version,
+        "page": page,
+        "page_size": page_size,
+        "total": len(frame),
+        "items": json.loads(
+            items.to_json(orient="records", date_format="iso", force_ascii=False)
+        ),
+    }
+
+
+def wear_endpoint(params, version):
+    wear_df, _ = store.fleet_frames(version)
+    return _frame_page(wear_df, params, version)
+
+
+def procurement_endpoint(params, version):
+    _, plan_df = store.fleet_frames(version)
+    return _frame_page(plan_df, params, version)
+
+
+def replacements_endpoint(params, version):
+    page, page_size = _paginate(params)
+    db = ReadSessionLocal()
+    try:
+        model_id = _model_id(db, params)
+        vin = params.get("vin")
+        total = count_replacement_history(db, model_id, vin)
+        records = get_replacement_history_page(
+            db, model_id, vin, (page - 1) * page_size, page_size
+        )
+        items = [
+            {
+                "id": rr.id,
+                "equipment_vin": rr.equipment.vin,
+                "equipment_model": rr.equipment.model.name,
+                "spare_part_name": rr.spare_part.name,
+                "workshop_name": rr.workshop.name,
+                "replacement_date": rr.replacement_date.isoformat(),
+                "replacement_type": rr.replacement_type,
+                "replacement_type_display": get_replacement_type_display(
+                    rr.replacement_type
+                ),
+                "notes": rr.notes,
+            }
+            for rr in records
+        ]
+    finally:
+        db.close()
+    return {
+        "version": version,
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "items": items,
+    }
+
+
+def _export_filters(params):
+    filters = {key: params.get(key) for key in ("model", "vin", "workshop")}
+    for key, param in (("date_from", "from"), ("date_to", "to")):
+        try:
+            filters[key] = (
+                datetime.fromisoformat(params[param]).date()
+                if param in params
+                else None
+            )
+        except ValueError:
+            raise ApiError(400, f"{param} должен быть датой в формате ГГГГ-ММ-ДД")
+    return filters
+
+
+def version_endpoint(params, version):
+    return {"version": version}
+
+
+ROUTES = {
+    "/api/version": version_endpoint,
+    "/api/wear": wear_endpoint,
+    "/api/procurement": procurement_endpoint,
+    "/api/replacements": replacements_endpoint,
+}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path.rstrip("/") == "/api/export":
+            self._send_export(params)
+            return
+        endpoint = ROUTES.get(url.path.rstrip("/"))
+        if endpoint is None:
+            self._send_error(404, "Неизвестный адрес")
+            return
+
+        try:
+            version = store.current_version()
+            key = (url.path.rstrip("/"), tuple(sorted(params.items())), version)
+            response = cache.get(key)
+            if response is None:
+                payload = endpoint(params, version)
+                response = CachedResponse(
+                    json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                )
+                cache.put(key, response)
+        except ApiError as e:
+            self._send_error(e.status, e.message)
+            return
+        except Exception as e:
+            logger.error(f"Ошибка API {self.path}: {e}")
+            self._send_error(500, "Внутренняя ошибка сервера")
+            return
+
+        if self.headers.get("If-None-Match") == response.etag:
+            self.send_response(304)
+            self.send_header("ETag", response.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = response.body
+        use_gzip = response.gzipped is not None and "gzip" in self.headers.get(
+            "Accept-Encoding", ""
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("ETag", response.etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            body = response.gzipped
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_export(self, params):
+        """
+        Выгрузка истории замен: файл пишется пачками во временный файл
+        и передается блоками, ответ не кэшируется
+        """
+        fmt = params.get("format", "csv")
+        if fmt not in EXPORT_FORMATS:
+            self._send_error(400, f"format: одно из {', '.join(EXPORT_FORMATS)}")
+            return
+        content_type, extension = EXPORT_FORMATS[fmt]
+        fd, path = tempfile.mkstemp(suffix=extension)
+        os.close(fd)
+        try:
+            try:
+                db = ReadSessionLocal()
+                try:
+                    export_history(db, path, fmt, **_export_filters(params))
+                finally:
+                    db.close()
+            except ApiError as e:
+                self._send_error(e.status, e.message)
+                return
+            except Exception as e:
+                logger.error(f"Ошибка выгрузки {self.path}: {e}")
+                self._send_error(500, "Внутренняя ошибка сервера")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header(
+                "Content-Disposition",
+                f'attachment; filename="replacements{extension}"',
+            )
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.end_headers()
+            with open(path, "rb") as file:
+                while block := file.read(EXPORT_BLOCK_BYTES):
+                    self.wfile.write(block)
+        finally:
+            os.remove(path)
+
+    def _send_error(self, status, message):
+        body = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Журнал каждого запроса при сотнях запросов в секунду не нужен
+        pass
+
+
+def create_server(host=API_HOST, port=API_PORT):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="HTTP JSON API для данных износа и плана закупок"
+    )
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not USE_DATABASE:
+        parser.error("API требует базу данных (USE_DATABASE=true)")
+
+    server = create_server(args.host, args.port)
+    logger.info(f"API запущен на http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
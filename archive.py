@@ -0,0 +1,37 @@
+import argparse
+
+from database import USE_DATABASE, change_bus, engine
+from partitioning import archive_history
+from utils import configure_logging
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Архивирование старой истории замен в Parquet"
+    )
+    parser.add_argument(
+        "--keep-years",
+        type=int,
+        required=True,
+        help="Сколько последних лет истории оставить в БД (кроме текущего)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="archive",
+        help="Каталог для архивных Parquet-файлов",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not USE_DATABASE:
+        parser.error("Архивирование требует базу данных (USE_DATABASE=true)")
+
+    archived = archive_history(engine, args.keep_years, args.output_dir, bus=change_bus)
+    if not archived:
+        print("Нет данных для архивирования")
+    for year, rows in archived.items():
+        print(f"{year}: {rows} строк перенесено в архив")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import argparse
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from database import ReadSessionLocal, USE_DATABASE, engine
+from utils import configure_logging
+from wear_engine import iter_fleet_results
+
+# Таблицы для результатов ночного расчета
+WEAR_TABLE = "batch_wear_levels"
+PLAN_TABLE = "batch_procurement_plan"
+
+
+class ParquetSink:
+    """Запись результатов в Parquet-файлы по пачкам (row group на пачку)"""
+
+    def __init__(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        self.paths = {
+            "wear": os.path.join(output_dir, "wear_levels.parquet"),
+            "plan": os.path.join(output_dir, "procurement_plan.parquet"),
+        }
+        self.writers = {}
+
+    def write(self, kind, frame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if frame.empty:
+            return
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        writer = self.writers.get(kind)
+        if writer is None:
+            writer = pq.ParquetWriter(self.paths[kind], table.schema)
+            self.writers[kind] = writer
+        writer.write_table(table.cast(writer.schema))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+class TableSink:
+    """Запись результатов в таблицы БД (таблицы пересоздаются при каждом запуске)"""
+
+    def __init__(self):
+        self.started = set()
+
+    def write(self, kind, frame):
+        if frame.empty:
+            return
+        table = WEAR_TABLE if kind == "wear" else PLAN_TABLE
+        frame.to_sql(
+            table,
+            engine,
+            if_exists="append" if kind in self.started else "replace",
+            index=False,
+        )
+        self.started.add(kind)
+
+    def close(self):
+        pass
+
+
+def run_batch(
+    model_names=None,
+    output="parquet",
+    output_dir="batch_output",
+    batch_size=20,
+    workers=1,
+    as_of=None,
+):
+    """
+    Расчет износа и календаря закупок по всему парку (или по списку моделей)
+    на дату as_of (по умолчанию - момент запуска) с записью результатов
+    в Parquet или таблицы БД.
+    Возвращает количество записанных строк: (износ, план закупок).
+    """
+    sink = ParquetSink(output_dir) if output == "parquet" else TableSink()
+    run_at = datetime.now()
+    as_of = run_at if as_of is None else as_of
+    wear_rows = plan_rows = 0
+    db = ReadSessionLocal()
+    try:
+        for wear_df, plan_df in iter_fleet_results(
+            db, model_names, batch_size, workers, as_of
+        ):
+            wear_df["run_at"] = run_at
+            wear_df["as_of"] = as_of
+            plan_df["run_at"] = run_at
+            plan_df["as_of"] = as_of
+            # Даты приводим к единому типу, чтобы схема совпадала во всех пачках
+            wear_df["procurement_deadline"] = pd.to_datetime(
+                wear_df["procurement_deadline"]
+            )
+            sink.write("wear", wear_df)
+            sink.write("plan", plan_df)
+            wear_rows += len(wear_df)
+            plan_rows += len(plan_df)
+    finally:
+        sink.close()
+        db.close()
+    return wear_rows, plan_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Пакетный расчет износа и плана закупок без веб-интерфейса"
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        help="Модели оборудования для расчета (по умолчанию - весь парк)",
+    )
+    parser.add_argument(
+        "--output",
+        choices=["parquet", "table"],
+        default="parquet",
+        help="Куда записать результаты: Parquet-файлы или таблицы БД",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="batch_output",
+        help="Каталог для Parquet-файлов",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=20,
+        help="Количество моделей оборудования, обрабатываемых за один проход",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Количество процессов для расчета износа (пачки моделей параллельно)",
+    )
+    parser.add_argument(
+        "--as-of",
+        type=datetime.fromisoformat,
+        help="Дата расчета в формате ГГГГ-ММ-ДД (по умолчанию - момент запуска)",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not USE_DATABASE:
+        parser.error("Пакетный расчет требует базу данных (USE_DATABASE=true)")
+
+    wear_rows, plan_rows = run_batch(
+        args.models,
+        args.output,
+        args.output_dir,
+        args.batch_size,
+        args.workers,
+        args.as_of,
+    )
+    print(f"Износ: {wear_rows} строк, план закупок: {plan_rows} строк")
+
+
+if __name__ == "__main__":
+    main()
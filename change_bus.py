@@ -0,0 +1,277 @@
+import itertools
+import json
+import os
+import select
+import threading
+import weakref
+from collections import deque, namedtuple
+
+from logly import logger
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import ONETOMANY, Session
+
+# Шина уведомлений об изменениях для точечной инвалидации кэшей.
+# После фиксации транзакции ORM-сессии публикуется событие на каждую
+# измененную запись справочников и истории замен: (таблица, id, операция,
+# ревизия). PostgreSQL - LISTEN/NOTIFY (события видят все процессы),
+# иначе - шина внутри процесса (для локальной проверки на SQLite).
+# События собираются по объектам сессии: при удалении записи события
+# "update" получают и зависимые строки, у которых ORM обнуляет внешний
+# ключ. Core-запросы update()/delete() и сырой SQL событий не публикуют -
+# такой код сам увеличивает ревизию таблицы в data_revisions
+# (см. partitioning._drop_year, database.normalize_vins).
+
+# Канал LISTEN/NOTIFY
+CHANGE_CHANNEL = os.getenv("CHANGE_CHANNEL", "gpmech_changes")
+# Сколько необработанных событий хранит подписчик; при переполнении
+# подписчику нужна полная перезагрузка данных
+CHANGE_BACKLOG = int(os.getenv("CHANGE_BACKLOG", "10000"))
+# Ревизии таблиц CHANGE_TABLES (версия данных для кэшей): увеличиваются
+# в той же транзакции, что и изменение, поэтому новая ревизия видна
+# одновременно с данными во всех процессах и при любом диалекте
+REVISION_TABLE = "data_revisions"
+# Таблицы, об изменениях которых публикуются события
+CHANGE_TABLES = (
+    "equipment_models",
+    "equipment",
+    "workshops",
+    "spare_parts",
+    "replacement_records",
+)
+# Событий в одном уведомлении pg_notify (полезная нагрузка NOTIFY
+# ограничена 8000 байт)
+CHANGE_NOTIFY_BATCH = 100
+
+ChangeEvent = namedtuple("ChangeEvent", ["table", "id", "op", "revision"])
+
+
+class Subscription:
+    """Очередь событий одного подписчика (сессии Streamlit, общего кэша)"""
+
+    def __init__(self, backlog=CHANGE_BACKLOG):
+        self._events = deque()
+        self._backlog = backlog
+        self._overflowed = False
+        self._lock = threading.Lock()
+
+    def _put(self, events):
+        with self._lock:
+            if self._overflowed:
+                return
+            if len(self._events) + len(events) > self._backlog:
+                self._events.clear()
+                self._overflowed = True
+            else:
+                self._events.extend(events)
+
+    def _lose(self):
+        """События потеряны (например, при переподключении слушателя)"""
+        with self._lock:
+            self._events.clear()
+            self._overflowed = True
+
+    def drain(self):
+        """
+        Накопленные события и признак переполнения (события потеряны,
+        нужна полная перезагрузка)
+        """
+        with self._lock:
+            events, overflowed = list(self._events), self._overflowed
+            self._events.clear()
+            self._overflowed = False
+        return events, overflowed
+
+
+class ChangeBus:
+    """Шина внутри процесса"""
+
+    def __init__(self):
+        self._subscribers = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._revision = itertools.count(1)
+
+    def subscribe(self, backlog=CHANGE_BACKLOG):
+        subscription = Subscription(backlog)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def _deliver(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription._put(events)
+
+    def publish(self, changes):
+        """Публикация изменений [(таблица, id, операция), ...]"""
+        with self._lock:
+            events = [
+                ChangeEvent(table, row_id, op, next(self._revision))
+                for table, row_id, op in changes
+            ]
+        self._deliver(events)
+
+
+class PostgresChangeBus(ChangeBus):
+    """
+    Шина на LISTEN/NOTIFY: события публикуются через pg_notify,
+    поток-слушатель на отдельном соединении раздает их подписчикам процесса.
+    Ревизия - общая для всех процессов последовательность в БД.
+    """
+
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+        self._listener = None
+        self._sequence_ready = False
+
+    def subscribe(self, backlog=CHANGE_BACKLOG):
+        # Слушатель запускается только в процессах, где есть подписчики
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name="change-listener", daemon=True
+                )
+                self._listener.start()
+        return super().subscribe(backlog)
+
+    def publish(self, changes):
+        with self.engine.begin() as conn:
+            if not self._sequence_ready:
+                conn.execute(text("CREATE SEQUENCE IF NOT EXISTS change_revision_seq"))
+                self._sequence_ready = True
+            # Одно уведомление на пачку: массив [таблица, id, операция, ревизия]
+            for start in range(0, len(changes), CHANGE_NOTIFY_BATCH):
+                tables, ids, ops = zip(*changes[start : start + CHANGE_NOTIFY_BATCH])
+                conn.execute(
+                    text(
+                        "SELECT pg_notify(:channel, (SELECT json_agg("
+                        "json_build_array(c.tbl, c.id, c.op, "
+                        "nextval('change_revision_seq')) ORDER BY c.n)::text "
+                        "FROM unnest(CAST(:tables AS text[]), "
+                        "CAST(:ids AS integer[]), CAST(:ops AS text[])) "
+                        "WITH ORDINALITY AS c(tbl, id, op, n)))"
+                    ),
+                    {
+                        "channel": CHANGE_CHANNEL,
+                        "tables": list(tables),
+                        "ids": list(ids),
+                        "ops": list(ops),
+                    },
+                )
+
+    def _listen(self):
+        while True:
+            try:
+                connection = self.engine.raw_connection()
+                try:
+                    dbapi_connection = connection.dbapi_connection
+                    dbapi_connection.autocommit = True
+                    with dbapi_connection.cursor() as cursor:
+                        cursor.execute(f'LISTEN "{CHANGE_CHANNEL}"')
+                    while True:
+                        if not select.select([dbapi_connection], [], [], 60)[0]:
+                            continue
+                        dbapi_connection.poll()
+                        events = []
+                        while dbapi_connection.notifies:
+                            payload = dbapi_connection.notifies.pop(0).payload
+                            events.extend(
+                                ChangeEvent(*item) for item in json.loads(payload)
+                            )
+                        if events:
+                            self._deliver(events)
+                finally:
+                    connection.invalidate()
+            except Exception as error:
+                # События за время переподключения теряются - подписчики
+                # получают признак переполнения и перезагружают данные
+                logger.warning(f"Шина изменений: переподключение ({error})")
+                with self._lock:
+                    subscribers = list(self._subscribers)
+                for subscription in subscribers:
+                    subscription._lose()
+                threading.Event().wait(5)
+
+
+def _orphaned_rows(session, instance):
+    """
+    Строки CHANGE_TABLES, у которых ORM при удалении instance обнулит
+    внешний ключ (связи один-ко-многим без каскадного удаления)
+    """
+    for relationship in inspect(instance).mapper.relationships:
+        table = relationship.mapper.local_table.name
+        if relationship.direction is ONETOMANY and table in CHANGE_TABLES:
+            for child in getattr(instance, relationship.key):
+                if child not in session.deleted:
+                    yield table, child
+
+
+def _collect_changes(session, flush_context, instances):
+    changes = session.info.setdefault("changes", [])
+    for op, objects in (
+        ("insert", session.new),
+        ("update", session.dirty),
+        ("delete", session.deleted),
+    ):
+        for instance in objects:
+            table = getattr(instance, "__tablename__", None)
+            if table in CHANGE_TABLES and (
+                op != "update" or session.is_modified(instance)
+            ):
+                changes.append((table, instance, op))
+                if op == "delete":
+                    changes.extend(
+                        (child_table, child, "update")
+                        for child_table, child in _orphaned_rows(session, instance)
+                    )
+
+
+def _bump_revisions(session, flush_context):
+    # Строки ревизий блокируются до конца транзакции - в одном порядке
+    for table in sorted({table for table, _, _ in session.info.get("changes", [])}):
+        session.connection().execute(
+            text(
+                f"UPDATE {REVISION_TABLE} SET revision = revision + 1 "
+                "WHERE table_name = :table"
+            ),
+            {"table": table},
+        )
+
+
+def _resolve_ids(session, flush_context):
+    # id новых записей известны только после flush
+    session.info.setdefault("pending_changes", []).extend(
+        (table, instance.id, op)
+        for table, instance, op in session.info.pop("changes", [])
+    )
+
+
+def _discard_changes(session, previous_transaction):
+    session.info.pop("changes", None)
+    session.info.pop("pending_changes", None)
+
+
+def install_change_publishing(bus):
+    """Публикация изменений всех ORM-сессий после фиксации транзакции"""
+
+    def after_commit(session):
+        changes = session.info.pop("pending_changes", [])
+        if changes:
+            try:
+                bus.publish(list(dict.fromkeys(changes)))
+            except Exception as error:
+                logger.warning(f"Изменения не опубликованы: {error}")
+
+    event.listen(Session, "before_flush", _collect_changes)
+    event.listen(Session, "after_flush", _bump_revisions)
+    event.listen(Session, "after_flush", _resolve_ids)
+    event.listen(Session, "after_commit", after_commit)
+    event.listen(Session, "after_soft_rollback", _discard_changes)
+
+
+def create_change_bus(engine):
+    """Шина для диалекта БД: LISTEN/NOTIFY для PostgreSQL, иначе внутри процесса"""
+    if engine.dialect.name == "postgresql":
+        return PostgresChangeBus(engine)
+    return ChangeBus()
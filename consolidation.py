@@ -0,0 +1,145 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Сводные заказы по окнам закупки (10-е и 25-е числа).
+# Строка потребности может быть закуплена в любое окно не позже крайнего
+# срока и не раньше чем за PROCUREMENT_MAX_EARLY_DAYS дней до него. Для
+# каждой физической запчасти (по названию, как в allocation.py) это задача о
+# покрытии отрезков точками: строки по возрастанию последнего допустимого
+# окна, новый заказ - в последнее окно строки, которую не покрывает текущий
+# заказ. Так число заказов минимально, а каждая строка затем попадает в самый
+# поздний из выбранных заказов до своего срока (меньше хранение на складе).
+
+# Насколько раньше крайнего срока допускается покупка (дн.)
+PROCUREMENT_MAX_EARLY_DAYS = int(os.getenv("PROCUREMENT_MAX_EARLY_DAYS", "60"))
+# Дни месяца, в которые проводятся закупки
+PROCUREMENT_DAYS = (10, 25)
+
+
+def procurement_windows(start, end) -> pd.DatetimeIndex:
+    """Все даты закупки (10-е и 25-е числа) с start по end включительно"""
+    start = pd.Timestamp(start).normalize()
+    months = pd.date_range(
+        start.to_period("M").to_timestamp(), pd.Timestamp(end), freq="MS"
+    )
+    windows = pd.DatetimeIndex(
+        np.sort(
+            np.concatenate(
+                [
+                    (months + pd.Timedelta(days=day - 1)).to_numpy()
+                    for day in PROCUREMENT_DAYS
+                ]
+            )
+        )
+    )
+    return windows[(windows >= start) & (windows <= pd.Timestamp(end))]
+
+
+def consolidate_orders(
+    lines,
+    as_of=None,
+    max_early_days=PROCUREMENT_MAX_EARLY_DAYS,
+    quantity="shortfall",
+):
+    """
+    Распределение строк потребности по окнам закупки и объединение строк
+    одной запчасти в заказы.
+    lines - строки с part_name, equipment_name, procurement_deadline и
+    количеством quantity (например, строки allocate_shared_stock).
+    Возвращает:
+      lines  - строки с окном заказа (order_window), запасом до срока
+               (days_early) и признаком просрочки (overdue: ни одного окна
+               до крайнего срока не осталось - ближайшее окно);
+      orders - заказы: окно, запчасть, количество, число строк,
+               ближайший крайний срок.
+    """
+    line_columns = [
+        "equipment_name",
+        "part_name",
+        "procurement_deadline",
+        quantity,
+        "order_window",
+        "days_early",
+        "overdue",
+    ]
+    order_columns = [
+        "order_window",
+        "part_name",
+        quantity,
+        "lines",
+        "earliest_deadline",
+        "overdue",
+    ]
+    lines = lines[lines[quantity] > 0].copy()
+    if lines.empty:
+        return (
+            pd.DataFrame(columns=line_columns),
+            pd.DataFrame(columns=order_columns),
+        )
+
+    today = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+    today = today.normalize()
+    # Строки без даты (замен не было) - самые срочные
+    deadlines = (
+        pd.to_datetime(lines["procurement_deadline"]).fillna(today).dt.normalize()
+    )
+    windows = procurement_windows(
+        today, max(deadlines.max(), today) + pd.Timedelta(days=31)
+    ).to_numpy()
+
+    # Допустимые окна строки - отрезок индексов [left, right]; срок прошел
+    # (раньше ближайшего окна) - только ближайшее окно
+    right = np.searchsorted(windows, deadlines.to_numpy(), side="right") - 1
+    overdue = right < 0
+    right = np.maximum(right, 0)
+    left = np.minimum(
+        np.searchsorted(
+            windows,
+            (deadlines - pd.Timedelta(days=max_early_days)).to_numpy(),
+            side="left",
+        ),
+        right,
+    )
+
+    # Покрытие отрезков точками отдельно для каждой запчасти
+    part_codes, _ = pd.factorize(lines["part_name"])
+    chosen = []
+    current_part, point = -1, -1
+    for i in np.lexsort((right, part_codes)):
+        if part_codes[i] != current_part:
+            current_part, point = part_codes[i], -1
+        if left[i] > point:
+            point = right[i]
+            chosen.append(part_codes[i] * len(windows) + point)
+
+    # Самый поздний выбранный заказ той же запчасти не позже right: он не
+    # раньше заказа, покрывшего строку, т.е. не раньше left
+    chosen = np.array(chosen)
+    line_keys = part_codes * len(windows) + right
+    order_keys = chosen[np.searchsorted(chosen, line_keys, side="right") - 1]
+    lines["order_window"] = windows[order_keys % len(windows)]
+    lines["days_early"] = (
+        (deadlines - lines["order_window"]).dt.days.clip(lower=0).to_numpy()
+    )
+    lines["overdue"] = overdue
+
+    orders = (
+        lines.assign(deadline=deadlines)
+        .groupby(["order_window", "part_name"])
+        .agg(
+            **{quantity: (quantity, "sum")},
+            lines=(quantity, "size"),
+            earliest_deadline=("deadline", "min"),
+            overdue=("overdue", "any"),
+        )
+        .reset_index()
+        .sort_values(["order_window", "part_name"])
+    )
+    lines = lines.sort_values(
+        ["order_window", "part_name", "procurement_deadline"], kind="stable"
+    )
+    return lines[line_columns].reset_index(drop=True), orders[
+        order_columns
+    ].reset_index(drop=True)
@@ -1,7 +1,20 @@
-from sqlalchemy.orm import Session
-from database import EquipmentModel, Equipment, Workshop, SparePart, ReplacementRecord
-from typing import List, Optional
-from datetime import datetime
+from sqlalchemy import exists, insert, select, text, tuple_
+from sqlalchemy.orm import Session, joinedload
+from database import (
+    EquipmentModel,
+    Equipment,
+    Workshop,
+    SparePart,
+    ReplacementRecord,
+    ServiceLifeDirtyEquipment,
+    WearEventDirtyPosition,
+    WearSnapshot,
+    ReportJob,
+    DataRevision,
+)
+from search_index import SEARCH_SOURCES, SEARCH_MAX_HITS, SEARCH_MIN_TRIGRAM
+from typing import List, Optional, Tuple
+from datetime import date, datetime
 
 
 # CRUD для EquipmentModel
@@ -45,6 +58,12 @@ def update_equipment_model(
 def delete_equipment_model(db: Session, model_id: int) -> bool:
     model = db.query(EquipmentModel).filter(EquipmentModel.id == model_id).first()
     if model:
+        _mark_wear_events_dirty_where(
+            db,
+            ReplacementRecord.equipment_id.in_(
+                select(Equipment.id).where(Equipment.model_id == model_id)
+            ),
+        )
         db.delete(model)
         db.commit()
         return True
@@ -52,8 +71,13 @@ def delete_equipment_model(db: Session, model_id: int) -> bool:
 
 
 # CRUD для Equipment (экземпляры)
+def normalize_vin(vin: str) -> str:
+    """VIN хранятся и ищутся в верхнем регистре, без пробелов по краям"""
+    return vin.strip().upper()
+
+
 def create_equipment(db: Session, model_id: int, vin: str) -> Equipment:
-    db_equipment = Equipment(model_id=model_id, vin=vin)
+    db_equipment = Equipment(model_id=model_id, vin=normalize_vin(vin))
     db.add(db_equipment)
     db.commit()
     db.refresh(db_equipment)
@@ -65,13 +89,32 @@ def get_equipment(db: Session, equipment_id: int) -> Optional[Equipment]:
 
 
 def get_equipment_by_vin(db: Session, vin: str) -> Optional[Equipment]:
-    return db.query(Equipment).filter(Equipment.vin == vin).first()
+    return db.query(Equipment).filter(Equipment.vin == normalize_vin(vin)).first()
 
 
 def get_equipment_by_model(db: Session, model_id: int) -> List[Equipment]:
     return db.query(Equipment).filter(Equipment.model_id == model_id).all()
 
 
+def find_vins_by_prefix(
+    db: Session, prefix: str, model_id: Optional[int] = None, limit: int = 20
+) -> List[str]:
+    """Первые limit VIN, начинающихся с prefix (LIKE 'prefix%' по индексу)"""
+    # VIN хранятся в верхнем регистре; спецсимволы LIKE экранируются
+    pattern = (
+        normalize_vin(prefix)
+        .replace("\\", "\\\\")
+        .replace("%", "\\%")
+        .replace("_", "\\_")
+    )
+    query = db.query(Equipment.vin).filter(
+        Equipment.vin.like(f"{pattern}%", escape="\\")
+    )
+    if model_id is not None:
+        query = query.filter(Equipment.model_id == model_id)
+    return [vin for (vin,) in query.order_by(Equipment.vin).limit(limit)]
+
+
 def get_all_equipment(db: Session) -> List[Equipment]:
     return db.query(Equipment).all()
 
@@ -79,6 +122,9 @@ def get_all_equipment(db: Session) -> List[Equipment]:
 def delete_equipment(db: Session, equipment_id: int) -> bool:
     equipment = db.query(Equipment).filter(Equipment.id == equipment_id).first()
     if equipment:
+        _mark_wear_events_dirty_where(
+            db, ReplacementRecord.equipment_id == equipment_id
+        )
         db.delete(equipment)
         db.commit()
         return True
@@ -94,8 +140,12 @@ def update_equipment(
     equipment = db.query(Equipment).filter(Equipment.id == equipment_id).first()
     if equipment:
         if vin is not None:
-            equipment.vin = vin
-        if model_id is not None:
+            equipment.vin = normalize_vin(vin)
+        if model_id is not None and model_id != equipment.model_id:
+            # Запчасти позиций зависят от модели VIN
+            _mark_wear_events_dirty_where(
+                db, ReplacementRecord.equipment_id == equipment_id
+            )
             equipment.model_id = model_id
         db.commit()
         db.refresh(equipment)
@@ -103,8 +153,10 @@ def update_equipment(
 
 
 # CRUD для Workshop
-def create_workshop(db: Session, name: str, address: str) -> Workshop:
-    db_workshop = Workshop(name=name, address=address)
+def create_workshop(
+    db: Session, name: str, address: str, daily_capacity: Optional[int] = None
+) -> Workshop:
+    db_workshop = Workshop(name=name, address=address, daily_capacity=daily_capacity)
     db.add(db_workshop)
     db.commit()
     db.refresh(db_workshop)
@@ -115,6 +167,23 @@ def get_all_workshops(db: Session) -> List[Workshop]:
     return db.query(Workshop).all()
 
 
+def update_workshop(
+    db: Session,
+    workshop_id: int,
+    address: Optional[str] = None,
+    daily_capacity: Optional[int] = None,
+) -> Optional[Workshop]:
+    workshop = db.query(Workshop).filter(Workshop.id == workshop_id).first()
+    if workshop:
+        if address is not None:
+            workshop.address = address
+        if daily_capacity is not None:
+            workshop.daily_capacity = daily_capacity
+        db.commit()
+        db.refresh(workshop)
+    return workshop
+
+
 # CRUD для SparePart
 def create_spare_part(
     db: Session,
@@ -153,7 +222,101 @@ def get_all_spare_parts(db: Session) -> List[SparePart]:
     return db.query(SparePart).all()
 
 
+def update_spare_part(
+    db: Session,
+    spare_part_id: int,
+    useful_life_months: Optional[int] = None,
+    qty_per_equipment: Optional[int] = None,
+    qty_in_stock: Optional[int] = None,
+    procurement_time_days: Optional[int] = None,
+) -> Optional[SparePart]:
+    spare_part = db.query(SparePart).filter(SparePart.id == spare_part_id).first()
+    if spare_part:
+        if (
+            useful_life_months is not None
+            and useful_life_months != spare_part.useful_life_months
+        ) or (
+            procurement_time_days is not None
+            and procurement_time_days != spare_part.procurement_time_days
+        ):
+            # Даты перехода порогов считаются по сроку службы и сроку закупки
+            _mark_wear_events_dirty_where(
+                db, ReplacementRecord.spare_part_id == spare_part_id
+            )
+        if useful_life_months is not None:
+            spare_part.useful_life_months = useful_life_months
+        if qty_per_equipment is not None:
+            spare_part.qty_per_equipment = qty_per_equipment
+        if qty_in_stock is not None:
+            spare_part.qty_in_stock = qty_in_stock
+        if procurement_time_days is not None:
+            spare_part.procurement_time_days = procurement_time_days
+        db.commit()
+        db.refresh(spare_part)
+    return spare_part
+
+
 # CRUD для ReplacementRecord
+def _mark_service_life_dirty(db: Session, equipment_id: Optional[int]) -> None:
+    """Отметка VIN для инкрементального пересчета фактического срока службы"""
+    if equipment_id is not None:
+        db.merge(ServiceLifeDirtyEquipment(equipment_id=equipment_id))
+
+
+def _mark_wear_events_dirty(db: Session, positions: List[tuple]) -> None:
+    """
+    Отметка позиций (VIN, запчасть) для пересчета дат перехода порогов
+    (одним запросом на пачку позиций)
+    """
+    positions = {
+        (equipment_id, spare_part_id)
+        for equipment_id, spare_part_id in positions
+        if equipment_id is not None and spare_part_id is not None
+    }
+    if not positions:
+        return
+    marked = set(
+        db.query(
+            WearEventDirtyPosition.equipment_id, WearEventDirtyPosition.spare_part_id
+        )
+        .filter(
+            tuple_(
+                WearEventDirtyPosition.equipment_id,
+                WearEventDirtyPosition.spare_part_id,
+            ).in_(positions)
+        )
+        .all()
+    )
+    db.add_all(
+        WearEventDirtyPosition(equipment_id=equipment_id, spare_part_id=spare_part_id)
+        for equipment_id, spare_part_id in positions - marked
+    )
+
+
+def _mark_wear_events_dirty_where(db: Session, condition) -> None:
+    """
+    Отметка для пересчета дат перехода порогов всех позиций с заменами,
+    подходящих под condition (одним INSERT ... SELECT, без выборки в Python)
+    """
+    marked = exists().where(
+        WearEventDirtyPosition.equipment_id == ReplacementRecord.equipment_id,
+        WearEventDirtyPosition.spare_part_id == ReplacementRecord.spare_part_id,
+    )
+    db.execute(
+        insert(WearEventDirtyPosition).from_select(
+            ["equipment_id", "spare_part_id"],
+            select(ReplacementRecord.equipment_id, ReplacementRecord.spare_part_id)
+            .where(
+                condition,
+                ReplacementRecord.equipment_id.is_not(None),
+                ReplacementRecord.spare_part_id.is_not(None),
+                ~marked,
+            )
+            .distinct(),
+        )
+    )
+
+
 def create_replacement_record(
     db: Session,
     equipment_id: int,
@@ -172,11 +335,83 @@ def create_replacement_record(
         notes=notes,
     )
     db.add(db_replacement)
+    _mark_service_life_dirty(db, equipment_id)
+    _mark_wear_events_dirty(db, [(equipment_id, spare_part_id)])
     db.commit()
     db.refresh(db_replacement)
     return db_replacement
 
 
+def create_replacement_records(db: Session, records: List[dict]) -> List[int]:
+    """
+    Пакетная запись замен одной транзакцией (словари с полями ReplacementRecord).
+    Возвращает id новых записей в порядке records.
+    """
+    db_replacements = [ReplacementRecord(**record) for record in records]
+    db.add_all(db_replacements)
+    for equipment_id in {record["equipment_id"] for record in records}:
+        _mark_service_life_dirty(db, equipment_id)
+    _mark_wear_events_dirty(
+        db, [(record["equipment_id"], record["spare_part_id"]) for record in records]
+    )
+    db.flush()
+    ids = [replacement.id for replacement in db_replacements]
+    db.commit()
+    return ids
+
+
+def resolve_replacement_refs(db: Session, items: List[dict]) -> List[Optional[dict]]:
+    """
+    Поиск id оборудования, запчасти и мастерской по VIN и названиям для пачки
+    замен (по одному запросу на таблицу). Для каждой записи - словарь
+    equipment_id, spare_part_id, workshop_id, equipment_model или None.
+    """
+    equipment = {
+        eq.vin: eq
+        for eq in db.query(Equipment)
+        .options(joinedload(Equipment.model))
+        .filter(
+            Equipment.vin.in_({normalize_vin(item["equipment_vin"]) for item in items})
+        )
+    }
+    workshops = {
+        ws.name: ws.id
+        for ws in db.query(Workshop).filter(
+            Workshop.name.in_({item["workshop_name"] for item in items})
+        )
+    }
+    spare_parts = {}
+    for sp in (
+        db.query(SparePart)
+        .filter(
+            SparePart.name.in_({item["spare_part_name"] for item in items}),
+            SparePart.equipment_model_id.in_(
+                {eq.model_id for eq in equipment.values()}
+            ),
+        )
+        .order_by(SparePart.id)
+    ):
+        spare_parts.setdefault((sp.equipment_model_id, sp.name), sp.id)
+
+    refs = []
+    for item in items:
+        eq = equipment.get(normalize_vin(item["equipment_vin"]))
+        sp_id = eq and spare_parts.get((eq.model_id, item["spare_part_name"]))
+        ws_id = workshops.get(item["workshop_name"])
+        if eq and sp_id and ws_id:
+            refs.append(
+                {
+                    "equipment_id": eq.id,
+                    "spare_part_id": sp_id,
+                    "workshop_id": ws_id,
+                    "equipment_model": eq.model.name,
+                }
+            )
+        else:
+            refs.append(None)
+    return refs
+
+
 def get_replacement_records_by_equipment_model(
     db: Session, equipment_model_id: int
 ) -> List[ReplacementRecord]:
@@ -192,6 +427,263 @@ def get_all_replacement_records(db: Session) -> List[ReplacementRecord]:
     return db.query(ReplacementRecord).all()
 
 
+def _replacement_history_query(
+    db: Session, equipment_model_id: Optional[int] = None, vin: Optional[str] = None
+):
+    query = db.query(ReplacementRecord).join(Equipment)
+    if equipment_model_id is not None:
+        query = query.filter(Equipment.model_id == equipment_model_id)
+    if vin is not None:
+        query = query.filter(Equipment.vin == vin)
+    return query
+
+
+def get_replacement_history_page(
+    db: Session,
+    equipment_model_id: Optional[int] = None,
+    vin: Optional[str] = None,
+    offset: int = 0,
+    limit: int = 100,
+) -> List[ReplacementRecord]:
+    """Страница истории замен (новые сверху) с подгрузкой связей одним запросом"""
+    return (
+        _replacement_history_query(db, equipment_model_id, vin)
+        .options(
+            joinedload(ReplacementRecord.equipment).joinedload(Equipment.model),
+            joinedload(ReplacementRecord.spare_part),
+            joinedload(ReplacementRecord.workshop),
+        )
+        .order_by(
+            ReplacementRecord.replacement_date.desc(), ReplacementRecord.id.desc()
+        )
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+
+
+def count_replacement_history(
+    db: Session, equipment_model_id: Optional[int] = None, vin: Optional[str] = None
+) -> int:
+    return _replacement_history_query(db, equipment_model_id, vin).count()
+
+
+# Поиск по примечаниям, VIN, запчастям и мастерским
+def _search_sql(
+    dialect_name: str,
+    query: str,
+    kinds: Optional[List[str]],
+    ranked: bool = True,
+) -> str:
+    """
+    Подзапрос с найденными строками: kind, ref_id, body, score.
+    Чем больше score, тем точнее совпадение. Из каждого источника берется
+    не более SEARCH_MAX_HITS лучших по score кандидатов, чтобы слишком общие
+    запросы не возвращали всю таблицу. ranked=False - без расчета score
+    и сортировки (для подсчета).
+    """
+    sources = [source for source in SEARCH_SOURCES if not kinds or source[0] in kinds]
+    if dialect_name == "postgresql":
+        parts = []
+        for kind, table, column in sources:
+            score = f"similarity({column}, :query)"
+            condition = f"{column} % :query OR {column} ILIKE :pattern"
+            if kind == "replacement":
+                # Для примечаний дополнительно полнотекстовый поиск по словоформам
+                document = f"to_tsvector('russian', coalesce({column}, ''))"
+                tsquery = "plainto_tsquery('russian', :query)"
+                score = f"greatest({score}, ts_rank({document}, {tsquery}))"
+                condition += f" OR {document} @@ {tsquery}"
+            # Лимит - после сортировки по score, иначе для общих запросов
+            # ранжировалось бы случайное подмножество совпадений
+            order = "ORDER BY score DESC, id " if ranked else ""
+            if not ranked:
+                score = "0.0"
+            parts.append(
+                f"(SELECT '{kind}' AS kind, id AS ref_id, {column} AS body, "
+                f"{score} AS score FROM {table} WHERE {condition} "
+                f"{order}LIMIT :max_hits)"
+            )
+        return " UNION ALL ".join(parts)
+
+    # SQLite: FTS5 с триграммным токенизатором, ранжирование bm25
+    kind_filter = ""
+    if kinds:
+        kind_filter = " AND kind IN ({})".format(
+            ", ".join(f"'{kind}'" for kind, _, _ in sources)
+        )
+    if len(query) >= SEARCH_MIN_TRIGRAM:
+        score = "-bm25(search_index)" if ranked else "0.0"
+        # rank FTS5 - тот же bm25; сортировка по нему выполняется внутри FTS5
+        order = " ORDER BY rank" if ranked else ""
+        return (
+            "SELECT kind, CAST(ref_id AS INTEGER) AS ref_id, body, "
+            f"{score} AS score FROM search_index "
+            f"WHERE search_index MATCH :match{kind_filter}{order} LIMIT :max_hits"
+        )
+    # Короче трех символов триграммный индекс не работает - просмотр подстроки
+    return (
+        "SELECT kind, CAST(ref_id AS INTEGER) AS ref_id, body, 0.0 AS score "
+        "FROM search_index WHERE instr(lower(body), lower(:query)) > 0"
+        f"{kind_filter} LIMIT :max_hits"
+    )
+
+
+def _search_params(query: str) -> dict:
+    escaped = query.replace('"', '""')
+    return {
+        "query": query,
+        "pattern": f"%{query}%",
+        "match": f'"{escaped}"',
+        "max_hits": SEARCH_MAX_HITS,
+    }
+
+
+def _search_context(db: Session, kind: str, ids: List[int]) -> dict:
+    """Пояснение к найденным строкам одним запросом на вид результата"""
+    if kind == "replacement":
+        records = (
+            db.query(ReplacementRecord)
+            .options(
+                joinedload(ReplacementRecord.equipment).joinedload(Equipment.model),
+                joinedload(ReplacementRecord.spare_part),
+            )
+            .filter(ReplacementRecord.id.in_(ids))
+            .all()
+        )
+        return {
+            record.id: " · ".join(
+                [
+                    record.equipment.vin if record.equipment else "",
+                    record.spare_part.name if record.spare_part else "",
+                    (
+                        record.replacement_date.strftime("%d.%m.%Y")
+                        if record.replacement_date
+                        else ""
+                    ),
+                ]
+            )
+            for record in records
+        }
+    if kind == "equipment":
+        rows = (
+            db.query(Equipment.id, EquipmentModel.name)
+            .join(EquipmentModel, Equipment.model_id == EquipmentModel.id)
+            .filter(Equipment.id.in_(ids))
+            .all()
+        )
+    elif kind == "spare_part":
+        rows = (
+            db.query(SparePart.id, EquipmentModel.name)
+            .join(EquipmentModel, SparePart.equipment_model_id == EquipmentModel.id)
+            .filter(SparePart.id.in_(ids))
+            .all()
+        )
+    else:
+        rows = (
+            db.query(Workshop.id, Workshop.address).filter(Workshop.id.in_(ids)).all()
+        )
+    return {row_id: context or "" for row_id, context in rows}
+
+
+def search_records(
+    db: Session,
+    query: str,
+    kinds: Optional[List[str]] = None,
+    offset: int = 0,
+    limit: int = 20,
+) -> List[dict]:
+    """
+    Ранжированный поиск по индексам (см. search_index.py).
+    kinds - виды результатов: replacement, equipment, spare_part, workshop.
+    Возвращает страницу результатов: kind, id, text, context, score.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    sql = _search_sql(db.get_bind().dialect.name, query, kinds)
+    rows = db.execute(
+        text(
+            f"SELECT kind, ref_id, body, score FROM ({sql}) AS hits "
+            "ORDER BY score DESC, kind, ref_id LIMIT :limit OFFSET :offset"
+        ),
+        {**_search_params(query), "limit": limit, "offset": offset},
+    ).all()
+
+    # Пояснения подгружаются только для строк текущей страницы
+    ids_by_kind = {}
+    for row in rows:
+        ids_by_kind.setdefault(row.kind, []).append(row.ref_id)
+    context = {
+        kind: _search_context(db, kind, ids) for kind, ids in ids_by_kind.items()
+    }
+    return [
+        {
+            "kind": row.kind,
+            "id": row.ref_id,
+            "text": row.body,
+            "context": context[row.kind].get(row.ref_id, ""),
+            "score": float(row.score or 0.0),
+        }
+        for row in rows
+    ]
+
+
+def count_search_results(
+    db: Session, query: str, kinds: Optional[List[str]] = None
+) -> Tuple[int, bool]:
+    """
+    Количество найденных строк и признак усечения: хотя бы один источник
+    уперся в SEARCH_MAX_HITS (в SQLite лимит общий для индекса)
+    """
+    query = query.strip()
+    if not query:
+        return 0, False
+    dialect_name = db.get_bind().dialect.name
+    sql = _search_sql(dialect_name, query, kinds, ranked=False)
+    counts = dict(
+        db.execute(
+            text(f"SELECT kind, count(*) FROM ({sql}) AS hits GROUP BY kind"),
+            _search_params(query),
+        ).all()
+    )
+    total = sum(counts.values())
+    if dialect_name == "postgresql":
+        truncated = any(count >= SEARCH_MAX_HITS for count in counts.values())
+    else:
+        truncated = total >= SEARCH_MAX_HITS
+    return total, truncated
+
+
+def get_wear_snapshots(
+    db: Session,
+    date_from: date,
+    date_to: Optional[date] = None,
+    equipment_model: Optional[str] = None,
+) -> List[WearSnapshot]:
+    """Снимки количества запчастей по зонам износа за период (см. snapshots.py)"""
+    query = db.query(WearSnapshot).filter(WearSnapshot.snapshot_date >= date_from)
+    if date_to is not None:
+        query = query.filter(WearSnapshot.snapshot_date <= date_to)
+    if equipment_model is not None:
+        query = query.filter(WearSnapshot.equipment_model == equipment_model)
+    return query.order_by(WearSnapshot.snapshot_date).all()
+
+
+def get_data_version(db: Session) -> str:
+    """
+    Версия данных для кэширования ответов: ревизии справочников и истории
+    замен (data_revisions), меняется при любом добавлении, изменении
+    или удалении записей.
+    """
+    return "-".join(
+        str(revision)
+        for (revision,) in db.query(DataRevision.revision).order_by(
+            DataRevision.table_name
+        )
+    )
+
+
 def update_replacement_record(
     db: Session,
     replacement_id: int,
@@ -208,7 +700,10 @@ def update_replacement_record(
         .first()
     )
     if replacement:
+        _mark_service_life_dirty(db, replacement.equipment_id)
+        position = (replacement.equipment_id, replacement.spare_part_id)
         if equipment_id is not None:
+            _mark_service_life_dirty(db, equipment_id)
             replacement.equipment_id = equipment_id
         if spare_part_id is not None:
             replacement.spare_part_id = spare_part_id
@@ -220,6 +715,10 @@ def update_replacement_record(
             replacement.replacement_type = replacement_type
         if notes is not None:
             replacement.notes = notes
+        # Прежняя и новая позиции замены
+        _mark_wear_events_dirty(
+            db, [position, (replacement.equipment_id, replacement.spare_part_id)]
+        )
         db.commit()
         db.refresh(replacement)
     return replacement
@@ -232,7 +731,79 @@ def delete_replacement_record(db: Session, replacement_id: int) -> bool:
         .first()
     )
     if replacement:
+        _mark_service_life_dirty(db, replacement.equipment_id)
+        _mark_wear_events_dirty(
+            db, [(replacement.equipment_id, replacement.spare_part_id)]
+        )
         db.delete(replacement)
         db.commit()
         return True
     return False
+
+
+def create_report_job(
+    db: Session,
+    kind: str,
+    fmt: str,
+    params: Optional[str] = None,
+    owner: Optional[str] = None,
+) -> ReportJob:
+    created_at = datetime.now()
+    job = ReportJob(
+        kind=kind,
+        format=fmt,
+        status="queued",
+        progress=0.0,
+        params=params,
+        created_at=created_at,
+        owner=owner,
+        heartbeat_at=created_at,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_report_job(db: Session, job_id: int) -> Optional[ReportJob]:
+    return db.query(ReportJob).filter(ReportJob.id == job_id).first()
+
+
+def get_report_jobs(
+    db: Session, kind: Optional[str] = None, limit: int = 20
+) -> List[ReportJob]:
+    """Последние задания генерации отчетов (новые первыми)"""
+    query = db.query(ReportJob)
+    if kind is not None:
+        query = query.filter(ReportJob.kind == kind)
+    return query.order_by(ReportJob.id.desc()).limit(limit).all()
+
+
+def update_report_job(db: Session, job_id: int, **fields) -> Optional[ReportJob]:
+    job = get_report_job(db, job_id)
+    if job:
+        for field, value in fields.items():
+            setattr(job, field, value)
+        db.commit()
+    return job
+
+
+def get_expired_report_jobs(db: Session, before: datetime) -> List[ReportJob]:
+    """Завершенные задания, закончившиеся раньше before"""
+    return (
+        db.query(ReportJob)
+        .filter(
+            ReportJob.status.in_(["done", "failed", "cancelled"]),
+            ReportJob.finished_at < before,
+        )
+        .all()
+    )
+
+
+def delete_report_job(db: Session, job_id: int) -> bool:
+    job = get_report_job(db, job_id)
+    if job:
+        db.delete(job)
+        db.commit()
+        return True
+    return False
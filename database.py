@@ -1,16 +1,31 @@
 from sqlalchemy import (
     create_engine,
+    inspect,
+    text,
     Column,
     Integer,
     String,
+    Date,
     DateTime,
-    # Float,
+    Float,
     ForeignKey,
+    Index,
     Text,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 import os
+from query_monitor import install_query_hooks
+from replica import install_write_tracking, use_replica
+from change_bus import (
+    CHANGE_TABLES,
+    REVISION_TABLE,
+    create_change_bus,
+    install_change_publishing,
+)
+from partitioning import ensure_history_storage
+from search_index import ensure_search_indexes
+from utils import logger
 
 # Проверяем, включена ли поддержка базы данных
 USE_DATABASE = os.getenv("USE_DATABASE", "true").lower() == "true"
@@ -21,13 +36,45 @@ if USE_DATABASE:
     )
 
     engine = create_engine(DATABASE_URL)
+    # Счетчики запросов, журнал медленных запросов и обнаружение N+1
+    install_query_hooks(engine)
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+    # Необязательная реплика для чтения (по умолчанию - та же основная БД)
+    DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+    if DATABASE_READ_URL:
+        read_engine = create_engine(DATABASE_READ_URL)
+        install_query_hooks(read_engine)
+    else:
+        read_engine = engine
+    install_write_tracking(engine)
+    ReplicaSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, bind=read_engine
+    )
+
+    def ReadSessionLocal():
+        """
+        Сессия для запросов только на чтение: реплика, если она задана,
+        не отстает и после последней записи этой сессии Streamlit (потоков
+        без сессии - этого процесса) прошло больше допустимого отставания;
+        иначе - основная БД. Запись через эту сессию недопустима.
+        """
+        if use_replica(read_engine, engine):
+            return ReplicaSessionLocal()
+        return SessionLocal()
+
+    # Уведомления об изменениях для точечного обновления данных других сессий
+    change_bus = create_change_bus(engine)
+    install_change_publishing(change_bus)
+
     Base = declarative_base()
 else:
     # Заглушки для режима без базы данных
     engine = None
+    read_engine = None
     SessionLocal = None
+    ReadSessionLocal = None
+    change_bus = None
     Base = None
 
 
@@ -65,6 +112,9 @@ if USE_DATABASE:
         id = Column(Integer, primary_key=True, index=True)
         name = Column(String, unique=True, index=True)
         address = Column(String)
+        # Сколько плановых замен мастерская выполняет за рабочий день
+        # (не задано - WORKSHOP_DAILY_CAPACITY, см. scheduling.py)
+        daily_capacity = Column(Integer, nullable=True)
 
         # Отношения
         replacements = relationship("ReplacementRecord", back_populates="workshop")
@@ -100,6 +150,195 @@ if USE_DATABASE:
         spare_part = relationship("SparePart", back_populates="replacements")
         workshop = relationship("Workshop", back_populates="replacements")
 
+    # Производные таблицы аналитики пересчитываются из replacement_records,
+    # поэтому внешние ключи на исходные записи в них не задаются
+
+    class ReplacementInterval(Base):
+        """Интервал между заменой и предыдущей заменой той же запчасти на том же VIN"""
+
+        __tablename__ = "replacement_intervals"
+
+        replacement_id = Column(Integer, primary_key=True)
+        equipment_id = Column(Integer, index=True)
+        spare_part_id = Column(Integer, index=True)
+        interval_days = Column(Float)
+        replacement_type = Column(String)
+
+    class PartLifeStats(Base):
+        """Фактический срок службы запчасти по истории замен"""
+
+        __tablename__ = "part_life_stats"
+
+        spare_part_id = Column(Integer, primary_key=True)
+        n_intervals = Column(Integer)
+        median_days = Column(Float, nullable=True)
+        p10_days = Column(Float, nullable=True)
+        p90_days = Column(Float, nullable=True)
+        unscheduled_share = Column(Float, nullable=True)
+        refreshed_at = Column(DateTime)
+
+    class ServiceLifeDirtyEquipment(Base):
+        """VIN, история замен которых изменилась после последнего пересчета"""
+
+        __tablename__ = "service_life_dirty_equipment"
+
+        equipment_id = Column(Integer, primary_key=True)
+
+    # Даты перехода позиций (VIN, запчасть) в желтую и красную зоны
+    # и крайние сроки закупки (wear_events.py)
+
+    class WearThresholdEvent(Base):
+        """Дата, когда позиция (VIN, запчасть) пересекает порог"""
+
+        __tablename__ = "wear_threshold_events"
+        __table_args__ = (
+            Index("ix_wear_threshold_events_date", "event_date", "threshold"),
+        )
+
+        equipment_id = Column(Integer, primary_key=True)
+        spare_part_id = Column(Integer, primary_key=True)
+        # 'yellow' (осталось 25%), 'red' (10%), 'deadline' (крайний срок закупки)
+        threshold = Column(String, primary_key=True)
+        event_date = Column(DateTime)
+        last_replacement = Column(DateTime)
+
+    class WearEventDirtyPosition(Base):
+        """Позиции, история замен которых изменилась после последнего пересчета"""
+
+        __tablename__ = "wear_event_dirty_positions"
+
+        equipment_id = Column(Integer, primary_key=True)
+        spare_part_id = Column(Integer, primary_key=True)
+
+    class AlertLog(Base):
+        """Отправленные уведомления о переходе порогов (alerts.py)"""
+
+        __tablename__ = "alert_log"
+
+        equipment_id = Column(Integer, primary_key=True)
+        spare_part_id = Column(Integer, primary_key=True)
+        threshold = Column(String, primary_key=True)
+        # Замена, от которой отсчитан порог: после новой замены - новый цикл
+        last_replacement = Column(DateTime, primary_key=True)
+        event_date = Column(DateTime)
+        sent_at = Column(DateTime)
+
+    class ScheduledReplacement(Base):
+        """Расписание плановых замен по мастерским (scheduling.py)"""
+
+        __tablename__ = "scheduled_replacements"
+
+        equipment_id = Column(Integer, primary_key=True)
+        spare_part_id = Column(Integer, primary_key=True)
+        workshop_id = Column(Integer, ForeignKey("workshops.id"), nullable=True)
+        # None - не хватило мощности мастерских в горизонте планирования
+        scheduled_date = Column(Date, nullable=True, index=True)
+        release_date = Column(Date)  # переход в красную зону
+        due_date = Column(Date)  # окончание срока полезного использования
+        # Замена, от которой рассчитан срок: другая - позицию нужно перепланировать
+        last_replacement = Column(DateTime)
+        status = Column(String)  # 'planned', 'late', 'unscheduled'
+
+    # Ежедневные снимки износа (snapshots.py) для графиков динамики
+
+    class WearSnapshot(Base):
+        """Количество запчастей модели в зоне износа на дату"""
+
+        __tablename__ = "wear_snapshots"
+
+        snapshot_date = Column(Date, primary_key=True)
+        equipment_model = Column(String, primary_key=True)
+        wear_level = Column(String, primary_key=True)
+        parts_count = Column(Integer)  # Позиций (запчасть модели) в зоне
+        units = Column(Integer)  # Запчастей во всем парке для этих позиций
+
+    class PartWearSnapshot(Base):
+        """Оставшийся срок запчасти модели на дату"""
+
+        __tablename__ = "part_wear_snapshots"
+
+        snapshot_date = Column(Date, primary_key=True)
+        equipment_model = Column(String, primary_key=True)
+        spare_part_name = Column(String, primary_key=True)
+        remaining_pct = Column(Float)
+        wear_level = Column(String)
+
+    # Заранее рассчитанные износ и план закупок по всему парку (precompute.py).
+    # Каждый пересчет - новая версия (run_id); страницы читают последнюю
+    # завершенную версию, старые версии удаляются после записи новой
+
+    class FleetResultRun(Base):
+        """Версия заранее рассчитанных результатов"""
+
+        __tablename__ = "fleet_result_runs"
+
+        id = Column(Integer, primary_key=True, index=True)
+        status = Column(String, index=True)  # 'running', 'done', 'failed'
+        computed_at = Column(DateTime)  # Момент, на который прочитаны данные
+        finished_at = Column(DateTime, nullable=True)
+        wear_rows = Column(Integer, nullable=True)
+        plan_rows = Column(Integer, nullable=True)
+
+    class FleetWearResult(Base):
+        """Износ запчасти модели (строка таблицы "Анализ износа")"""
+
+        __tablename__ = "fleet_wear_results"
+
+        id = Column(Integer, primary_key=True)
+        run_id = Column(Integer, index=True)
+        equipment_name = Column(String)
+        part_name = Column(String)
+        total_needed = Column(Integer)
+        qty_in_stock = Column(Integer)
+        wear_level = Column(String)
+        remaining_pct = Column(Float)
+        procurement_deadline = Column(DateTime, nullable=True)
+        procurement_time_days = Column(Integer)
+
+    class FleetPlanResult(Base):
+        """Строка календарного плана закупок"""
+
+        __tablename__ = "fleet_plan_results"
+
+        id = Column(Integer, primary_key=True)
+        run_id = Column(Integer, index=True)
+        date = Column(DateTime)
+        equipment = Column(String)
+        part = Column(String)
+        needed = Column(Integer)
+        wear_level = Column(String)
+
+    class DataRevision(Base):
+        """Ревизия таблицы справочников или истории замен (change_bus.py)"""
+
+        __tablename__ = REVISION_TABLE
+
+        table_name = Column(String, primary_key=True)
+        revision = Column(Integer, nullable=False, default=0)
+
+    class ReportJob(Base):
+        """Задание фоновой генерации отчета (jobs.py)"""
+
+        __tablename__ = "report_jobs"
+
+        id = Column(Integer, primary_key=True, index=True)
+        kind = Column(String)  # 'wear', 'procurement'
+        format = Column(String)  # 'xlsx', 'csv'
+        # 'queued', 'running', 'cancelling', 'cancelled', 'done', 'failed'
+        status = Column(String, index=True)
+        progress = Column(Float, default=0.0)  # Доля выполнения 0..1
+        message = Column(String, nullable=True)
+        params = Column(Text, nullable=True)  # Параметры отчета (JSON)
+        created_at = Column(DateTime, index=True)
+        started_at = Column(DateTime, nullable=True)
+        finished_at = Column(DateTime, nullable=True)
+        result_path = Column(String, nullable=True)
+        rows = Column(Integer, nullable=True)
+        error = Column(Text, nullable=True)
+        # Процесс, выполняющий задание, и время его последнего сигнала
+        owner = Column(String, nullable=True)
+        heartbeat_at = Column(DateTime, nullable=True)
+
 else:
     # Заглушки для режима без базы данных
     EquipmentModel = None
@@ -107,10 +346,90 @@ else:
     Workshop = None
     SparePart = None
     ReplacementRecord = None
+    ReplacementInterval = None
+    PartLifeStats = None
+    ServiceLifeDirtyEquipment = None
+    WearThresholdEvent = None
+    WearEventDirtyPosition = None
+    AlertLog = None
+    ScheduledReplacement = None
+    WearSnapshot = None
+    PartWearSnapshot = None
+    FleetResultRun = None
+    FleetWearResult = None
+    FleetPlanResult = None
+    DataRevision = None
+    ReportJob = None
+
+
+# Столбцы, добавленные в уже существующие таблицы (create_all их не создает)
+ADDED_COLUMNS = [
+    ("workshops", "daily_capacity", "INTEGER"),
+    ("report_jobs", "owner", "VARCHAR"),
+    ("report_jobs", "heartbeat_at", "TIMESTAMP"),
+]
 
 
 if USE_DATABASE:
 
+    def ensure_added_columns(engine):
+        """Добавление новых столбцов в таблицы, созданные прежними версиями"""
+        inspector = inspect(engine)
+        with engine.begin() as conn:
+            for table, column, ddl in ADDED_COLUMNS:
+                existing = {item["name"] for item in inspector.get_columns(table)}
+                if column not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+    def ensure_data_revisions(engine):
+        """Строки ревизий для всех таблиц CHANGE_TABLES"""
+        with engine.begin() as conn:
+            for table in CHANGE_TABLES:
+                conn.execute(
+                    text(
+                        f"INSERT INTO {REVISION_TABLE} (table_name, revision) "
+                        "VALUES (:table, 0) ON CONFLICT (table_name) DO NOTHING"
+                    ),
+                    {"table": table},
+                )
+
+    def normalize_vins(engine):
+        """
+        VIN, записанные прежними версиями как введены, - в верхний регистр
+        (crud.normalize_vin). VIN, которые после этого совпали бы с другим
+        VIN, не меняются: их нужно исправить вручную.
+        """
+        normalized = "upper(trim(vin))"
+        with engine.begin() as conn:
+            updated = conn.execute(
+                text(
+                    f"UPDATE equipment SET vin = {normalized} "
+                    f"WHERE vin <> {normalized} AND NOT EXISTS ("
+                    "SELECT 1 FROM equipment other WHERE other.id <> equipment.id "
+                    "AND upper(trim(other.vin)) = upper(trim(equipment.vin)))"
+                )
+            ).rowcount
+            if updated:
+                # Изменение мимо ORM: ревизия справочника (change_bus.py) - вручную
+                conn.execute(
+                    text(
+                        f"UPDATE {REVISION_TABLE} SET revision = revision + 1 "
+                        "WHERE table_name = 'equipment'"
+                    )
+                )
+            conflicts = (
+                conn.execute(
+                    text(f"SELECT vin FROM equipment WHERE vin <> {normalized}")
+                )
+                .scalars()
+                .all()
+            )
+        if conflicts:
+            logger.warning(
+                f"VIN не приведены к верхнему регистру (совпадут с другими VIN): "
+                f"{', '.join(conflicts)}"
+            )
+
     def get_db():
         db = SessionLocal()
         try:
@@ -120,6 +439,11 @@ if USE_DATABASE:
 
     def create_tables():
         Base.metadata.create_all(bind=engine)
+        ensure_added_columns(engine)
+        ensure_data_revisions(engine)
+        normalize_vins(engine)
+        ensure_history_storage(engine)
+        ensure_search_indexes(engine)
 
 else:
 
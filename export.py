@@ -0,0 +1,428 @@
+import argparse
+import os
+import re
+import zipfile
+from datetime import date, datetime, time
+from typing import Iterable, Iterator, List, Optional
+from xml.sax.saxutils import escape
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from utils import configure_logging
+from database import (
+    ReadSessionLocal,
+    USE_DATABASE,
+    EquipmentModel,
+    Equipment,
+    Workshop,
+    SparePart,
+    ReplacementRecord,
+)
+
+# Потоковая выгрузка истории замен в CSV, XLSX и Parquet.
+# Строки читаются серверным курсором (yield_per / stream_results) пачками
+# по EXPORT_CHUNK_ROWS и сразу дописываются в файл, поэтому расход памяти
+# не зависит от количества выгружаемых строк.
+
+# Размер пачки строк при выгрузке
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "10000"))
+
+EXPORT_COLUMNS = [
+    "id",
+    "equipment_vin",
+    "equipment_model",
+    "spare_part_name",
+    "workshop_name",
+    "replacement_date",
+    "replacement_type",
+    "notes",
+]
+# Формат: (MIME-тип, расширение файла)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "xlsx": (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        ".xlsx",
+    ),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+
+def export_query(
+    model: Optional[str] = None,
+    vin: Optional[str] = None,
+    workshop: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    """Запрос истории замен с фильтрами (даты - включительно)"""
+    stmt = (
+        select(
+            ReplacementRecord.id,
+            Equipment.vin,
+            EquipmentModel.name,
+            SparePart.name,
+            Workshop.name,
+            ReplacementRecord.replacement_date,
+            ReplacementRecord.replacement_type,
+            ReplacementRecord.notes,
+        )
+        .join(Equipment, ReplacementRecord.equipment_id == Equipment.id)
+        .join(EquipmentModel, Equipment.model_id == EquipmentModel.id)
+        .join(SparePart, ReplacementRecord.spare_part_id == SparePart.id)
+        .join(Workshop, ReplacementRecord.workshop_id == Workshop.id)
+        .order_by(ReplacementRecord.replacement_date, ReplacementRecord.id)
+    )
+    if model:
+        stmt = stmt.where(EquipmentModel.name == model)
+    if vin:
+        stmt = stmt.where(Equipment.vin == vin)
+    if workshop:
+        stmt = stmt.where(Workshop.name == workshop)
+    if date_from:
+        stmt = stmt.where(
+            ReplacementRecord.replacement_date >= datetime.combine(date_from, time.min)
+        )
+    if date_to:
+        stmt = stmt.where(
+            ReplacementRecord.replacement_date <= datetime.combine(date_to, time.max)
+        )
+    return stmt
+
+
+def iter_export_chunks(
+    db: Session, chunk_rows: int = EXPORT_CHUNK_ROWS, **filters
+) -> Iterator[pd.DataFrame]:
+    """История замен пачками DataFrame через серверный курсор"""
+    result = db.execute(export_query(**filters).execution_options(yield_per=chunk_rows))
+    for rows in result.partitions():
+        frame = pd.DataFrame(rows, columns=EXPORT_COLUMNS)
+        frame["replacement_date"] = pd.to_datetime(frame["replacement_date"])
+        yield frame
+
+
+def export_schema():
+    """Схема Parquet для EXPORT_COLUMNS: задается явно, а не по первой пачке
+    (пачка, где все примечания пусты, дала бы колонке тип null)"""
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("equipment_vin", pa.string()),
+            ("equipment_model", pa.string()),
+            ("spare_part_name", pa.string()),
+            ("workshop_name", pa.string()),
+            ("replacement_date", pa.timestamp("us")),
+            ("replacement_type", pa.string()),
+            ("notes", pa.string()),
+        ]
+    )
+
+
+def iter_frame_chunks(
+    frame: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS
+) -> Iterator[pd.DataFrame]:
+    """Пачки строк готового DataFrame (режим без базы данных)"""
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start : start + chunk_rows]
+
+
+def filter_replacements_frame(
+    frame: pd.DataFrame,
+    model: Optional[str] = None,
+    vin: Optional[str] = None,
+    workshop: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> pd.DataFrame:
+    """
+    Те же фильтры для replacements_df (режим без базы данных): строки в
+    колонках и порядке EXPORT_COLUMNS (id из индекса - колонкой), по дате
+    """
+    mask = pd.Series(True, index=frame.index)
+    for column, value in (
+        ("equipment_model", model),
+        ("equipment_vin", vin),
+        ("workshop_name", workshop),
+    ):
+        if value:
+            mask &= frame[column] == value
+    dates = pd.to_datetime(frame["replacement_date"])
+    if date_from:
+        mask &= dates >= pd.Timestamp(date_from)
+    if date_to:
+        mask &= dates < pd.Timestamp(date_to) + pd.Timedelta(days=1)
+    filtered = frame[mask]
+    if "id" not in filtered.columns:
+        filtered = filtered.rename_axis("id").reset_index()
+    return filtered.sort_values(["replacement_date", "id"], kind="stable")[
+        EXPORT_COLUMNS
+    ].reset_index(drop=True)
+
+
+def write_csv(chunks: Iterable[pd.DataFrame], path: str) -> int:
+    # utf-8-sig: Excel правильно открывает кириллицу
+    rows = 0
+    header_written = False
+    with open(path, "w", encoding="utf-8-sig", newline="") as file:
+        for chunk in chunks:
+            chunk.to_csv(file, header=not header_written, index=False)
+            header_written = True
+            rows += len(chunk)
+        if not header_written:
+            pd.DataFrame(columns=EXPORT_COLUMNS).to_csv(file, index=False)
+    return rows
+
+
+def write_parquet(chunks: Iterable[pd.DataFrame], path: str) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = export_schema()
+    rows = 0
+    # Пустая выгрузка - файл только со схемой
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in chunks:
+            writer.write_table(
+                pa.Table.from_pandas(
+                    chunk[EXPORT_COLUMNS], schema=schema, preserve_index=False
+                )
+            )
+            rows += len(chunk)
+    return rows
+
+
+# Минимальная книга XLSX: лист пишется в архив построчно, без библиотек
+# и без хранения листа в памяти; даты - числа Excel со стилем даты/времени
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" '
+        'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="6"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill>'
+        '<fill><patternFill patternType="solid"><fgColor rgb="FFE9ECEF"/></patternFill></fill>'
+        '<fill><patternFill patternType="solid"><fgColor rgb="FFC3E6CB"/></patternFill></fill>'
+        '<fill><patternFill patternType="solid"><fgColor rgb="FFFFEEBA"/></patternFill></fill>'
+        '<fill><patternFill patternType="solid"><fgColor rgb="FFF5C6CB"/></patternFill></fill>'
+        "</fills>"
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="7"><xf/>'
+        '<xf numFmtId="22" applyNumberFormat="1"/>'
+        '<xf fontId="1" fillId="2" applyFont="1" applyFill="1"/>'
+        '<xf fillId="3" applyFill="1"/>'
+        '<xf fillId="4" applyFill="1"/>'
+        '<xf fillId="5" applyFill="1"/>'
+        '<xf numFmtId="2" applyNumberFormat="1"/>'
+        "</cellXfs>"
+        "</styleSheet>"
+    ),
+}
+# Номера стилей ячеек из xl/styles.xml
+XLSX_STYLES = {
+    "date": 1,
+    "header": 2,
+    "green": 3,
+    "yellow": 4,
+    "red": 5,
+    "number": 6,
+}
+_XLSX_EPOCH = pd.Timestamp("1899-12-30")
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xlsx_cell(value, style=None):
+    attr = f' s="{style}"' if style else ""
+    if (
+        value is None
+        or value is pd.NaT
+        or (isinstance(value, float) and value != value)
+    ):
+        return f"<c{attr}/>"
+    if isinstance(value, (pd.Timestamp, datetime)):
+        serial = (pd.Timestamp(value) - _XLSX_EPOCH) / pd.Timedelta(days=1)
+        return f'<c s="{style or XLSX_STYLES["date"]}"><v>{serial!r}</v></c>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c{attr}><v>{value!r}</v></c>"
+    text = escape(_XML_ILLEGAL.sub("", str(value)))
+    return f'<c{attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values, styles=None):
+    styles = styles or [None] * len(values)
+    return (
+        "<row>"
+        + "".join(_xlsx_cell(value, style) for value, style in zip(values, styles))
+        + "</row>"
+    )
+
+
+def write_xlsx(
+    chunks: Iterable[pd.DataFrame],
+    path: str,
+    columns: Optional[List[str]] = None,
+    sheet_name: str = "Замены",
+    headers: Optional[dict] = None,
+    widths: Optional[dict] = None,
+    styles: Optional[dict] = None,
+) -> int:
+    """
+    Запись пачек строк в книгу XLSX с одним листом.
+    columns - колонки (по умолчанию EXPORT_COLUMNS), headers - подписи колонок,
+    widths - ширина колонок (в символах), styles - {колонка: функция значения,
+    возвращающая имя стиля из XLSX_STYLES или None}
+    """
+    columns = EXPORT_COLUMNS if columns is None else columns
+    headers = headers or {}
+    widths = widths or {}
+    styles = styles or {}
+    cols = "".join(
+        f'<col min="{number}" max="{number}" width="{widths[column]}" customWidth="1"/>'
+        for number, column in enumerate(columns, start=1)
+        if column in widths
+    )
+    stylers = [styles.get(column) for column in columns]
+    rows = 0
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC.items():
+            archive.writestr(name, content)
+        archive.writestr(
+            "xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/>'
+            "</sheets></workbook>",
+        )
+        with archive.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            # Закрепленная строка заголовков
+            sheet.write(
+                (
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<worksheet xmlns="http://schemas.openxmlformats.org/'
+                    'spreadsheetml/2006/main">'
+                    '<sheetViews><sheetView workbookViewId="0">'
+                    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" '
+                    'state="frozen"/></sheetView></sheetViews>'
+                    + (f"<cols>{cols}</cols>" if cols else "")
+                    + "<sheetData>"
+                    + _xlsx_row(
+                        [headers.get(column, column) for column in columns],
+                        [XLSX_STYLES["header"]] * len(columns),
+                    )
+                ).encode("utf-8")
+            )
+            for chunk in chunks:
+                lines = []
+                for values in (
+                    chunk[columns].astype(object).itertuples(index=False, name=None)
+                ):
+                    row_styles = [
+                        XLSX_STYLES.get(styler(value)) if styler else None
+                        for styler, value in zip(stylers, values)
+                    ]
+                    lines.append(_xlsx_row(values, row_styles))
+                sheet.write("".join(lines).encode("utf-8"))
+                rows += len(chunk)
+            sheet.write(b"</sheetData></worksheet>")
+    return rows
+
+
+WRITERS = {"csv": write_csv, "xlsx": write_xlsx, "parquet": write_parquet}
+
+
+def export_history(db: Session, path: str, fmt: str = "csv", **filters) -> int:
+    """Выгрузка истории замен с фильтрами в файл, возвращает количество строк"""
+    if fmt not in WRITERS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    return WRITERS[fmt](iter_export_chunks(db, **filters), path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Выгрузка истории замен в CSV, XLSX или Parquet"
+    )
+    parser.add_argument("output", help="Путь к файлу выгрузки")
+    parser.add_argument(
+        "--format",
+        choices=sorted(WRITERS),
+        help="Формат (по умолчанию - по расширению файла, иначе csv)",
+    )
+    parser.add_argument("--model", help="Модель оборудования")
+    parser.add_argument("--vin", help="VIN оборудования")
+    parser.add_argument("--workshop", help="Мастерская")
+    parser.add_argument(
+        "--from",
+        dest="date_from",
+        type=lambda value: datetime.fromisoformat(value).date(),
+        help="Первая дата замены в формате ГГГГ-ММ-ДД",
+    )
+    parser.add_argument(
+        "--to",
+        dest="date_to",
+        type=lambda value: datetime.fromisoformat(value).date(),
+        help="Последняя дата замены в формате ГГГГ-ММ-ДД",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not USE_DATABASE:
+        parser.error("Выгрузка требует базу данных (USE_DATABASE=true)")
+
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if fmt not in WRITERS:
+        fmt = "csv"
+    db = ReadSessionLocal()
+    try:
+        rows = export_history(
+            db,
+            args.output,
+            fmt,
+            model=args.model,
+            vin=args.vin,
+            workshop=args.workshop,
+            date_from=args.date_from,
+            date_to=args.date_to,
+        )
+    finally:
+        db.close()
+    print(f"Выгружено {rows} строк в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,119 +1,108 @@
 import os
-from models import generate_test_data, create_dataframes
+from models import generate_test_data
 
 # Проверяем, включена ли поддержка базы данных
 USE_DATABASE = os.getenv("USE_DATABASE", "true").lower() == "true"
 
 if USE_DATABASE:
-    from database import SessionLocal, create_tables
-    from crud import (
-        create_equipment_model,
-        create_equipment,
-        create_workshop,
-        create_spare_part,
-        create_replacement_record,
-        get_equipment_model_by_name,
-        get_equipment_by_vin,
-        get_all_workshops,
-        get_all_spare_parts,
-    )
+    from database import create_tables
 else:
     # Заглушки для режима без базы данных
-    SessionLocal = None
     create_tables = None
 
 
-def initialize_database():
-    """Инициализация базы данных начальными данными"""
-    if not USE_DATABASE:
-        # Для режима без базы данных просто возвращаем тестовые данные
-        print("Инициализация в режиме без базы данных...")
-        return
-
-    db = SessionLocal()
-    try:
-        # Создаем таблицы
-        create_tables()
+def seed_test_data(repository):
+    """Заполнение хранилища (repository.py) тестовыми данными"""
+    (
+        equipment_models,
+        equipment_instances,
+        workshops,
+        spare_parts,
+        replacement_records,
+    ) = generate_test_data()
+
+    # Сохраняем модели оборудования
+    model_ids = {
+        model.name: repository.create_equipment_model(model.name, model.qty_in_fleet).id
+        for model in equipment_models
+    }
+
+    # Сохраняем экземпляры оборудования
+    for instance in equipment_instances:
+        if instance.model_name in model_ids:
+            repository.create_equipment(model_ids[instance.model_name], instance.vin)
+
+    # Сохраняем мастерские
+    for ws in workshops:
+        repository.create_workshop(ws.name, ws.address, ws.daily_capacity)
+
+    # Сохраняем запчасти
+    for sp in spare_parts:
+        if sp.parent_equipment in model_ids:
+            repository.create_spare_part(
+                sp.name,
+                sp.useful_life_months,
+                model_ids[sp.parent_equipment],
+                sp.qty_per_equipment,
+                sp.qty_in_stock,
+                sp.procurement_time_days,
+            )
+
+    # Сохраняем записи о заменах: запчасть ищется среди запчастей модели
+    # этого VIN, ссылки - одним вызовом на всю пачку
+    refs = repository.resolve_replacement_refs(
+        [
+            {
+                "equipment_vin": rr.equipment_name,
+                "spare_part_name": rr.spare_part_name,
+                "workshop_name": rr.workshop_name,
+            }
+            for rr in replacement_records
+        ]
+    )
+    repository.create_replacement_records(
+        [
+            {
+                "equipment_id": ref["equipment_id"],
+                "spare_part_id": ref["spare_part_id"],
+                "workshop_id": ref["workshop_id"],
+                "replacement_date": rr.replacement_date,
+                "replacement_type": rr.replacement_type,
+                "notes": rr.notes,
+            }
+            for rr, ref in zip(replacement_records, refs)
+            if ref is not None
+        ]
+    )
 
-        # Проверяем, есть ли уже данные
-        from crud import get_all_equipment_models
 
-        if get_all_equipment_models(db):
-            print("База данных уже инициализирована")
+def initialize_database(repository=None):
+    """
+    Инициализация хранилища начальными данными (если оно пустое).
+    repository - хранилище из repository.py; по умолчанию - БД (если она включена)
+    """
+    if repository is None:
+        if not USE_DATABASE:
+            print("Инициализация в режиме без базы данных...")
             return
+        from repository import SqlRepository
+
+        # Создаем таблицы
+        create_tables()
+        repository = SqlRepository()
 
-        print("Инициализация базы данных начальными данными...")
-
-        # Генерируем тестовые данные
-        (
-            equipment_models,
-            equipment_instances,
-            workshops,
-            spare_parts,
-            replacement_records,
-        ) = generate_test_data()
-
-        # Сохраняем модели оборудования
-        for model in equipment_models:
-            create_equipment_model(db, model.name, model.qty_in_fleet)
-
-        # Сохраняем экземпляры оборудования
-        for instance in equipment_instances:
-            model = get_equipment_model_by_name(db, instance.model_name)
-            if model:
-                create_equipment(db, model.id, instance.vin)
-
-        # Сохраняем мастерские
-        for ws in workshops:
-            create_workshop(db, ws.name, ws.address)
-
-        # Сохраняем запчасти
-        for sp in spare_parts:
-            model = get_equipment_model_by_name(db, sp.parent_equipment)
-            if model:
-                create_spare_part(
-                    db,
-                    sp.name,
-                    sp.useful_life_months,
-                    model.id,
-                    sp.qty_per_equipment,
-                    sp.qty_in_stock,
-                    sp.procurement_time_days,
-                )
-
-        # Сохраняем записи о заменах
-        for rr in replacement_records:
-            equipment = get_equipment_by_vin(db, rr.equipment_name)
-            spare_part = None
-            for sp in get_all_spare_parts(db):
-                if sp.name == rr.spare_part_name:
-                    spare_part = sp
-                    break
-            workshop = None
-            for ws in get_all_workshops(db):
-                if ws.name == rr.workshop_name:
-                    workshop = ws
-                    break
-
-            if equipment and spare_part and workshop:
-                create_replacement_record(
-                    db,
-                    equipment.id,
-                    spare_part.id,
-                    workshop.id,
-                    rr.replacement_date,
-                    rr.replacement_type,
-                    rr.notes,
-                )
-
-        print("База данных успешно инициализирована!")
+    # Проверяем, есть ли уже данные
+    if repository.get_all_equipment_models():
+        print("Хранилище уже инициализировано")
+        return
 
+    print("Заполнение хранилища начальными данными...")
+    try:
+        seed_test_data(repository)
     except Exception as e:
-        print(f"Ошибка при инициализации базы данных: {e}")
-        db.rollback()
+        print(f"Ошибка при инициализации хранилища: {e}")
         raise
-    finally:
-        db.close()
+    print("Хранилище успешно инициализировано!")
 
 
 if __name__ == "__main__":
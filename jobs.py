@@ -0,0 +1,247 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from logly import logger
+from sqlalchemy import or_
+
+from crud import (
+    create_report_job,
+    delete_report_job,
+    get_expired_report_jobs,
+    get_report_job,
+    update_report_job,
+)
+from database import ReadSessionLocal, SessionLocal, ReportJob
+from reports import REPORT_FORMATS, ReportCancelled, build_report
+
+# Фоновая генерация отчетов: задания хранятся в таблице report_jobs
+# (статус, прогресс, путь к файлу), выполняются в пуле потоков процесса,
+# поэтому страница Streamlit не блокируется на время генерации.
+# Готовые файлы хранятся JOB_RETENTION_HOURS, затем удаляются вместе
+# с заданием. Пул каждого процесса периодически отмечает свои задания
+# (owner, heartbeat_at); задание, от процесса которого сигналов нет дольше
+# JOB_HEARTBEAT_TIMEOUT, считается прерванным.
+
+# Количество одновременно генерируемых отчетов
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Сколько часов хранить завершенные задания и файлы отчетов
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+# Каталог файлов отчетов
+REPORT_DIR = os.getenv("REPORT_DIR", "reports")
+# Как часто записывать прогресс в БД (с)
+JOB_PROGRESS_INTERVAL = 0.5
+# Как часто пул отмечает свои незавершенные задания (с)
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+# Через сколько секунд без сигнала задание считается прерванным
+JOB_HEARTBEAT_TIMEOUT = 3 * JOB_HEARTBEAT_SECONDS
+
+ACTIVE_STATUSES = ("queued", "running", "cancelling")
+
+
+class JobRunner:
+    """
+    Пул выполнения заданий генерации отчетов.
+    Отмена: задание в очереди отменяется сразу, выполняющееся - при следующей
+    записи прогресса (после очередной пачки моделей). Незавершенные задания
+    других процессов без сигнала дольше JOB_HEARTBEAT_TIMEOUT (процесс
+    остановлен) отмечаются как прерванные - при создании пула и далее
+    вместе с сигналом.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, report_dir=REPORT_DIR):
+        self.report_dir = report_dir
+        os.makedirs(report_dir, exist_ok=True)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="report")
+        self._cancelled = {}
+        self._lock = threading.Lock()
+        self._fail_orphaned()
+        self.cleanup()
+        threading.Thread(
+            target=self._heartbeat, name="report-heartbeat", daemon=True
+        ).start()
+
+    def submit(self, kind, fmt="xlsx", as_of=None):
+        """Постановка отчета в очередь, возвращает id задания"""
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат отчета: {fmt}")
+        self.cleanup()
+        params = {"as_of": as_of.isoformat() if as_of is not None else None}
+        db = SessionLocal()
+        try:
+            job_id = create_report_job(
+                db, kind, fmt, json.dumps(params), owner=self.owner
+            ).id
+        finally:
+            db.close()
+        with self._lock:
+            self._cancelled[job_id] = threading.Event()
+        self._executor.submit(self._run, job_id, kind, fmt, as_of)
+        return job_id
+
+    def cancel(self, job_id):
+        """Запрос отмены задания"""
+        with self._lock:
+            cancelled = self._cancelled.get(job_id)
+        if cancelled is not None:
+            cancelled.set()
+        db = SessionLocal()
+        try:
+            job = get_report_job(db, job_id)
+            if job is None:
+                return
+            if job.status == "queued":
+                update_report_job(
+                    db, job_id, status="cancelled", finished_at=datetime.now()
+                )
+            elif job.status == "running":
+                update_report_job(db, job_id, status="cancelling")
+        finally:
+            db.close()
+
+    def cleanup(self):
+        """Удаление заданий и файлов старше JOB_RETENTION_HOURS"""
+        before = datetime.now() - timedelta(hours=JOB_RETENTION_HOURS)
+        db = SessionLocal()
+        try:
+            for job in get_expired_report_jobs(db, before):
+                if job.result_path and os.path.exists(job.result_path):
+                    os.remove(job.result_path)
+                delete_report_job(db, job.id)
+        finally:
+            db.close()
+
+    def _heartbeat(self):
+        """Сигнал по своим незавершенным заданиям и поиск прерванных чужих"""
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            db = SessionLocal()
+            try:
+                db.query(ReportJob).filter(
+                    ReportJob.owner == self.owner,
+                    ReportJob.status.in_(ACTIVE_STATUSES),
+                ).update({ReportJob.heartbeat_at: datetime.now()})
+                db.commit()
+            except Exception as error:
+                logger.warning(f"Сигнал заданий отчетов не записан: {error}")
+            finally:
+                db.close()
+            try:
+                self._fail_orphaned()
+            except Exception as error:
+                logger.warning(f"Прерванные задания отчетов не проверены: {error}")
+
+    def _fail_orphaned(self):
+        now = datetime.now()
+        db = SessionLocal()
+        try:
+            orphaned = db.query(ReportJob).filter(
+                ReportJob.status.in_(ACTIVE_STATUSES),
+                or_(ReportJob.owner.is_(None), ReportJob.owner != self.owner),
+                or_(
+                    ReportJob.heartbeat_at.is_(None),
+                    ReportJob.heartbeat_at
+                    < now - timedelta(seconds=JOB_HEARTBEAT_TIMEOUT),
+                ),
+            )
+            for job in orphaned:
+                job.status = "failed"
+                job.error = "Генерация прервана: процесс приложения остановлен"
+                job.finished_at = now
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self, job_id, kind, fmt, as_of):
+        with self._lock:
+            cancelled = self._cancelled[job_id]
+        status_db = SessionLocal()
+        path = os.path.join(
+            self.report_dir,
+            f"{kind}_{job_id}_{(as_of or datetime.now()):%Y%m%d}"
+            f"{REPORT_FORMATS[fmt][1]}",
+        )
+        last_update = 0.0
+
+        def progress(fraction, message):
+            nonlocal last_update
+            if cancelled.is_set():
+                raise ReportCancelled()
+            now = time.monotonic()
+            if now - last_update < JOB_PROGRESS_INTERVAL:
+                return
+            last_update = now
+            # Отмена могла быть запрошена из другого процесса
+            status_db.expire_all()
+            job = update_report_job(
+                status_db, job_id, progress=fraction, message=message
+            )
+            if job.status == "cancelling":
+                raise ReportCancelled()
+
+        try:
+            job = get_report_job(status_db, job_id)
+            if job is None or job.status != "queued":
+                return
+            update_report_job(
+                status_db, job_id, status="running", started_at=datetime.now()
+            )
+            read_db = ReadSessionLocal()
+            try:
+                # Файл появляется под итоговым именем только целиком
+                rows = build_report(
+                    read_db, kind, path + ".part", fmt, as_of, progress=progress
+                )
+            finally:
+                read_db.close()
+            os.replace(path + ".part", path)
+            update_report_job(
+                status_db,
+                job_id,
+                status="done",
+                progress=1.0,
+                message=f"Строк в отчете: {rows}",
+                result_path=path,
+                rows=rows,
+                finished_at=datetime.now(),
+            )
+        except ReportCancelled:
+            status_db.rollback()
+            update_report_job(
+                status_db, job_id, status="cancelled", finished_at=datetime.now()
+            )
+        except Exception as error:
+            logger.error(f"Отчет {job_id} ({kind}) не сформирован: {error}")
+            status_db.rollback()
+            update_report_job(
+                status_db,
+                job_id,
+                status="failed",
+                error=str(error),
+                finished_at=datetime.now(),
+            )
+        finally:
+            if os.path.exists(path + ".part"):
+                os.remove(path + ".part")
+            with self._lock:
+                self._cancelled.pop(job_id, None)
+            status_db.close()
+
+
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    """Общий для всех сессий пул генерации отчетов (создается при первом вызове)"""
+    global _job_runner
+    with _job_runner_lock:
+        if _job_runner is None:
+            _job_runner = JobRunner()
+        return _job_runner
@@ -1,149 +1,95 @@
+from startup import (
+    import_profile,
+    lazy_module,
+    record_first_run,
+    startup_report,
+    timed_import,
+)
 import streamlit as st
 import pandas as pd
 import os
-from init_db import initialize_database
 from utils import (
-    get_next_procurement_dates,
+    build_procurement_plan,
+    select_procurement_needed,
     get_wear_color,
     get_replacement_type_display,
     calculate_total_parts_needed,
+    calculate_wear_trajectory,
+    configure_logging,
+    wear_trajectory_frame,
 )
-import plotly.express as px
+import tempfile
+import uuid
 from datetime import datetime
-from database import SessionLocal, create_tables, USE_DATABASE
+from database import (
+    SessionLocal,
+    ReadSessionLocal,
+    change_bus,
+    create_tables,
+    USE_DATABASE,
+)
+from wear_engine import load_snapshot, patch_snapshot, upsert_rows
+from write_queue import get_replacement_queue
+from typeahead import TYPEAHEAD_LIMIT, PrefixIndex
+from query_monitor import DEV_MODE, QUERY_BUDGET, begin_rerun, end_rerun
+from replica import record_write, set_write_scope
+from repository import create_repository
 from crud import (
-    create_equipment_model,
-    get_equipment_model,
-    get_all_equipment_models,
-    get_equipment_model_by_name,
-    update_equipment_model,
-    delete_equipment_model,
-    create_equipment,
-    get_equipment_by_vin,
-    get_equipment_by_model,
-    update_equipment,
-    delete_equipment,
-    create_workshop,
-    get_all_workshops,
-    create_spare_part,
-    get_all_spare_parts,
-    create_replacement_record,
-    get_all_replacement_records,
-    get_replacement_records_by_equipment_model,
+    search_records,
+    count_search_results,
+    get_wear_snapshots,
+    get_report_jobs,
 )
 
+# Графики нужны не на всех страницах: plotly импортируется при первом обращении
+px = lazy_module("plotly.express")
+# Выгрузка истории замен - только на странице учета замен
+export = lazy_module("export")
+
 # Настройка страницы
 st.set_page_config(page_title="Журнал запасных частей", page_icon="🔧", layout="wide")
 
-# Инициализация базы данных (только если используется БД)
-if USE_DATABASE:
-    create_tables()
-
-# Инициализация данных в session_state
-if "data_initialized" not in st.session_state:
-    # Инициализируем базу данных начальными данными
-    initialize_database()
 
+@st.cache_resource
+def init_storage():
+    """Настройка логирования, таблицы и индексы БД - один раз на процесс"""
+    configure_logging()
     if USE_DATABASE:
-        db = SessionLocal()
-        try:
-            # Загружаем данные из БД в DataFrames
-            from crud import get_all_equipment_models
-
-            equipment_models = get_all_equipment_models(db)
-            workshops = get_all_workshops(db)
-            spare_parts = get_all_spare_parts(db)
-            replacements = get_all_replacement_records(db)
-
-            st.session_state.equipment_df = pd.DataFrame(
-                [
-                    {
-                        "name": model.name,
-                        "qty_in_fleet": model.qty_in_fleet,
-                    }
-                    for model in equipment_models
-                ]
-            )
-            st.session_state.workshops_df = pd.DataFrame(
-                [{"name": ws.name, "address": ws.address} for ws in workshops]
-            )
-            st.session_state.spare_parts_df = pd.DataFrame(
-                [
-                    {
-                        "name": sp.name,
-                        "useful_life_months": sp.useful_life_months,
-                        "parent_equipment": sp.equipment_model.name,
-                        "qty_per_equipment": sp.qty_per_equipment,
-                        "qty_in_stock": sp.qty_in_stock,
-                        "procurement_time_days": sp.procurement_time_days,
-                    }
-                    for sp in spare_parts
-                ]
-            )
-            st.session_state.replacements_df = pd.DataFrame(
-                [
-                    {
-                        "equipment_vin": rr.equipment.vin,
-                        "equipment_model": rr.equipment.model.name,
-                        "spare_part_name": rr.spare_part.name,
-                        "workshop_name": rr.workshop.name,
-                        "replacement_date": rr.replacement_date,
-                        "replacement_type": rr.replacement_type,
-                        "notes": rr.notes,
-                    }
-                    for rr in replacements
-                ]
-            )
-            st.session_state.data_initialized = True
-        finally:
-            db.close()
-    else:
-        # Для режима без базы данных используем тестовые данные напрямую
-        from models import generate_test_data, create_dataframes
-
-        (
-            equipment_models,
-            equipment_instances,
-            workshops,
-            spare_parts,
-            replacement_records,
-        ) = generate_test_data()
-        equipment_df, workshops_df, spare_parts_df, replacements_df = create_dataframes(
-            equipment_models,
-            equipment_instances,
-            workshops,
-            spare_parts,
-            replacement_records,
-        )
+        create_tables()
+        from precompute import PRECOMPUTE_IN_APP, get_precompute_scheduler
 
-        st.session_state.equipment_df = equipment_df
-        st.session_state.workshops_df = workshops_df
-        st.session_state.spare_parts_df = spare_parts_df
-        st.session_state.replacements_df = replacements_df
-        st.session_state.data_initialized = True
+        # Пересчет износа и плана закупок в таблицы результатов
+        if PRECOMPUTE_IN_APP:
+            get_precompute_scheduler()
 
 
 # Функции для работы с данными
+def update_session_frame(name, rows, columns, values):
+    """
+    Изменение значений таблицы сессии: таблица заменяется новым объектом,
+    как в upsert_rows (кэши по таблицам, например reorder_statistics,
+    сравнивают объекты таблиц)
+    """
+    frame = st.session_state[name].copy()
+    frame.loc[rows, columns] = values
+    st.session_state[name] = frame
+
+
 def add_equipment_model(name, qty_in_fleet):
     """
     Функция добавления модели оборудования.
     name         - Название модели оборудования
     qty_in_fleet - Количество в парке
     """
-    db = SessionLocal()
-    try:
-        model = create_equipment_model(db, name, qty_in_fleet)  # noqa: F841
-        new_row = pd.DataFrame(
-            {
-                "name": [name],
-                "qty_in_fleet": [qty_in_fleet],
-            }
-        )
-        st.session_state.equipment_df = pd.concat(
-            [st.session_state.equipment_df, new_row], ignore_index=True
-        )
-    finally:
-        db.close()
+    model = repository.create_equipment_model(name, qty_in_fleet)
+    new_row = pd.DataFrame(
+        {
+            "name": [name],
+            "qty_in_fleet": [qty_in_fleet],
+        },
+        index=pd.Index([model.id], name="id"),
+    )
+    st.session_state.equipment_df = upsert_rows(st.session_state.equipment_df, new_row)
 
 
 def update_equipment_model_ui(model_name, new_name, new_qty_in_fleet):
@@ -153,22 +99,18 @@ def update_equipment_model_ui(model_name, new_name, new_qty_in_fleet):
     new_name         - Новое название модели
     new_qty_in_fleet - Новое количество в парке
     """
-    db = SessionLocal()
-    try:
-        model = get_equipment_model_by_name(db, model_name)
-        if model:
-            updated_model = update_equipment_model(
-                db, model.id, new_name, new_qty_in_fleet
-            )
-            if updated_model:
-                # Обновляем DataFrame
-                st.session_state.equipment_df.loc[
-                    st.session_state.equipment_df["name"] == model_name,
-                    ["name", "qty_in_fleet"],
-                ] = [new_name, new_qty_in_fleet]
-                return True
-    finally:
-        db.close()
+    model = repository.get_equipment_model_by_name(model_name)
+    if model and repository.update_equipment_model(
+        model.id, new_name, new_qty_in_fleet
+    ):
+        # Обновляем DataFrame
+        update_session_frame(
+            "equipment_df",
+            st.session_state.equipment_df["name"] == model_name,
+            ["name", "qty_in_fleet"],
+            [new_name, new_qty_in_fleet],
+        )
+        return True
     return False
 
 
@@ -177,18 +119,13 @@ def delete_equipment_model_ui(model_name):
     Функция удаления модели оборудования.
     model_name - Название модели для удаления
     """
-    db = SessionLocal()
-    try:
-        model = get_equipment_model_by_name(db, model_name)
-        if model:
-            if delete_equipment_model(db, model.id):
-                # Удаляем из DataFrame
-                st.session_state.equipment_df = st.session_state.equipment_df[
-                    st.session_state.equipment_df["name"] != model_name
-                ].reset_index(drop=True)
-                return True
-    finally:
-        db.close()
+    model = repository.get_equipment_model_by_name(model_name)
+    if model and repository.delete_equipment_model(model.id):
+        # Удаляем из DataFrame
+        st.session_state.equipment_df = st.session_state.equipment_df[
+            st.session_state.equipment_df["name"] != model_name
+        ]
+        return True
     return False
 
 
@@ -198,20 +135,19 @@ def add_equipment_instance(model_name, vin):
     model_name - Название модели
     vin        - VIN номер
     """
-    db = SessionLocal()
-    try:
-        model = get_equipment_model_by_name(db, model_name)
-        if model:
-            equipment = create_equipment(db, model.id, vin)  # noqa: F841
-            # Обновляем qty_in_fleet в модели
-            update_equipment_model(db, model.id, qty_in_fleet=model.qty_in_fleet + 1)
-            # Обновляем DataFrame
-            st.session_state.equipment_df.loc[
-                st.session_state.equipment_df["name"] == model_name, "qty_in_fleet"
-            ] = (model.qty_in_fleet + 1)
-            return True
-    finally:
-        db.close()
+    model = repository.get_equipment_model_by_name(model_name)
+    if model:
+        repository.create_equipment(model.id, vin)
+        # Обновляем qty_in_fleet в модели
+        repository.update_equipment_model(model.id, qty_in_fleet=model.qty_in_fleet + 1)
+        # Обновляем DataFrame
+        update_session_frame(
+            "equipment_df",
+            st.session_state.equipment_df["name"] == model_name,
+            "qty_in_fleet",
+            model.qty_in_fleet + 1,
+        )
+        return True
     return False
 
 
@@ -222,19 +158,13 @@ def update_equipment_instance(old_vin, new_vin, new_model_name):
     new_vin       - Новый VIN
     new_model_name - Новое название модели
     """
-    db = SessionLocal()
-    try:
-        equipment = get_equipment_by_vin(db, old_vin)
-        if equipment:
-            new_model = get_equipment_model_by_name(db, new_model_name)
-            if new_model:
-                updated_equipment = update_equipment(
-                    db, equipment.id, new_vin, new_model.id
-                )
-                if updated_equipment:
-                    return True
-    finally:
-        db.close()
+    equipment = repository.get_equipment_by_vin(old_vin)
+    if equipment:
+        new_model = repository.get_equipment_model_by_name(new_model_name)
+        if new_model and repository.update_equipment(
+            equipment.id, new_vin, new_model.id
+        ):
+            return True
     return False
 
 
@@ -243,42 +173,51 @@ def delete_equipment_instance(vin):
     Функция удаления экземпляра оборудования.
     vin - VIN номер для удаления
     """
-    db = SessionLocal()
-    try:
-        equipment = get_equipment_by_vin(db, vin)
-        if equipment:
-            # Получаем модель для обновления счетчика
-            model = get_equipment_model(db, equipment.model_id)
-            if delete_equipment(db, equipment.id) and model:
-                # Обновляем qty_in_fleet
-                update_equipment_model(
-                    db, model.id, qty_in_fleet=model.qty_in_fleet - 1
-                )
-                # Обновляем DataFrame
-                st.session_state.equipment_df.loc[
-                    st.session_state.equipment_df["name"] == model.name, "qty_in_fleet"
-                ] = (model.qty_in_fleet - 1)
-                return True
-    finally:
-        db.close()
+    equipment = repository.get_equipment_by_vin(vin)
+    if equipment:
+        # Получаем модель для обновления счетчика
+        model = repository.get_equipment_model(equipment.model_id)
+        if repository.delete_equipment(equipment.id) and model:
+            # Обновляем qty_in_fleet
+            repository.update_equipment_model(
+                model.id, qty_in_fleet=model.qty_in_fleet - 1
+            )
+            # Обновляем DataFrame
+            update_session_frame(
+                "equipment_df",
+                st.session_state.equipment_df["name"] == model.name,
+                "qty_in_fleet",
+                model.qty_in_fleet - 1,
+            )
+            return True
     return False
 
 
-def add_workshop(name, address):
+def add_workshop(name, address, daily_capacity=None):
     """
     Функция добавления Мастерской.
-    name    - Название Мастерской
-    address - Адрес Мастерской
+    name           - Название Мастерской
+    address        - Адрес Мастерской
+    daily_capacity - Плановых замен в рабочий день
     """
-    db = SessionLocal()
-    try:
-        ws = create_workshop(db, name, address)  # noqa: F841
-        new_row = pd.DataFrame({"name": [name], "address": [address]})
-        st.session_state.workshops_df = pd.concat(
-            [st.session_state.workshops_df, new_row], ignore_index=True
-        )
-    finally:
-        db.close()
+    ws = repository.create_workshop(name, address, daily_capacity)
+    new_row = pd.DataFrame(
+        {
+            "name": [name],
+            "address": [address],
+            "daily_capacity": [daily_capacity],
+        },
+        index=pd.Index([ws.id], name="id"),
+    )
+    st.session_state.workshops_df = upsert_rows(st.session_state.workshops_df, new_row)
+
+
+def update_workshop_capacity(name, daily_capacity):
+    """Изменение дневной мощности мастерской"""
+    workshops_df = st.session_state.workshops_df
+    workshop_id = workshops_df.index[workshops_df["name"] == name][0]
+    repository.update_workshop(int(workshop_id), daily_capacity=daily_capacity)
+    update_session_frame("workshops_df", workshop_id, "daily_capacity", daily_capacity)
 
 
 def add_spare_part(
@@ -298,34 +237,30 @@ def add_spare_part(
     qty_in_stock            - Текущее количество на складе
     procurement_time_days   - Срок закупки запчасти (дни)
     """
-    db = SessionLocal()
-    try:
-        eq_model = get_equipment_model_by_name(db, parent_equipment)
-        if eq_model:
-            sp = create_spare_part(  # noqa: F841
-                db,
-                name,
-                useful_life_months,
-                eq_model.id,
-                qty_per_equipment,
-                qty_in_stock,
-                procurement_time_days,
-            )
-            new_row = pd.DataFrame(
-                {
-                    "name": [name],
-                    "useful_life_months": [useful_life_months],
-                    "parent_equipment": [parent_equipment],
-                    "qty_per_equipment": [qty_per_equipment],
-                    "qty_in_stock": [qty_in_stock],
-                    "procurement_time_days": [procurement_time_days],
-                }
-            )
-            st.session_state.spare_parts_df = pd.concat(
-                [st.session_state.spare_parts_df, new_row], ignore_index=True
-            )
-    finally:
-        db.close()
+    eq_model = repository.get_equipment_model_by_name(parent_equipment)
+    if eq_model:
+        sp = repository.create_spare_part(
+            name,
+            useful_life_months,
+            eq_model.id,
+            qty_per_equipment,
+            qty_in_stock,
+            procurement_time_days,
+        )
+        new_row = pd.DataFrame(
+            {
+                "name": [name],
+                "useful_life_months": [useful_life_months],
+                "parent_equipment": [parent_equipment],
+                "qty_per_equipment": [qty_per_equipment],
+                "qty_in_stock": [qty_in_stock],
+                "procurement_time_days": [procurement_time_days],
+            },
+            index=pd.Index([sp.id], name="id"),
+        )
+        st.session_state.spare_parts_df = upsert_rows(
+            st.session_state.spare_parts_df, new_row
+        )
 
 
 def add_replacement(
@@ -345,693 +280,1279 @@ def add_replacement(
     replacement_type        - Тип замены - (repair-замена/scheduled-запланированная/unscheduled-незапланированная)
     notes                   - Примечания
     """
+    row = {
+        "equipment_vin": equipment_vin,
+        "spare_part_name": spare_part_name,
+        "workshop_name": workshop_name,
+        "replacement_date": replacement_date,
+        "replacement_type": replacement_type,
+        "notes": notes,
+    }
+    if USE_DATABASE:
+        # Запись - в фоновом потоке пачками; результат придет в Future
+        future = get_replacement_queue(SessionLocal).submit(row)
+        st.session_state.setdefault("pending_replacements", []).append(future)
+        return
+
+    # В памяти запись сохраняется сразу и получает id, как при записи в БД
+    ref = repository.resolve_replacement_refs([row])[0]
+    if ref is None:
+        st.toast(
+            f"Замена не сохранена: не найдены оборудование {equipment_vin}, "
+            f"запчасть '{spare_part_name}' или мастерская '{workshop_name}'",
+            icon="⚠️",
+        )
+        return
+    row["id"] = repository.create_replacement_record(
+        ref["equipment_id"],
+        ref["spare_part_id"],
+        ref["workshop_id"],
+        replacement_date,
+        replacement_type,
+        notes,
+    )
+    row["equipment_model"] = ref["equipment_model"]
+    append_replacement_rows([row])
+
+
+def append_replacement_rows(rows):
+    """Добавление строк в replacements_df одной операцией на всю пачку"""
+    if not rows:
+        return
+    # Строка могла уже прийти через шину изменений - обновляем по id
+    st.session_state.replacements_df = upsert_rows(
+        st.session_state.replacements_df, pd.DataFrame(rows).set_index("id")
+    )
+
+
+def apply_remote_changes():
+    """
+    Изменения из шины (в том числе других сессий) с прошлого перезапуска:
+    перечитываются только затронутые строки, при потере событий - все данные
+    """
+    events, overflowed = st.session_state.change_subscription.drain()
+    if not events and not overflowed:
+        return
+    # Заранее рассчитанные результаты старше этого момента сессии не подходят
+    st.session_state.data_changed_at = datetime.now()
+    # Только что записанные строки читаем с основной БД, а не с реплики
     db = SessionLocal()
     try:
-        eq = get_equipment_by_vin(db, equipment_vin)
-        sp = None
-        for sp_obj in get_all_spare_parts(db):
-            if (
-                sp_obj.name == spare_part_name
-                and sp_obj.equipment_model_id == eq.model_id
-            ):
-                sp = sp_obj
-                break
-        ws = None
-        for ws_obj in get_all_workshops(db):
-            if ws_obj.name == workshop_name:
-                ws = ws_obj
-                break
-        if eq and sp and ws:
-            rr = create_replacement_record(  # noqa: F841
-                db, eq.id, sp.id, ws.id, replacement_date, replacement_type, notes
-            )
-            new_row = pd.DataFrame(
-                {
-                    "equipment_vin": [equipment_vin],
-                    "equipment_model": [eq.model.name],
-                    "spare_part_name": [spare_part_name],
-                    "workshop_name": [workshop_name],
-                    "replacement_date": [replacement_date],
-                    "replacement_type": [replacement_type],
-                    "notes": [notes],
-                }
-            )
-            st.session_state.replacements_df = pd.concat(
-                [st.session_state.replacements_df, new_row], ignore_index=True
+        snapshot = (
+            load_snapshot(db)
+            if overflowed
+            else patch_snapshot(
+                db,
+                (
+                    st.session_state.equipment_df,
+                    st.session_state.workshops_df,
+                    st.session_state.spare_parts_df,
+                    st.session_state.replacements_df,
+                ),
+                events,
             )
+        )
+    finally:
+        db.close()
+    (
+        st.session_state.equipment_df,
+        st.session_state.workshops_df,
+        st.session_state.spare_parts_df,
+        st.session_state.replacements_df,
+    ) = snapshot
+
+
+def collect_replacement_acks():
+    """
+    Подтверждения и ошибки отложенной записи замен этой сессии:
+    сохраненные строки добавляются в replacements_df, об ошибках - уведомление.
+    """
+    pending, done = [], []
+    for future in st.session_state.get("pending_replacements", []):
+        (done if future.done() else pending).append(future)
+    if not done:
+        return
+    st.session_state.pending_replacements = pending
+    rows = []
+    for future in done:
+        error = future.exception()
+        if error is None:
+            rows.append(future.result())
+        else:
+            st.toast(f"Замена не сохранена: {error}", icon="⚠️")
+    append_replacement_rows(rows)
+    if rows:
+        # Замены записал поток очереди: следующие чтения этой сессии -
+        # с основной БД, пока реплика может отставать
+        record_write()
+        st.toast(f"Сохранено замен: {len(rows)}", icon="✅")
+
+
+@st.fragment(run_every=1)
+def pending_replacements_status():
+    """Ожидание подтверждений записи: перезапуск страницы, когда они пришли"""
+    pending = st.session_state.get("pending_replacements", [])
+    if any(future.done() for future in pending):
+        st.rerun()
+    if pending:
+        st.caption(f"⏳ Сохраняется замен: {len(pending)}")
+
+
+WEAR_EVENT_LABELS = {
+    "yellow": "🟡 переход в желтую зону",
+    "red": "🔴 переход в красную зону",
+    "deadline": "📅 крайний срок закупки",
+}
+
+SCHEDULE_STATUS_LABELS = {
+    "planned": "✅ в срок",
+    "late": "⚠️ позже срока",
+    "unscheduled": "❌ нет мощности",
+}
+
+REPORT_STATUS_LABELS = {
+    "queued": "⏳ в очереди",
+    "running": "⚙️ формируется",
+    "cancelling": "⏹️ отменяется",
+    "cancelled": "⏹️ отменен",
+    "done": "✅ готов",
+    "failed": "❌ ошибка",
+}
+
+
+def report_jobs_list(kind):
+    """Задания генерации отчета: прогресс, отмена, скачивание готовых файлов"""
+    from jobs import ACTIVE_STATUSES, get_job_runner
+    from reports import REPORT_FORMATS
+
+    # Статусы - с основной БД: реплика может отставать от записи прогресса
+    db = SessionLocal()
+    try:
+        jobs = get_report_jobs(db, kind, limit=10)
     finally:
         db.close()
+    active = any(job.status in ACTIVE_STATUSES for job in jobs)
+    if st.session_state.get(f"report_jobs_active_{kind}") and not active:
+        # Все задания завершены - перезапуск страницы без автообновления
+        st.session_state[f"report_jobs_active_{kind}"] = False
+        st.rerun()
+    st.session_state[f"report_jobs_active_{kind}"] = active
+    for job in jobs:
+        st.markdown(
+            f"**№{job.id}** от {job.created_at:%d.%m.%Y %H:%M} — "
+            f"{REPORT_STATUS_LABELS.get(job.status, job.status)}"
+        )
+        if job.status in ACTIVE_STATUSES:
+            col_progress, col_cancel = st.columns([4, 1])
+            with col_progress:
+                st.progress(job.progress or 0.0, text=job.message or "")
+            with col_cancel:
+                if job.status != "cancelling" and st.button(
+                    "Отменить", key=f"report_cancel_{job.id}"
+                ):
+                    get_job_runner().cancel(job.id)
+                    st.rerun(scope="fragment")
+        elif job.status == "done" and os.path.exists(job.result_path):
+            content_type, _ = REPORT_FORMATS[job.format]
+            st.caption(job.message)
+            with open(job.result_path, "rb") as file:
+                st.download_button(
+                    "Скачать",
+                    file,
+                    file_name=os.path.basename(job.result_path),
+                    mime=content_type,
+                    key=f"report_download_{job.id}",
+                )
+        elif job.status == "failed":
+            st.caption(job.error)
 
 
-# Навигация
-st.sidebar.title("Навигация")
-page = st.sidebar.radio(
-    "Выберите раздел:",
-    [
-        "Главная",
-        "Справочники",
-        "Учет замен",
-        "Анализ износа",
-        "План закупок",
-        "Визуализации",
-    ],
-)
+def report_jobs_panel(kind, as_of=None):
+    """Фоновая генерация отчета по всему парку (страница не блокируется)"""
+    from jobs import ACTIVE_STATUSES, JOB_RETENTION_HOURS, get_job_runner
 
-# Главная страница
-if page == "Главная":
-    st.title("🔧 Журнал запасных частей")
-    st.markdown(
-        """
-    Добро пожаловать в систему учета запасных частей!
+    st.caption(
+        "Отчет формируется в фоне по всему парку из базы данных, "
+        f"готовые файлы хранятся {JOB_RETENTION_HOURS:g} ч."
+    )
+    if st.button("Сформировать отчет (XLSX)", key=f"report_submit_{kind}"):
+        get_job_runner().submit(kind, as_of=as_of)
+        st.session_state[f"report_jobs_active_{kind}"] = True
+    if f"report_jobs_active_{kind}" not in st.session_state:
+        # Задания, запущенные до открытия страницы (в том числе другими сессиями)
+        db = SessionLocal()
+        try:
+            st.session_state[f"report_jobs_active_{kind}"] = any(
+                job.status in ACTIVE_STATUSES for job in get_report_jobs(db, kind)
+            )
+        finally:
+            db.close()
+    # Автообновление списка - только пока есть незавершенные задания
+    run_every = 2 if st.session_state[f"report_jobs_active_{kind}"] else None
+    st.fragment(run_every=run_every)(report_jobs_list)(kind)
+
+
+def precomputed_results(kind):
+    """
+    Износ ('wear') или план закупок ('plan') из таблиц результатов
+    (precompute.py) и момент расчета; None - результаты устарели, считаем сами
+    """
+    from precompute import load_precomputed
 
-    **Функционал системы:**
-    - 📋 Управление справочниками (оборудование, запчасти, мастерские)
-    - 🔄 Учет замен запчастей
-    - 📊 Анализ степени износа с цветовой индикацией
-    - 📅 Формирование плана закупок
-    - 📈 Визуализация данных
+    db = ReadSessionLocal()
+    try:
+        return load_precomputed(
+            db, kind, changed_after=st.session_state.get("data_changed_at")
+        )
+    finally:
+        db.close()
 
-    Выберите раздел в боковой панели для начала работы.
+
+def reorder_statistics():
+    """
+    Статистика спроса для точки заказа: пересчитывается только при замене
+    таблиц в сессии (изменения таблиц всегда создают новый объект -
+    upsert_rows, update_session_frame), поэтому слайдер уровня сервиса
+    пересчитывает лишь reorder_points
     """
+    from reorder import demand_statistics
+
+    frames = (
+        st.session_state.equipment_df,
+        st.session_state.spare_parts_df,
+        st.session_state.replacements_df,
     )
+    cached = st.session_state.get("reorder_statistics")
+    if cached is None or any(old is not new for old, new in zip(cached[0], frames)):
+        cached = (frames, demand_statistics(*frames))
+        st.session_state.reorder_statistics = cached
+    return cached[1]
 
-    # Краткая статистика в Footer-е
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        st.metric("Оборудование", len(st.session_state.equipment_df))
-    with col2:
-        st.metric("Запчасти", len(st.session_state.spare_parts_df))
-    with col3:
-        st.metric("Мастерские", len(st.session_state.workshops_df))
-    with col4:
-        st.metric("Замен", len(st.session_state.replacements_df))
 
-# Справочники
-elif page == "Справочники":
-    st.title("📋 Справочники")
+def prefix_index(name, values):
+    """Индекс подсказок по списку значений (перестраивается при изменении списка)"""
+    values = tuple(values)
+    cache = st.session_state.setdefault("prefix_indexes", {})
+    version = hash(values)
+    if name not in cache or cache[name][0] != version:
+        cache[name] = (version, PrefixIndex(values))
+    return cache[name][1]
 
-    tab1, tab2, tab3 = st.tabs(["Оборудование", "Мастерские", "Запчасти"])
 
-    with tab1:
-        st.subheader(":blue[Оборудование]", divider="blue")
-        # st.subheader("Оборудование", divider="blue")
+def model_lookup(prefix):
+    """Подсказки по названию модели оборудования"""
+    return prefix_index("models", st.session_state.equipment_df["name"]).search(prefix)
 
-        # Создаем две колонки
-        col1, col2 = st.columns(2)
 
-        with col1:
-            st.subheader("Список моделей оборудования", divider="grey")
+def part_lookup(model_name):
+    """Подсказки по названию запчасти выбранной модели"""
+    spare_parts_df = st.session_state.spare_parts_df
+    return prefix_index(
+        f"parts:{model_name}",
+        spare_parts_df.loc[spare_parts_df["parent_equipment"] == model_name, "name"],
+    ).search
 
-            # Управление моделями оборудования
-            equipment_display_df = st.session_state.equipment_df.rename(
-                columns={
-                    "name": "Наименование модели",
-                    "qty_in_fleet": "Количество в парке",
-                }
-            )
 
-            # Выбор модели для редактирования/удаления
-            if not equipment_display_df.empty:
-                selected_model_for_edit = st.selectbox(
-                    "Выберите модель для редактирования/удаления:",
-                    equipment_display_df["Наименование модели"].tolist(),
-                    key="model_edit_select",
-                )
+def vin_lookup(model_name):
+    """Подсказки по VIN выбранной модели"""
 
-                col_edit, col_delete = st.columns(2)
-
-                with col_edit:
-                    if st.button("✏️ Редактировать", key="edit_model_btn"):
-                        st.session_state.edit_model_mode = True
-                        st.session_state.selected_model = selected_model_for_edit
-
-                with col_delete:
-                    if st.button("🗑️ Удалить", key="delete_model_btn"):
-                        if delete_equipment_model_ui(selected_model_for_edit):
-                            st.success(f"Модель '{selected_model_for_edit}' удалена!")
-                            st.rerun()
-                        else:
-                            st.error("Ошибка при удалении модели")
-
-                # Форма редактирования модели
-                if (
-                    st.session_state.get("edit_model_mode", False)
-                    and st.session_state.get("selected_model")
-                    == selected_model_for_edit
-                ):
-                    current_data = st.session_state.equipment_df[
-                        st.session_state.equipment_df["name"] == selected_model_for_edit
-                    ].iloc[0]
+    def lookup(prefix):
+        eq_model = repository.get_equipment_model_by_name(model_name)
+        if not eq_model:
+            return []
+        return repository.find_vins_by_prefix(prefix, eq_model.id, TYPEAHEAD_LIMIT)
 
-                    with st.form("edit_equipment_form", width="content"):
-                        st.subheader(
-                            f"Редактирование модели: {selected_model_for_edit}"
-                        )
-                        new_name = st.text_input(
-                            "Наименование модели", value=current_data["name"]
-                        )
-                        new_qty = st.number_input(
-                            "Количество в парке",
-                            min_value=0,
-                            value=int(current_data["qty_in_fleet"]),
-                        )
-                        submitted_edit = st.form_submit_button("Сохранить изменения")
-                        cancel_edit = st.form_submit_button("Отмена")
+    return lookup
 
-                        if submitted_edit and new_name:
-                            if update_equipment_model_ui(
-                                selected_model_for_edit, new_name, new_qty
-                            ):
-                                st.success("Модель обновлена!")
-                                st.session_state.edit_model_mode = False
-                                st.rerun()
-                            else:
-                                st.error("Ошибка при обновлении модели")
-                        elif cancel_edit:
-                            st.session_state.edit_model_mode = False
-                            st.rerun()
-
-                with st.expander("➕ Добавить модель оборудования", width="stretch"):
-                    with st.form("add_equipment_form", width="content"):
-                        name = st.text_input("Наименование модели")
-                        qty_in_fleet = st.number_input(
-                            "Количество в парке", min_value=1, value=1
-                        )
-                        submitted = st.form_submit_button("Добавить")
-                        if submitted and name:
-                            add_equipment_model(name, qty_in_fleet)
-                            st.success("Модель оборудования добавлена!")
-                            st.rerun()
 
-            st.dataframe(equipment_display_df, width="content")
+def typeahead_select(label, lookup, key, default=None):
+    """
+    Выбор значения по первым символам: в выпадающий список попадают только
+    подсказки lookup(prefix), а не весь справочник.
+    Возвращает выбранное значение или None, если совпадений нет.
+    """
+    prefix = st.text_input(
+        label, key=f"{key}_prefix", placeholder="Начните вводить для поиска"
+    )
+    options = lookup(prefix)
+    if default is not None and default not in options:
+        options = [default] + options[: TYPEAHEAD_LIMIT - 1]
+    if not options:
+        st.caption("Нет совпадений")
+        return None
+    return st.selectbox(label, options, key=key, label_visibility="collapsed")
+
+
+# Учет SQL-запросов текущего перезапуска (страница уточняется после навигации);
+# итоги подводятся и при st.stop()/st.rerun() или исключении на странице
+query_stats = begin_rerun()
+# Чтение с реплики после записи - по записям этой сессии, а не всего процесса
+set_write_scope(st.session_state.setdefault("write_scope", uuid.uuid4().hex))
+try:
+    # Инициализация базы данных (только если используется БД)
+    init_storage()
+
+    # Инициализация данных в session_state
+    if "data_initialized" not in st.session_state:
+        # Хранилище сессии: БД или таблицы в памяти (repository.py); пустое
+        # хранилище заполняется тестовыми данными
+        st.session_state.repository = create_repository()
+        timed_import("init_db").initialize_database(st.session_state.repository)
+
+        if USE_DATABASE:
+            # Подписка на изменения, сделанные другими сессиями (до загрузки,
+            # чтобы не пропустить изменения, пришедшие во время нее)
+            st.session_state.change_subscription = change_bus.subscribe()
+        # Загружаем данные в DataFrames (по одному запросу на таблицу)
+        (
+            st.session_state.equipment_df,
+            st.session_state.workshops_df,
+            st.session_state.spare_parts_df,
+            st.session_state.replacements_df,
+        ) = st.session_state.repository.load_snapshot()
+        st.session_state.data_initialized = True
+
+    repository = st.session_state.repository
+
+    # Изменения других сессий и результаты отложенной записи замен,
+    # пришедшие с прошлого перезапуска
+    if USE_DATABASE:
+        apply_remote_changes()
+    collect_replacement_acks()
+
+    # Навигация
+    st.sidebar.title("Навигация")
+    page = st.sidebar.radio(
+        "Выберите раздел:",
+        [
+            "Главная",
+            "Справочники",
+            "Учет замен",
+            "Поиск",
+            "Анализ износа",
+            "План закупок",
+            "Визуализации",
+        ],
+    )
+    query_stats.page = page
+
+    # Главная страница
+    if page == "Главная":
+        st.title("🔧 Журнал запасных частей")
+        st.markdown(
+            """
+        Добро пожаловать в систему учета запасных частей!
+
+        **Функционал системы:**
+        - 📋 Управление справочниками (оборудование, запчасти, мастерские)
+        - 🔄 Учет замен запчастей
+        - 📊 Анализ степени износа с цветовой индикацией
+        - 📅 Формирование плана закупок
+        - 📈 Визуализация данных
+
+        Выберите раздел в боковой панели для начала работы.
+        """
+        )
 
+        # Краткая статистика в Footer-е
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Оборудование", len(st.session_state.equipment_df))
         with col2:
-            st.subheader("Просмотр и редактирование модели", divider="gray")
-            # Выбор модели оборудования для просмотра VIN
-            selected_equipment_model = st.selectbox(
-                "Выберите модель оборудования для просмотра/добавления/редактирования VIN:",
-                st.session_state.equipment_df["name"].tolist(),
-                key="equipment_vin_select",
-            )
+            st.metric("Запчасти", len(st.session_state.spare_parts_df))
+        with col3:
+            st.metric("Мастерские", len(st.session_state.workshops_df))
+        with col4:
+            st.metric("Замен", len(st.session_state.replacements_df))
 
-            if selected_equipment_model:
-                if USE_DATABASE:
-                    db = SessionLocal()
-                    try:
-                        eq_model = get_equipment_model_by_name(
-                            db, selected_equipment_model
-                        )
-                        if eq_model:
-                            equipment_instances = get_equipment_by_model(
-                                db, eq_model.id
-                            )
-                            if equipment_instances:
-                                vin_df = pd.DataFrame(
-                                    [{"VIN": eq.vin} for eq in equipment_instances]
-                                )
-                    finally:
-                        db.close()
-                else:
-                    # Для режима без базы данных получаем VIN из replacements_df
-                    vin_df = pd.DataFrame(
-                        [
-                            {"VIN": vin}
-                            for vin in st.session_state.replacements_df[
-                                st.session_state.replacements_df["equipment_model"]
-                                == selected_equipment_model
-                            ]["equipment_vin"].unique()
-                        ]
-                    )
+    # Справочники
+    elif page == "Справочники":
+        st.title("📋 Справочники")
 
-                # Управление экземплярами оборудования
-                # Выбор VIN для редактирования/удаления
-                if not vin_df.empty:
-                    selected_vin_for_edit = st.selectbox(
-                        "Выберите VIN для редактирования/удаления:",
-                        vin_df["VIN"].tolist(),
-                        key="vin_edit_select",
-                    )
+        tab1, tab2, tab3 = st.tabs(["Оборудование", "Мастерские", "Запчасти"])
 
-                    col_edit_vin, col_delete_vin = st.columns(2, border=True)
+        with tab1:
+            st.subheader(":blue[Оборудование]", divider="blue")
+            # st.subheader("Оборудование", divider="blue")
+
+            # Создаем две колонки
+            col1, col2 = st.columns(2)
+
+            with col1:
+                st.subheader("Список моделей оборудования", divider="grey")
+
+                # Управление моделями оборудования
+                equipment_display_df = st.session_state.equipment_df.rename(
+                    columns={
+                        "name": "Наименование модели",
+                        "qty_in_fleet": "Количество в парке",
+                    }
+                )
 
-                    with col_edit_vin:
-                        if st.button("✏️ Редактировать VIN", key="edit_vin_btn"):
-                            st.session_state.edit_vin_mode = True
-                            st.session_state.selected_vin = selected_vin_for_edit
+                # Выбор модели для редактирования/удаления
+                if not equipment_display_df.empty:
+                    selected_model_for_edit = typeahead_select(
+                        "Выберите модель для редактирования/удаления:",
+                        model_lookup,
+                        key="model_edit_select",
+                    )
 
-                    with col_delete_vin:
-                        if st.button("🗑️ Удалить VIN", key="delete_vin_btn"):
-                            if delete_equipment_instance(selected_vin_for_edit):
-                                st.success(f"VIN '{selected_vin_for_edit}' удален!")
+                    col_edit, col_delete = st.columns(2)
+
+                    with col_edit:
+                        if (
+                            st.button("✏️ Редактировать", key="edit_model_btn")
+                            and selected_model_for_edit
+                        ):
+                            st.session_state.edit_model_mode = True
+                            st.session_state.selected_model = selected_model_for_edit
+
+                    with col_delete:
+                        if (
+                            st.button("🗑️ Удалить", key="delete_model_btn")
+                            and selected_model_for_edit
+                        ):
+                            if delete_equipment_model_ui(selected_model_for_edit):
+                                st.success(
+                                    f"Модель '{selected_model_for_edit}' удалена!"
+                                )
                                 st.rerun()
                             else:
-                                st.error("Ошибка при удалении VIN")
+                                st.error("Ошибка при удалении модели")
 
-                    # Форма редактирования VIN
+                    # Форма редактирования модели
                     if (
-                        st.session_state.get("edit_vin_mode", False)
-                        and st.session_state.get("selected_vin")
-                        == selected_vin_for_edit
+                        st.session_state.get("edit_model_mode", False)
+                        and selected_model_for_edit
+                        and st.session_state.get("selected_model")
+                        == selected_model_for_edit
                     ):
-                        with st.form("edit_vin_form", width="content"):
-                            st.subheader(f"Редактирование VIN: {selected_vin_for_edit}")
-                            new_vin = st.text_input(
-                                "Новый VIN номер",
-                                value=selected_vin_for_edit,
+                        current_data = st.session_state.equipment_df[
+                            st.session_state.equipment_df["name"]
+                            == selected_model_for_edit
+                        ].iloc[0]
+
+                        with st.form("edit_equipment_form", width="content"):
+                            st.subheader(
+                                f"Редактирование модели: {selected_model_for_edit}"
                             )
-                            new_model = st.selectbox(
-                                "Модель оборудования",
-                                st.session_state.equipment_df["name"].tolist(),
-                                index=st.session_state.equipment_df["name"]
-                                .tolist()
-                                .index(selected_equipment_model),
+                            new_name = st.text_input(
+                                "Наименование модели", value=current_data["name"]
                             )
-                            submitted_edit_vin = st.form_submit_button(
+                            new_qty = st.number_input(
+                                "Количество в парке",
+                                min_value=0,
+                                value=int(current_data["qty_in_fleet"]),
+                            )
+                            submitted_edit = st.form_submit_button(
                                 "Сохранить изменения"
                             )
-                            cancel_edit_vin = st.form_submit_button("Отмена")
+                            cancel_edit = st.form_submit_button("Отмена")
 
-                            if submitted_edit_vin and new_vin:
-                                if update_equipment_instance(
-                                    selected_vin_for_edit,
-                                    new_vin,
-                                    new_model,
+                            if submitted_edit and new_name:
+                                if update_equipment_model_ui(
+                                    selected_model_for_edit, new_name, new_qty
                                 ):
-                                    st.success("VIN обновлен!")
-                                    st.session_state.edit_vin_mode = False
+                                    st.success("Модель обновлена!")
+                                    st.session_state.edit_model_mode = False
                                     st.rerun()
                                 else:
-                                    st.error("Ошибка при обновлении VIN")
-                            elif cancel_edit_vin:
-                                st.session_state.edit_vin_mode = False
+                                    st.error("Ошибка при обновлении модели")
+                            elif cancel_edit:
+                                st.session_state.edit_model_mode = False
                                 st.rerun()
 
-                with st.expander("➕ Добавить VIN оборудования", width="stretch"):
-                    with st.form("add_equipment_instance_form", width="content"):
-                        vin_input = st.text_input("VIN номер")
-                        submitted_add = st.form_submit_button("Добавить")
-                        if submitted_add and vin_input:
-                            if add_equipment_instance(
-                                selected_equipment_model, vin_input
-                            ):
-                                st.success("Экземпляр оборудования добавлен!")
+                    with st.expander(
+                        "➕ Добавить модель оборудования", width="stretch"
+                    ):
+                        with st.form("add_equipment_form", width="content"):
+                            name = st.text_input("Наименование модели")
+                            qty_in_fleet = st.number_input(
+                                "Количество в парке", min_value=1, value=1
+                            )
+                            submitted = st.form_submit_button("Добавить")
+                            if submitted and name:
+                                add_equipment_model(name, qty_in_fleet)
+                                st.success("Модель оборудования добавлена!")
                                 st.rerun()
-                            else:
-                                st.error("Ошибка при добавлении экземпляра")
 
-                # st.subheader("VIN-номера", divider="gray")
-                st.dataframe(vin_df, width="content")
-            else:
-                st.info("Выберите модель оборудования для просмотра VIN")
+                st.dataframe(equipment_display_df, width="content")
 
-        st.subheader(
-            "История замен -> Выберите оборудование для просмотра", divider="gray"
-        )
-        # Выбор модели оборудования для просмотра замен (ниже колонок)
-        selected_equipment_model_replacements = st.selectbox(
-            "Выберите модель оборудования для просмотра замен:",
-            st.session_state.equipment_df["name"].tolist(),
-            key="equipment_replacements_select",
-        )
+            with col2:
+                st.subheader("Просмотр и редактирование модели", divider="gray")
+                # Выбор модели оборудования для просмотра VIN
+                selected_equipment_model = typeahead_select(
+                    "Выберите модель оборудования для просмотра/добавления/редактирования VIN:",
+                    model_lookup,
+                    key="equipment_vin_select",
+                )
 
-        if selected_equipment_model_replacements:
-            if USE_DATABASE:
-                db = SessionLocal()
-                try:
-                    eq_model = get_equipment_model_by_name(
-                        db, selected_equipment_model_replacements
+                if selected_equipment_model:
+                    vin_df = pd.DataFrame(columns=["VIN"])
+                    eq_model = repository.get_equipment_model_by_name(
+                        selected_equipment_model
                     )
                     if eq_model:
-                        replacements = get_replacement_records_by_equipment_model(
-                            db, eq_model.id
-                        )
-                        if replacements:
-                            replacements_df = pd.DataFrame(
-                                [
-                                    {
-                                        "VIN": rr.equipment.vin,
-                                        "Дата замены": rr.replacement_date.strftime(
-                                            "%d.%m.%Y"
-                                        ),
-                                        "Запчасть": rr.spare_part.name,
-                                        "Мастерская": rr.workshop.name,
-                                        "Тип замены": get_replacement_type_display(
-                                            rr.replacement_type
-                                        ),
-                                        "Примечания": rr.notes or "",
-                                    }
-                                    for rr in replacements
-                                ]
-                            ).sort_values("Дата замены", ascending=False)
-                            st.subheader(
-                                f"История замен для модели {selected_equipment_model_replacements}"
-                            )
-                            st.dataframe(replacements_df, width="content")
-                        else:
-                            st.info(
-                                f"Для модели оборудования {selected_equipment_model_replacements} нет записей о заменах"
-                            )
-                finally:
-                    db.close()
-            else:
-                # Для режима без базы данных фильтруем replacements_df
-                model_replacements = st.session_state.replacements_df[
-                    st.session_state.replacements_df["equipment_model"]
-                    == selected_equipment_model_replacements
-                ].copy()
-                if not model_replacements.empty:
-                    model_replacements["Дата замены"] = model_replacements[
-                        "replacement_date"
-                    ].dt.strftime("%d.%m.%Y")
-                    model_replacements["Тип замены"] = model_replacements[
-                        "replacement_type"
-                    ].apply(get_replacement_type_display)
-                    model_replacements["Примечания"] = model_replacements[
-                        "notes"
-                    ].fillna("")
-                    replacements_df = (
-                        model_replacements[
+                        vin_df = pd.DataFrame(
                             [
-                                "equipment_vin",
-                                "Дата замены",
-                                "spare_part_name",
-                                "workshop_name",
-                                "Тип замены",
-                                "Примечания",
-                            ]
-                        ]
-                        .rename(
-                            columns={
-                                "equipment_vin": "VIN",
-                                "spare_part_name": "Запчасть",
-                                "workshop_name": "Мастерская",
-                            }
+                                {"VIN": eq.vin}
+                                for eq in repository.get_equipment_by_model(eq_model.id)
+                            ],
+                            columns=["VIN"],
                         )
-                        .sort_values("Дата замены", ascending=False)
-                    )
-                    st.subheader(
-                        f"История замен для модели {selected_equipment_model_replacements}"
-                    )
-                    st.dataframe(replacements_df, width="content")
-                else:
-                    st.info(
-                        f"Для модели оборудования {selected_equipment_model_replacements} нет записей о заменах"
-                    )
 
-    with tab2:
-        st.subheader(":blue[Авторемонтные мастерские]", divider="blue")
-        with st.expander("➕ Добавить мастерскую"):
-            with st.form("add_workshop_form", width="content"):
-                name = st.text_input("Наименование")
-                address = st.text_input("Адрес")
-                submitted = st.form_submit_button("Добавить")
-                if submitted and name and address:
-                    add_workshop(name, address)
-                    st.success("Мастерская добавлена!")
-                    st.rerun()
+                    # Управление экземплярами оборудования
+                    # Выбор VIN для редактирования/удаления
+                    if not vin_df.empty:
+                        selected_vin_for_edit = typeahead_select(
+                            "Выберите VIN для редактирования/удаления:",
+                            vin_lookup(selected_equipment_model),
+                            key="vin_edit_select",
+                        )
 
-        workshops_display_df = st.session_state.workshops_df.rename(
-            columns={
-                "name": "Наименование",
-                "address": "Адрес",
-            }
-        )
-        st.dataframe(workshops_display_df, width="content")
-
-    with tab3:
-        st.subheader(":blue[Запчасти]", divider="blue")
-        with st.expander("➕ Добавить запчасть"):
-            with st.form("add_spare_part_form", width="content"):
-                name = st.text_input("Наименование")
-                useful_life_months = st.number_input(
-                    "Срок полезного использования (месяцы)", min_value=1, value=12
-                )
-                parent_equipment = st.selectbox(
-                    "Родительское оборудование",
-                    st.session_state.equipment_df["name"].tolist(),
-                )
-                qty_per_equipment = st.number_input(
-                    "Количество в единице оборудования", min_value=1, value=1
-                )
-                qty_in_stock = st.number_input(
-                    "Количество на складе", min_value=0, value=0
-                )
-                procurement_time_days = st.number_input(
-                    "Срок закупки (дни)", min_value=1, value=7
-                )
-                submitted = st.form_submit_button("Добавить")
-                if submitted and name:
-                    add_spare_part(
-                        name,
-                        useful_life_months,
-                        parent_equipment,
-                        qty_per_equipment,
-                        qty_in_stock,
-                        procurement_time_days,
-                    )
-                    st.success("Запчасть добавлена!")
-                    st.rerun()
+                        col_edit_vin, col_delete_vin = st.columns(2, border=True)
 
-        spare_parts_display_df = st.session_state.spare_parts_df.rename(
-            columns={
-                "name": "Наименование",
-                "useful_life_months": "Срок службы (месяцы)",
-                "parent_equipment": "Оборудование",
-                "qty_per_equipment": "Кол-во на единицу",
-                "qty_in_stock": "На складе",
-                "procurement_time_days": "Срок закупки (дни)",
-            }
-        )
-        st.dataframe(spare_parts_display_df, width="content")
-
-# Учет замен
-elif page == "Учет замен":
-    st.title("🔄 Учет замен запчастей")
-
-    # Форма добавления замены сразу после заголовка
-    with st.expander("➕ Добавить замену"):
-        with st.form("add_replacement_form", width="content"):
-            # Выбор модели оборудования
-            equipment_model_name = st.selectbox(
-                "Модель оборудования", st.session_state.equipment_df["name"].tolist()
-            )
+                        with col_edit_vin:
+                            if (
+                                st.button("✏️ Редактировать VIN", key="edit_vin_btn")
+                                and selected_vin_for_edit
+                            ):
+                                st.session_state.edit_vin_mode = True
+                                st.session_state.selected_vin = selected_vin_for_edit
+
+                        with col_delete_vin:
+                            if (
+                                st.button("🗑️ Удалить VIN", key="delete_vin_btn")
+                                and selected_vin_for_edit
+                            ):
+                                if delete_equipment_instance(selected_vin_for_edit):
+                                    st.success(f"VIN '{selected_vin_for_edit}' удален!")
+                                    st.rerun()
+                                else:
+                                    st.error("Ошибка при удалении VIN")
+
+                        # Форма редактирования VIN
+                        if (
+                            st.session_state.get("edit_vin_mode", False)
+                            and selected_vin_for_edit
+                            and st.session_state.get("selected_vin")
+                            == selected_vin_for_edit
+                        ):
+                            st.subheader(f"Редактирование VIN: {selected_vin_for_edit}")
+                            # Модель выбирается вне формы, чтобы подсказки обновлялись
+                            new_model = typeahead_select(
+                                "Модель оборудования",
+                                model_lookup,
+                                key="edit_vin_model",
+                                default=selected_equipment_model,
+                            )
+                            with st.form("edit_vin_form", width="content"):
+                                new_vin = st.text_input(
+                                    "Новый VIN номер",
+                                    value=selected_vin_for_edit,
+                                )
+                                submitted_edit_vin = st.form_submit_button(
+                                    "Сохранить изменения"
+                                )
+                                cancel_edit_vin = st.form_submit_button("Отмена")
+
+                                if submitted_edit_vin and new_vin and new_model:
+                                    if update_equipment_instance(
+                                        selected_vin_for_edit,
+                                        new_vin,
+                                        new_model,
+                                    ):
+                                        st.success("VIN обновлен!")
+                                        st.session_state.edit_vin_mode = False
+                                        st.rerun()
+                                    else:
+                                        st.error("Ошибка при обновлении VIN")
+                                elif cancel_edit_vin:
+                                    st.session_state.edit_vin_mode = False
+                                    st.rerun()
+
+                    with st.expander("➕ Добавить VIN оборудования", width="stretch"):
+                        with st.form("add_equipment_instance_form", width="content"):
+                            vin_input = st.text_input("VIN номер")
+                            submitted_add = st.form_submit_button("Добавить")
+                            if submitted_add and vin_input:
+                                if add_equipment_instance(
+                                    selected_equipment_model, vin_input
+                                ):
+                                    st.success("Экземпляр оборудования добавлен!")
+                                    st.rerun()
+                                else:
+                                    st.error("Ошибка при добавлении экземпляра")
+
+                    # st.subheader("VIN-номера", divider="gray")
+                    st.dataframe(vin_df, width="content")
+                else:
+                    st.info("Выберите модель оборудования для просмотра VIN")
+
+            st.subheader(
+                "История замен -> Выберите оборудование для просмотра", divider="gray"
+            )
+            # Выбор модели оборудования для просмотра замен (ниже колонок)
+            selected_equipment_model_replacements = typeahead_select(
+                "Выберите модель оборудования для просмотра замен:",
+                model_lookup,
+                key="equipment_replacements_select",
+            )
+
+            if selected_equipment_model_replacements:
+                eq_model = repository.get_equipment_model_by_name(
+                    selected_equipment_model_replacements
+                )
+                # Записи уже отсортированы: новые сверху
+                replacements = (
+                    repository.get_replacement_records_by_equipment_model(eq_model.id)
+                    if eq_model
+                    else []
+                )
+                if replacements:
+                    replacements_df = pd.DataFrame(
+                        [
+                            {
+                                "VIN": rr.equipment_vin,
+                                "Дата замены": rr.replacement_date.strftime("%d.%m.%Y"),
+                                "Запчасть": rr.spare_part_name,
+                                "Мастерская": rr.workshop_name,
+                                "Тип замены": get_replacement_type_display(
+                                    rr.replacement_type
+                                ),
+                                "Примечания": rr.notes or "",
+                            }
+                            for rr in replacements
+                        ]
+                    )
+                    st.subheader(
+                        f"История замен для модели {selected_equipment_model_replacements}"
+                    )
+                    st.dataframe(replacements_df, width="content")
+                else:
+                    st.info(
+                        f"Для модели оборудования {selected_equipment_model_replacements} нет записей о заменах"
+                    )
 
-            # Получаем список VIN для выбранной модели
+        with tab2:
+            st.subheader(":blue[Авторемонтные мастерские]", divider="blue")
+            with st.expander("➕ Добавить мастерскую"):
+                with st.form("add_workshop_form", width="content"):
+                    name = st.text_input("Наименование")
+                    address = st.text_input("Адрес")
+                    daily_capacity = st.number_input(
+                        "Плановых замен в рабочий день", min_value=0, value=4
+                    )
+                    submitted = st.form_submit_button("Добавить")
+                    if submitted and name and address:
+                        add_workshop(name, address, int(daily_capacity))
+                        st.success("Мастерская добавлена!")
+                        st.rerun()
+            if USE_DATABASE and not st.session_state.workshops_df.empty:
+                with st.expander("🛠️ Мощность мастерской"):
+                    from scheduling import WORKSHOP_DAILY_CAPACITY
+
+                    workshops_df = st.session_state.workshops_df
+                    capacity_workshop = st.selectbox(
+                        "Мастерская", workshops_df["name"].tolist()
+                    )
+                    # Текущая мощность выбранной мастерской (или значение по умолчанию)
+                    stored_capacity = workshops_df.loc[
+                        workshops_df["name"] == capacity_workshop, "daily_capacity"
+                    ].iloc[0]
+                    with st.form("workshop_capacity_form", width="content"):
+                        new_capacity = st.number_input(
+                            "Плановых замен в рабочий день",
+                            min_value=0,
+                            value=(
+                                int(stored_capacity)
+                                if pd.notna(stored_capacity)
+                                else WORKSHOP_DAILY_CAPACITY
+                            ),
+                            key=f"workshop_capacity_{capacity_workshop}",
+                        )
+                        if st.form_submit_button("Сохранить"):
+                            update_workshop_capacity(
+                                capacity_workshop, int(new_capacity)
+                            )
+                            st.success(
+                                "Мощность сохранена. Расписание замен пересчитается "
+                                "полностью кнопкой на странице плана закупок"
+                            )
+
+            workshops_display_df = st.session_state.workshops_df.rename(
+                columns={
+                    "name": "Наименование",
+                    "address": "Адрес",
+                    "daily_capacity": "Замен в день",
+                }
+            )
+            st.dataframe(workshops_display_df, width="content")
+
+        with tab3:
+            st.subheader(":blue[Запчасти]", divider="blue")
+            with st.expander("➕ Добавить запчасть"):
+                parent_equipment = typeahead_select(
+                    "Родительское оборудование", model_lookup, key="spare_part_parent"
+                )
+                with st.form("add_spare_part_form", width="content"):
+                    name = st.text_input("Наименование")
+                    useful_life_months = st.number_input(
+                        "Срок полезного использования (месяцы)", min_value=1, value=12
+                    )
+                    qty_per_equipment = st.number_input(
+                        "Количество в единице оборудования", min_value=1, value=1
+                    )
+                    qty_in_stock = st.number_input(
+                        "Количество на складе", min_value=0, value=0
+                    )
+                    procurement_time_days = st.number_input(
+                        "Срок закупки (дни)", min_value=1, value=7
+                    )
+                    submitted = st.form_submit_button("Добавить")
+                    if submitted and name and parent_equipment:
+                        add_spare_part(
+                            name,
+                            useful_life_months,
+                            parent_equipment,
+                            qty_per_equipment,
+                            qty_in_stock,
+                            procurement_time_days,
+                        )
+                        st.success("Запчасть добавлена!")
+                        st.rerun()
+
+            spare_parts_catalog_df = st.session_state.spare_parts_df
             if USE_DATABASE:
-                db = SessionLocal()
-                vin_options = []
+                # Фактический срок службы по истории замен (пересчитывается фоновым
+                # пересчетом только для VIN с изменившейся историей)
+                from service_life import get_service_life_frame
+
+                db = ReadSessionLocal()
                 try:
-                    eq_model = get_equipment_model_by_name(db, equipment_model_name)
-                    if eq_model:
-                        equipment_instances = get_equipment_by_model(db, eq_model.id)
-                        vin_options = [eq.vin for eq in equipment_instances]
+                    service_life_df = get_service_life_frame(db)
                 finally:
                     db.close()
-            else:
-                # Для режима без базы данных получаем VIN из replacements_df
-                vin_options = (
-                    st.session_state.replacements_df[
-                        st.session_state.replacements_df["equipment_model"]
-                        == equipment_model_name
-                    ]["equipment_vin"]
-                    .unique()
-                    .tolist()
+                spare_parts_catalog_df = spare_parts_catalog_df.merge(
+                    service_life_df.drop(columns="useful_life_months"),
+                    on=["name", "parent_equipment"],
+                    how="left",
                 )
 
-            if vin_options:
-                equipment_vin = st.selectbox("VIN номер оборудования", vin_options)
-            else:
-                st.error("Для выбранной модели нет экземпляров оборудования")
-                equipment_vin = None
-
-            # Фильтруем запчасти по выбранной модели оборудования
-            suitable_parts = st.session_state.spare_parts_df[
-                st.session_state.spare_parts_df["parent_equipment"]
-                == equipment_model_name
-            ]["name"].tolist()
-            spare_part_name = st.selectbox(
-                "Запчасть",
-                suitable_parts if suitable_parts else ["Нет подходящих запчастей"],
-            )
-            workshop_name = st.selectbox(
-                "Мастерская", st.session_state.workshops_df["name"].tolist()
+            spare_parts_display_df = spare_parts_catalog_df.rename(
+                columns={
+                    "name": "Наименование",
+                    "useful_life_months": "Срок службы (месяцы)",
+                    "parent_equipment": "Оборудование",
+                    "qty_per_equipment": "Кол-во на единицу",
+                    "qty_in_stock": "На складе",
+                    "procurement_time_days": "Срок закупки (дни)",
+                    "median_months": "Факт. срок, медиана (мес.)",
+                    "p10_months": "Факт. срок, P10 (мес.)",
+                    "p90_months": "Факт. срок, P90 (мес.)",
+                    "n_intervals": "Интервалов в истории",
+                    "unscheduled_share": "Доля внеплановых",
+                }
             )
-            replacement_date = st.date_input("Дата замены", datetime.now().date())
-            replacement_type = st.selectbox(
-                "Тип замены",
-                ["repair", "scheduled", "unscheduled"],
-                format_func=get_replacement_type_display,
+            st.dataframe(spare_parts_display_df, width="content")
+
+    # Учет замен
+    elif page == "Учет замен":
+        st.title("🔄 Учет замен запчастей")
+        if USE_DATABASE:
+            pending_replacements_status()
+
+        # Форма добавления замены сразу после заголовка
+        with st.expander("➕ Добавить замену"):
+            # Модель, VIN и запчасть выбираются по подсказкам вне формы, чтобы
+            # список VIN и запчастей обновлялся при смене модели
+            equipment_model_name = typeahead_select(
+                "Модель оборудования", model_lookup, key="replacement_model"
             )
-            notes = st.text_area("Примечания", height=100)
-            submitted = st.form_submit_button("Добавить")
-            if (
-                submitted
-                and equipment_vin
-                and spare_part_name != "Нет подходящих запчастей"
-            ):
-                add_replacement(
-                    equipment_vin,
-                    spare_part_name,
-                    workshop_name,
-                    pd.to_datetime(replacement_date),
-                    replacement_type,
-                    notes,
+            equipment_vin = None
+            spare_part_name = None
+            if equipment_model_name:
+                equipment_vin = typeahead_select(
+                    "VIN номер оборудования",
+                    vin_lookup(equipment_model_name),
+                    key="replacement_vin",
+                )
+                spare_part_name = typeahead_select(
+                    "Запчасть",
+                    part_lookup(equipment_model_name),
+                    key="replacement_part",
                 )
-                st.success("Замена добавлена!")
-                st.rerun()
-
-    # Таблица замен
-    replacements_display_df = st.session_state.replacements_df.rename(
-        columns={
-            "equipment_vin": "VIN оборудования",
-            "equipment_model": "Модель оборудования",
-            "spare_part_name": "Запчасть",
-            "workshop_name": "Мастерская",
-            "replacement_date": "Дата замены",
-            "replacement_type": "Тип замены",
-            "notes": "Примечания",
-        }
-    )
-    st.dataframe(replacements_display_df, width="content")
-
-# Анализ износа
-elif page == "Анализ износа":
-    st.title("📊 Анализ степени износа")
 
-    # Расчет данных об износе
-    wear_data = calculate_total_parts_needed(
-        st.session_state.equipment_df,
-        st.session_state.spare_parts_df,
-        st.session_state.replacements_df,
-    )
+            with st.form("add_replacement_form", width="content"):
+                workshop_name = st.selectbox(
+                    "Мастерская", st.session_state.workshops_df["name"].tolist()
+                )
+                replacement_date = st.date_input("Дата замены", datetime.now().date())
+                replacement_type = st.selectbox(
+                    "Тип замены",
+                    ["repair", "scheduled", "unscheduled"],
+                    format_func=get_replacement_type_display,
+                )
+                notes = st.text_area("Примечания", height=100)
+                submitted = st.form_submit_button("Добавить")
+                if submitted and equipment_vin and spare_part_name:
+                    add_replacement(
+                        equipment_vin,
+                        spare_part_name,
+                        workshop_name,
+                        pd.to_datetime(replacement_date),
+                        replacement_type,
+                        notes,
+                    )
+                    st.success(
+                        "Замена принята к записи"
+                        if USE_DATABASE
+                        else "Замена добавлена!"
+                    )
+                    st.rerun()
 
-    if not wear_data.empty:
-        # Группировка по степени износа
-        wear_summary = wear_data.groupby("wear_level").size().reset_index(name="count")
-        st.subheader("Сводка по степени износа")
-        for _, row in wear_summary.iterrows():
-            color = get_wear_color(row["wear_level"])
-            if row["wear_level"] == "green":
-                description = "осталось более 25% от срока полезной эксплуатации"
-            elif row["wear_level"] == "yellow":
-                description = "осталось менее 25% от срока полезной эксплуатации"
-            elif row["wear_level"] == "red":
-                description = "осталось менее 10% от срока полезной эксплуатации"
-            else:
-                description = ""
-            st.markdown(
-                f"""
-            <div style="background-color: {color}; padding: 10px; margin: 5px 0; border-radius: 5px; color: white; display: inline-block; width: auto;">
-                <strong>{row['wear_level'].upper()}</strong>: {row['count']} запчастей ({description})
-            </div>
-            """,
-                unsafe_allow_html=True,
+        # Выгрузка истории замен (потоково, пачками)
+        with st.expander("📤 Выгрузка истории замен"):
+            export_model = typeahead_select(
+                "Модель оборудования", model_lookup, key="export_model"
             )
+            export_vin = (
+                typeahead_select("VIN", vin_lookup(export_model), key="export_vin")
+                if export_model
+                else None
+            )
+            export_workshop = st.selectbox(
+                "Мастерская",
+                ["Все"] + st.session_state.workshops_df["name"].tolist(),
+                key="export_workshop",
+            )
+            export_dates = st.date_input("Период замен", [], key="export_dates")
+            export_format = st.radio(
+                "Формат",
+                list(export.EXPORT_FORMATS),
+                horizontal=True,
+                key="export_format",
+            )
+            filters = {
+                "model": export_model,
+                "vin": export_vin,
+                "workshop": None if export_workshop == "Все" else export_workshop,
+                "date_from": export_dates[0] if len(export_dates) > 0 else None,
+                "date_to": export_dates[1] if len(export_dates) > 1 else None,
+            }
+            content_type, extension = export.EXPORT_FORMATS[export_format]
+            if st.button("Подготовить файл", key="export_btn"):
+                # Файл пишется пачками во временный файл (из БД - серверным
+                # курсором, без БД - из replacements_df сессии), затем
+                # передается кнопкой скачивания; временный файл не остается
+                fd, path = tempfile.mkstemp(suffix=extension)
+                os.close(fd)
+                try:
+                    if USE_DATABASE:
+                        db = ReadSessionLocal()
+                        try:
+                            rows = export.export_history(
+                                db, path, export_format, **filters
+                            )
+                        finally:
+                            db.close()
+                    else:
+                        rows = export.WRITERS[export_format](
+                            export.iter_frame_chunks(
+                                export.filter_replacements_frame(
+                                    st.session_state.replacements_df, **filters
+                                )
+                            ),
+                            path,
+                        )
+                    with open(path, "rb") as file:
+                        data = file.read()
+                finally:
+                    os.remove(path)
+                st.caption(f"Строк в файле: {rows}")
+                st.download_button(
+                    "Скачать",
+                    data,
+                    file_name=f"replacements{extension}",
+                    mime=content_type,
+                    key="export_download",
+                )
 
-        # Круговая диаграмма
-        fig = px.pie(
-            wear_summary,
-            values="count",
-            names="wear_level",
-            labels={"wear_level": "Уровень износа"},
-            title="Распределение по степени износа",
-            color="wear_level",
-            color_discrete_map={
-                "green": "#28a745",
-                "yellow": "#ffc107",
-                "red": "#dc3545",
-            },
+        # Таблица замен
+        replacements_display_df = st.session_state.replacements_df.rename(
+            columns={
+                "equipment_vin": "VIN оборудования",
+                "equipment_model": "Модель оборудования",
+                "spare_part_name": "Запчасть",
+                "workshop_name": "Мастерская",
+                "replacement_date": "Дата замены",
+                "replacement_type": "Тип замены",
+                "notes": "Примечания",
+            }
         )
-        st.plotly_chart(fig, config=dict(displayModeBar=False))
-
-        st.subheader("Детальный анализ", divider="grey")
+        st.dataframe(replacements_display_df, width="content")
 
-        # Добавляем цветовую индикацию
-        def color_wear_level(val):
-            color = get_wear_color(val)
-            return f"background-color: {color}; color: white"
+    # Поиск
+    elif page == "Поиск":
+        st.title("🔍 Поиск")
 
-        # styled_df = wear_data.style.applymap(color_wear_level, subset=["wear_level"])
-        wear_display_df = wear_data.rename(
-            columns={
-                "equipment_name": "Оборудование",
-                "part_name": "Запчасть",
-                "total_needed": "Требуется",
-                "qty_in_stock": "На складе",
-                "wear_level": "Степень износа",
-                "remaining_pct": "Остаток (%)",
-                "procurement_deadline": "Срок закупки",
-                "procurement_time_days": "Время на закупку, дн.",
-            }
+        search_kinds = {
+            "replacement": "Примечания к заменам",
+            "equipment": "VIN",
+            "spare_part": "Запчасти",
+            "workshop": "Мастерские",
+        }
+        search_query = st.text_input(
+            "Запрос", placeholder="VIN, запчасть, мастерская..."
         )
-        styled_df = wear_display_df.style.map(
-            color_wear_level, subset=["Степень износа"]
+        selected_kinds = st.multiselect(
+            "Где искать",
+            list(search_kinds),
+            default=list(search_kinds),
+            format_func=search_kinds.get,
         )
-        st.dataframe(styled_df, width="content")
+        page_size = 20
 
-        # Фильтр по оборудованию
-        selected_equipment = st.selectbox(
-            "Фильтр по оборудованию",
-            ["Все"] + wear_data["equipment_name"].unique().tolist(),
-        )
+        if search_query.strip() and selected_kinds:
+            if USE_DATABASE:
+                db = ReadSessionLocal()
+                try:
+                    total, truncated = count_search_results(
+                        db, search_query, selected_kinds
+                    )
+                    page_count = max((total - 1) // page_size + 1, 1)
+                    page_number = st.number_input(
+                        "Страница", min_value=1, max_value=page_count, value=1
+                    )
+                    results = pd.DataFrame(
+                        search_records(
+                            db,
+                            search_query,
+                            selected_kinds,
+                            offset=(page_number - 1) * page_size,
+                            limit=page_size,
+                        ),
+                        columns=["kind", "id", "text", "context", "score"],
+                    )
+                finally:
+                    db.close()
+            else:
+                # Без базы данных - поиск подстроки по таблицам в памяти;
+                # VIN - из справочника оборудования, с id оборудования
+                pattern = search_query.strip()
+                equipment_frame = pd.DataFrame(
+                    repository.get_all_equipment(), columns=["id", "model_id", "vin"]
+                ).set_index("id")
+                equipment_frame["equipment_model"] = equipment_frame["model_id"].map(
+                    st.session_state.equipment_df["name"]
+                )
+                sources = {
+                    "replacement": (
+                        st.session_state.replacements_df,
+                        "notes",
+                        "equipment_vin",
+                    ),
+                    "equipment": (equipment_frame, "vin", "equipment_model"),
+                    "spare_part": (
+                        st.session_state.spare_parts_df,
+                        "name",
+                        "parent_equipment",
+                    ),
+                    "workshop": (st.session_state.workshops_df, "name", "address"),
+                }
+                frames = []
+                for kind in selected_kinds:
+                    frame, text_column, context_column = sources[kind]
+                    found = frame[
+                        frame[text_column]
+                        .fillna("")
+                        .astype(str)
+                        .str.contains(pattern, case=False, regex=False)
+                    ]
+                    frames.append(
+                        pd.DataFrame(
+                            {
+                                "kind": kind,
+                                "id": found.index,
+                                "text": found[text_column],
+                                "context": found[context_column],
+                                "score": 0.0,
+                            }
+                        )
+                    )
+                found_all = pd.concat(frames, ignore_index=True)
+                total, truncated = len(found_all), False
+                page_count = max((total - 1) // page_size + 1, 1)
+                page_number = st.number_input(
+                    "Страница", min_value=1, max_value=page_count, value=1
+                )
+                start = (page_number - 1) * page_size
+                results = found_all.iloc[start : start + page_size]
+
+            st.caption(f"Найдено: {total}+" if truncated else f"Найдено: {total}")
+            if not results.empty:
+                results = results.assign(kind=results["kind"].map(search_kinds))
+                st.dataframe(
+                    results.drop(columns=["id"]).rename(
+                        columns={
+                            "kind": "Раздел",
+                            "text": "Совпадение",
+                            "context": "Подробности",
+                            "score": "Релевантность",
+                        }
+                    ),
+                    width="content",
+                    hide_index=True,
+                )
+            else:
+                st.info("Ничего не найдено")
 
-        if selected_equipment != "Все":
-            filtered_data = wear_data[wear_data["equipment_name"] == selected_equipment]
-        else:
-            filtered_data = wear_data
+    # Анализ износа
+    elif page == "Анализ износа":
+        st.title("📊 Анализ степени износа")
 
-        filtered_display_df = filtered_data.rename(
-            columns={
-                "equipment_name": "Оборудование",
-                "part_name": "Запчасть",
-                "total_needed": "Требуется",
-                "qty_in_stock": "На складе",
-                "wear_level": "Степень износа",
-                "remaining_pct": "Остаток (%)",
-                "procurement_deadline": "Срок закупки",
-                "procurement_time_days": "Время на закупку, дн.",
-            }
+        # Дата оценки: по умолчанию сегодня, можно посмотреть состояние парка
+        # на прошлую дату или прогноз на будущую
+        wear_as_of = st.date_input("Дата оценки", datetime.now().date())
+
+        if USE_DATABASE:
+            with st.expander("📑 Отчет по всему парку"):
+                report_jobs_panel("wear", pd.Timestamp(wear_as_of).to_pydatetime())
+
+        # Износ на сегодня - из заранее рассчитанных результатов, если они свежие
+        precomputed = (
+            precomputed_results("wear")
+            if USE_DATABASE and wear_as_of == datetime.now().date()
+            else None
         )
-        st.dataframe(filtered_display_df, width="content")
-    else:
-        st.info("Нет данных для анализа износа")
+        if precomputed is not None:
+            wear_data, computed_at = precomputed
+            st.caption(f"Рассчитано {computed_at:%d.%m.%Y %H:%M}")
+        else:
+            # Расчет данных об износе
+            wear_data = calculate_total_parts_needed(
+                st.session_state.equipment_df,
+                st.session_state.spare_parts_df,
+                st.session_state.replacements_df,
+                as_of=pd.Timestamp(wear_as_of),
+            )
 
-# План закупок
-elif page == "План закупок":
-    st.title("📅 План закупки запчастей")
+        if not wear_data.empty:
+            # Группировка по степени износа
+            wear_summary = (
+                wear_data.groupby("wear_level").size().reset_index(name="count")
+            )
+            st.subheader("Сводка по степени износа")
+            for _, row in wear_summary.iterrows():
+                color = get_wear_color(row["wear_level"])
+                if row["wear_level"] == "green":
+                    description = "осталось более 25% от срока полезной эксплуатации"
+                elif row["wear_level"] == "yellow":
+                    description = "осталось менее 25% от срока полезной эксплуатации"
+                elif row["wear_level"] == "red":
+                    description = "осталось менее 10% от срока полезной эксплуатации"
+                else:
+                    description = ""
+                st.markdown(
+                    f"""
+                <div style="background-color: {color}; padding: 10px; margin: 5px 0; border-radius: 5px; color: white; display: inline-block; width: auto;">
+                    <strong>{row['wear_level'].upper()}</strong>: {row['count']} запчастей ({description})
+                </div>
+                """,
+                    unsafe_allow_html=True,
+                )
 
-    # Расчет плана закупок
-    procurement_data = calculate_total_parts_needed(
-        st.session_state.equipment_df,
-        st.session_state.spare_parts_df,
-        st.session_state.replacements_df,
-    )
+            # Круговая диаграмма
+            fig = px.pie(
+                wear_summary,
+                values="count",
+                names="wear_level",
+                labels={"wear_level": "Уровень износа"},
+                title="Распределение по степени износа",
+                color="wear_level",
+                color_discrete_map={
+                    "green": "#28a745",
+                    "yellow": "#ffc107",
+                    "red": "#dc3545",
+                },
+            )
+            st.plotly_chart(fig, config=dict(displayModeBar=False))
+
+            with st.expander("📈 Прогноз износа на 12 месяцев"):
+                # Все месяцы считаются одним векторным расчетом
+                forecast_dates = pd.date_range(
+                    pd.Timestamp(wear_as_of), periods=13, freq="MS"
+                )
+                positions, remaining_pct, zones = calculate_wear_trajectory(
+                    st.session_state.equipment_df,
+                    st.session_state.spare_parts_df,
+                    st.session_state.replacements_df,
+                    forecast_dates,
+                )
+                forecast = (
+                    wear_trajectory_frame(
+                        positions, forecast_dates, remaining_pct, zones
+                    )
+                    .groupby(["date", "wear_level"])
+                    .size()
+                    .reset_index(name="count")
+                )
+                fig = px.area(
+                    forecast,
+                    x="date",
+                    y="count",
+                    color="wear_level",
+                    title="Количество запчастей по зонам износа (без учета новых замен)",
+                    labels={
+                        "date": "Дата",
+                        "count": "Количество",
+                        "wear_level": "Уровень износа",
+                    },
+                    color_discrete_map={
+                        "green": "#28a745",
+                        "yellow": "#ffc107",
+                        "red": "#dc3545",
+                    },
+                )
+                st.plotly_chart(fig, config=dict(displayModeBar=False))
+
+            if USE_DATABASE:
+                with st.expander("🔔 Переходы в желтую и красную зоны по VIN"):
+                    from wear_events import get_threshold_events
+
+                    col_days, col_kinds = st.columns(2)
+                    with col_days:
+                        events_days = st.slider("Ближайшие дни", 7, 180, 30)
+                    with col_kinds:
+                        events_kinds = st.multiselect(
+                            "События",
+                            ["yellow", "red", "deadline"],
+                            ["yellow", "red"],
+                            format_func=WEAR_EVENT_LABELS.get,
+                        )
+                    # Даты обновляет фоновый пересчет (precompute.py),
+                    # выборка - диапазон дат по индексу
+                    db = ReadSessionLocal()
+                    try:
+                        events_df = get_threshold_events(
+                            db,
+                            datetime.now(),
+                            datetime.now() + pd.Timedelta(days=events_days),
+                            events_kinds,
+                        )
+                    finally:
+                        db.close()
+                    if events_df.empty:
+                        st.info("В этом периоде позиции не меняют зону")
+                    else:
+                        events_df["threshold"] = events_df["threshold"].map(
+                            WEAR_EVENT_LABELS
+                        )
+                        st.dataframe(
+                            events_df.drop(
+                                columns=["equipment_id", "spare_part_id"]
+                            ).rename(
+                                columns={
+                                    "event_date": "Дата",
+                                    "threshold": "Событие",
+                                    "vin": "VIN",
+                                    "equipment_model": "Оборудование",
+                                    "spare_part_name": "Запчасть",
+                                    "last_replacement": "Последняя замена",
+                                }
+                            ),
+                            width="content",
+                        )
+
+                with st.expander("📉 Динамика износа за год"):
+                    # Готовые ежедневные снимки (snapshots.py): ~365 x модели строк
+                    db = ReadSessionLocal()
+                    try:
+                        snapshots = get_wear_snapshots(
+                            db,
+                            (pd.Timestamp(wear_as_of) - pd.DateOffset(years=1)).date(),
+                        )
+                    finally:
+                        db.close()
+                    if snapshots:
+                        trend = (
+                            pd.DataFrame(
+                                [
+                                    {
+                                        "date": snapshot.snapshot_date,
+                                        "wear_level": snapshot.wear_level,
+                                        "count": snapshot.parts_count,
+                                    }
+                                    for snapshot in snapshots
+                                ]
+                            )
+                            .groupby(["date", "wear_level"])["count"]
+                            .sum()
+                            .reset_index()
+                        )
+                        fig = px.area(
+                            trend,
+                            x="date",
+                            y="count",
+                            color="wear_level",
+                            title="Количество запчастей по зонам износа",
+                            labels={
+                                "date": "Дата",
+                                "count": "Количество",
+                                "wear_level": "Уровень износа",
+                            },
+                            color_discrete_map={
+                                "green": "#28a745",
+                                "yellow": "#ffc107",
+                                "red": "#dc3545",
+                            },
+                        )
+                        st.plotly_chart(fig, config=dict(displayModeBar=False))
+                    else:
+                        st.info(
+                            "Снимков износа нет. Запустите `python snapshots.py` "
+                            "(для прошлых дат - с параметрами --from и --to)"
+                        )
+
+            st.subheader("Детальный анализ", divider="grey")
+
+            # Добавляем цветовую индикацию
+            def color_wear_level(val):
+                color = get_wear_color(val)
+                return f"background-color: {color}; color: white"
+
+            # styled_df = wear_data.style.applymap(color_wear_level, subset=["wear_level"])
+            wear_display_df = wear_data.rename(
+                columns={
+                    "equipment_name": "Оборудование",
+                    "part_name": "Запчасть",
+                    "total_needed": "Требуется",
+                    "qty_in_stock": "На складе",
+                    "wear_level": "Степень износа",
+                    "remaining_pct": "Остаток (%)",
+                    "procurement_deadline": "Срок закупки",
+                    "procurement_time_days": "Время на закупку, дн.",
+                }
+            )
+            styled_df = wear_display_df.style.map(
+                color_wear_level, subset=["Степень износа"]
+            )
+            st.dataframe(styled_df, width="content")
 
-    if not procurement_data.empty:
-        # Фильтруем только те запчасти, которые требуют закупки
-        procurement_needed = procurement_data[
-            (procurement_data["wear_level"].isin(["yellow", "red"]))
-            | (procurement_data["qty_in_stock"] < procurement_data["total_needed"])
-        ].copy()
-
-        if not procurement_needed.empty:
-            # Расчет дат закупки
-            procurement_needed["next_procurement_dates"] = procurement_needed[
-                "procurement_deadline"
-            ].apply(lambda x: get_next_procurement_dates(x) if pd.notna(x) else [])
-
-            st.subheader("Запчасти, требующие закупки")
-            procurement_display_df = procurement_needed[
-                [
-                    "equipment_name",
-                    "part_name",
-                    "total_needed",
-                    "qty_in_stock",
-                    "wear_level",
-                    "remaining_pct",
-                    "procurement_deadline",
+            # Фильтр по оборудованию
+            selected_equipment = st.selectbox(
+                "Фильтр по оборудованию",
+                ["Все"] + wear_data["equipment_name"].unique().tolist(),
+            )
+
+            if selected_equipment != "Все":
+                filtered_data = wear_data[
+                    wear_data["equipment_name"] == selected_equipment
                 ]
-            ].rename(
+            else:
+                filtered_data = wear_data
+
+            filtered_display_df = filtered_data.rename(
                 columns={
                     "equipment_name": "Оборудование",
                     "part_name": "Запчасть",
@@ -1040,144 +1561,470 @@ elif page == "План закупок":
                     "wear_level": "Степень износа",
                     "remaining_pct": "Остаток (%)",
                     "procurement_deadline": "Срок закупки",
+                    "procurement_time_days": "Время на закупку, дн.",
                 }
             )
-            st.dataframe(procurement_display_df, width="content")
-
-            # Группировка по датам
-            procurement_plan = []
-            for _, row in procurement_needed.iterrows():
-                if row["next_procurement_dates"]:
-                    for proc_date in row["next_procurement_dates"]:
-                        procurement_plan.append(
-                            {
-                                "date": proc_date,
-                                "equipment": row["equipment_name"],
-                                "part": row["part_name"],
-                                "needed": row["total_needed"] - row["qty_in_stock"],
-                                "wear_level": row["wear_level"],
-                            }
-                        )
+            st.dataframe(filtered_display_df, width="content")
+        else:
+            st.info("Нет данных для анализа износа")
+
+    # План закупок
+    elif page == "План закупок":
+        st.title("📅 План закупки запчастей")
+
+        if USE_DATABASE:
+            with st.expander("📑 Отчет по всему парку"):
+                report_jobs_panel("procurement")
 
-            if procurement_plan:
-                plan_df = pd.DataFrame(procurement_plan).sort_values("date")
-                st.subheader("Календарный план закупок")
-                plan_display_df = plan_df.rename(
+        # Заранее рассчитанные износ и календарь закупок, если они свежие
+        precomputed_wear = precomputed_results("wear") if USE_DATABASE else None
+        precomputed_plan = (
+            precomputed_results("plan") if precomputed_wear is not None else None
+        )
+        if precomputed_plan is not None:
+            procurement_data, computed_at = precomputed_wear
+            st.caption(f"Рассчитано {computed_at:%d.%m.%Y %H:%M}")
+        else:
+            # Расчет плана закупок
+            procurement_data = calculate_total_parts_needed(
+                st.session_state.equipment_df,
+                st.session_state.spare_parts_df,
+                st.session_state.replacements_df,
+            )
+
+        if not procurement_data.empty:
+            if precomputed_plan is not None:
+                procurement_needed = select_procurement_needed(procurement_data)
+                plan_df = precomputed_plan[0]
+            else:
+                procurement_needed, plan_df = build_procurement_plan(procurement_data)
+
+            if not procurement_needed.empty:
+                st.subheader("Запчасти, требующие закупки")
+                procurement_display_df = procurement_needed[
+                    [
+                        "equipment_name",
+                        "part_name",
+                        "total_needed",
+                        "qty_in_stock",
+                        "wear_level",
+                        "remaining_pct",
+                        "procurement_deadline",
+                    ]
+                ].rename(
                     columns={
-                        "date": "Дата",
-                        "equipment": "Оборудование",
-                        "part": "Запчасть",
-                        "needed": "Требуется",
-                        "wear_level": "Срочность",
+                        "equipment_name": "Оборудование",
+                        "part_name": "Запчасть",
+                        "total_needed": "Требуется",
+                        "qty_in_stock": "На складе",
+                        "wear_level": "Степень износа",
+                        "remaining_pct": "Остаток (%)",
+                        "procurement_deadline": "Срок закупки",
                     }
                 )
-                st.dataframe(plan_display_df, width="content")
-
-                # Визуализация плана
-                # Убедимся, что значения 'needed' положительные для корректного отображения
-                plan_df["needed"] = plan_df["needed"].clip(
-                    lower=1
-                )  # Минимум 1 для отображения
-                fig = px.scatter(
-                    plan_df,
-                    x="date",
-                    y="needed",
-                    color="wear_level",
-                    size="needed",
-                    title="План закупок по датам",
-                    labels={
-                        "date": "Дата закупки",
-                        "needed": "Необходимо, шт.",
-                    },
-                    color_discrete_map={
-                        "green": "#28a745",
-                        "yellow": "#ffc107",
-                        "red": "#dc3545",
-                    },
+                st.dataframe(procurement_display_df, width="content")
+
+                if not plan_df.empty:
+                    st.subheader("Календарный план закупок")
+                    plan_display_df = plan_df.rename(
+                        columns={
+                            "date": "Дата",
+                            "equipment": "Оборудование",
+                            "part": "Запчасть",
+                            "needed": "Требуется",
+                            "wear_level": "Срочность",
+                        }
+                    )
+                    st.dataframe(plan_display_df, width="content")
+
+                    # Визуализация плана
+                    # Убедимся, что значения 'needed' положительные для корректного отображения
+                    plan_df["needed"] = plan_df["needed"].clip(
+                        lower=1
+                    )  # Минимум 1 для отображения
+                    fig = px.scatter(
+                        plan_df,
+                        x="date",
+                        y="needed",
+                        color="wear_level",
+                        size="needed",
+                        title="План закупок по датам",
+                        labels={
+                            "date": "Дата закупки",
+                            "needed": "Необходимо, шт.",
+                        },
+                        color_discrete_map={
+                            "green": "#28a745",
+                            "yellow": "#ffc107",
+                            "red": "#dc3545",
+                        },
+                    )
+                    st.plotly_chart(fig, config=dict(displayModeBar=False))
+                else:
+                    st.info("Нет запчастей, требующих срочной закупки")
+
+                # Общий склад: одна и та же запчасть для разных моделей. Запас
+                # собирается по всем строкам (и зеленым, и полностью обеспеченным),
+                # показываются строки, требующие закупки после распределения
+                from allocation import allocate_shared_stock
+                from consolidation import PROCUREMENT_MAX_EARLY_DAYS, consolidate_orders
+
+                allocation_lines, _ = allocate_shared_stock(procurement_data)
+                allocation_lines = allocation_lines[
+                    allocation_lines["wear_level"].isin(["yellow", "red"])
+                    | (allocation_lines["shortfall"] > 0)
+                ].reset_index(drop=True)
+                st.subheader("Распределение общего склада и сводные заказы")
+                st.caption(
+                    "Остаток одной запчасти суммируется по всем моделям и распределяется "
+                    "сначала на красную зону, затем на желтую и зеленую, внутри зоны - "
+                    "по крайнему сроку закупки. Дефицит объединяется в заказы по "
+                    "запчасти: минимальное число заказов в окна 10-го и 25-го числа "
+                    "не позже крайнего срока."
                 )
-                st.plotly_chart(fig, config=dict(displayModeBar=False))
+                max_early_days = st.slider(
+                    "Покупать не раньше чем за, дн. до крайнего срока",
+                    15,
+                    180,
+                    PROCUREMENT_MAX_EARLY_DAYS,
+                    step=5,
+                )
+                order_lines, orders = consolidate_orders(
+                    allocation_lines, max_early_days=max_early_days
+                )
+                if not orders.empty:
+                    col_orders, col_lines, col_early = st.columns(3)
+                    col_orders.metric("Заказов", len(orders))
+                    col_lines.metric("Строк потребности", len(order_lines))
+                    col_early.metric(
+                        "Средний запас до срока, дн.",
+                        f"{order_lines['days_early'].mean():.0f}",
+                    )
+                    st.dataframe(
+                        orders.rename(
+                            columns={
+                                "order_window": "Дата заказа",
+                                "part_name": "Запчасть",
+                                "shortfall": "Количество",
+                                "lines": "Строк потребности",
+                                "earliest_deadline": "Ближайший срок",
+                                "overdue": "Срок прошел",
+                            }
+                        ),
+                        width="content",
+                    )
+                else:
+                    st.success("Общего складского запаса достаточно")
+                with st.expander("Распределение по строкам потребности"):
+                    st.dataframe(
+                        allocation_lines.drop(columns=["purchase_window"])
+                        .merge(
+                            order_lines[
+                                [
+                                    "equipment_name",
+                                    "part_name",
+                                    "order_window",
+                                    "days_early",
+                                ]
+                            ],
+                            on=["equipment_name", "part_name"],
+                            how="left",
+                        )
+                        .rename(
+                            columns={
+                                "equipment_name": "Оборудование",
+                                "part_name": "Запчасть",
+                                "wear_level": "Степень износа",
+                                "procurement_deadline": "Срок закупки",
+                                "total_needed": "Требуется",
+                                "pool_stock": "Общий запас",
+                                "allocated": "Выделено",
+                                "shortfall": "Дефицит",
+                                "order_window": "Дата заказа",
+                                "days_early": "Запас до срока, дн.",
+                            }
+                        ),
+                        width="content",
+                    )
             else:
-                st.info("Нет запчастей, требующих срочной закупки")
+                st.success("Все запчасти в достаточном количестве!")
         else:
-            st.success("Все запчасти в достаточном количестве!")
-    else:
-        st.info("Нет данных для формирования плана закупок")
+            st.info("Нет данных для формирования плана закупок")
 
-# Визуализации
-elif page == "Визуализации":
-    st.title("📈 Визуализации")
+        with st.expander("📦 Точка заказа и страховой запас"):
+            from reorder import REORDER_HISTORY_MONTHS, reorder_points
 
-    tab1, tab2, tab3 = st.tabs(
-        ["Распределение запчастей", "История замен", "Анализ сроков"]
-    )
+            st.caption(
+                f"Спрос и его разброс - по недельному количеству замен за последние "
+                f"{REORDER_HISTORY_MONTHS} мес. (без замен - по сроку службы из "
+                "справочника), срок поставки - из справочника с учетом его разброса."
+            )
+            reorder_service_level = st.slider(
+                "Уровень сервиса (вероятность без нехватки за срок поставки)",
+                0.5,
+                0.999,
+                0.95,
+                step=0.005,
+                format="%.3f",
+            )
+            reorder_df = reorder_points(reorder_statistics(), reorder_service_level)
+            st.metric(
+                "Запчастей на уровне точки заказа или ниже",
+                int(reorder_df["below_reorder_point"].sum()),
+            )
+            st.dataframe(
+                reorder_df.sort_values(
+                    ["below_reorder_point", "shortfall"], ascending=False
+                )[
+                    [
+                        "equipment_name",
+                        "part_name",
+                        "qty_in_stock",
+                        "reorder_point",
+                        "safety_stock",
+                        "lead_time_demand",
+                        "daily_demand",
+                        "procurement_time_days",
+                        "demand_source",
+                        "shortfall",
+                    ]
+                ].rename(
+                    columns={
+                        "equipment_name": "Оборудование",
+                        "part_name": "Запчасть",
+                        "qty_in_stock": "На складе",
+                        "reorder_point": "Точка заказа",
+                        "safety_stock": "Страховой запас",
+                        "lead_time_demand": "Спрос за срок поставки",
+                        "daily_demand": "Спрос в день",
+                        "procurement_time_days": "Срок поставки, дн.",
+                        "demand_source": "Источник спроса",
+                        "shortfall": "Не хватает до точки заказа",
+                    }
+                ),
+                width="content",
+            )
 
-    with tab1:
-        st.subheader("Распределение запчастей по оборудованию")
-        parts_by_equipment = (
-            st.session_state.spare_parts_df.groupby("parent_equipment")
-            .size()
-            .reset_index(name="count")
-        )
-        fig = px.bar(
-            parts_by_equipment,
-            x="parent_equipment",
-            y="count",
-            title="Количество запчастей по типам оборудования",
-            labels={
-                "parent_equipment": "Тип Оборудования",
-                "count": "Количество",
-            },
-        )
-        st.plotly_chart(fig, config=dict(displayModeBar=False))
-
-    with tab2:
-        st.subheader("История замен по времени")
-        if not st.session_state.replacements_df.empty:
-            replacements_over_time = st.session_state.replacements_df.copy()
-            replacements_over_time["month"] = replacements_over_time[
-                "replacement_date"
-            ].dt.to_period("M")
-            monthly_replacements = (
-                replacements_over_time.groupby("month").size().reset_index(name="count")
+        if USE_DATABASE:
+            with st.expander("🗓️ Расписание плановых замен по мастерским"):
+                from scheduling import (
+                    SCHEDULE_HORIZON_DAYS,
+                    get_schedule,
+                    update_schedule,
+                )
+
+                st.caption(
+                    "Замены назначаются с перехода запчасти в красную зону до окончания "
+                    "срока службы с учетом дневной мощности мастерских; после новых "
+                    "замен фоновый пересчет перепланирует только изменившиеся позиции."
+                )
+                if st.button("Перепланировать полностью", key="schedule_btn"):
+                    db = SessionLocal()
+                    try:
+                        update_schedule(db, full=True)
+                    finally:
+                        db.close()
+                db = ReadSessionLocal()
+                try:
+                    schedule_df = get_schedule(db)
+                finally:
+                    db.close()
+                if schedule_df.empty:
+                    st.info(
+                        f"В ближайшие {SCHEDULE_HORIZON_DAYS} дн. плановых замен нет"
+                    )
+                else:
+                    status_counts = schedule_df["status"].value_counts()
+                    for column, status in zip(
+                        st.columns(len(SCHEDULE_STATUS_LABELS)), SCHEDULE_STATUS_LABELS
+                    ):
+                        column.metric(
+                            SCHEDULE_STATUS_LABELS[status],
+                            int(status_counts.get(status, 0)),
+                        )
+                    # Загрузка мастерских по неделям
+                    weekly_load = (
+                        schedule_df.dropna(subset=["scheduled_date"])
+                        .assign(
+                            week=lambda frame: frame["scheduled_date"]
+                            .dt.to_period("W")
+                            .dt.start_time
+                        )
+                        .pivot_table(
+                            index="workshop",
+                            columns="week",
+                            values="vin",
+                            aggfunc="count",
+                            fill_value=0,
+                        )
+                    )
+                    weekly_load.columns = [
+                        f"{week:%d.%m}" for week in weekly_load.columns
+                    ]
+                    st.dataframe(weekly_load, width="content")
+                    schedule_df["status"] = schedule_df["status"].map(
+                        SCHEDULE_STATUS_LABELS
+                    )
+                    st.dataframe(
+                        schedule_df.rename(
+                            columns={
+                                "scheduled_date": "Дата замены",
+                                "workshop": "Мастерская",
+                                "vin": "VIN",
+                                "equipment_model": "Оборудование",
+                                "spare_part_name": "Запчасть",
+                                "release_date": "Красная зона",
+                                "due_date": "Срок службы истекает",
+                                "status": "Статус",
+                            }
+                        ),
+                        width="content",
+                    )
+
+        with st.expander("🎲 Моделирование отказов (Монте-Карло)"):
+            st.caption(
+                "Интервалы между заменами берутся из истории (включая внеплановые отказы), "
+                "для каждой запчасти моделируются тысячи вариантов расхода на горизонте."
             )
-            monthly_replacements["month"] = monthly_replacements["month"].astype(str)
+            col_horizon, col_level, col_paths = st.columns(3)
+            with col_horizon:
+                sim_horizon = st.slider("Горизонт, мес.", 1, 36, 12)
+            with col_level:
+                sim_service_level = st.slider("Уровень сервиса", 0.5, 0.99, 0.95)
+            with col_paths:
+                sim_paths = st.select_slider("Вариантов", [500, 1000, 2000, 5000], 1000)
+            if st.button("Рассчитать", key="simulate_stock_btn"):
+                from simulation import simulate_stock
+
+                st.session_state.stock_simulation = simulate_stock(
+                    st.session_state.equipment_df,
+                    st.session_state.spare_parts_df,
+                    st.session_state.replacements_df,
+                    horizon_months=sim_horizon,
+                    n_paths=sim_paths,
+                    service_level=sim_service_level,
+                )
+            if "stock_simulation" in st.session_state:
+                simulation_display_df = st.session_state.stock_simulation.rename(
+                    columns={
+                        "equipment_name": "Оборудование",
+                        "part_name": "Запчасть",
+                        "positions": "Позиций",
+                        "distribution_source": "Источник срока",
+                        "median_interval_days": "Медианный интервал, дн.",
+                        "unscheduled_share": "Доля внеплановых",
+                        "qty_in_stock": "На складе",
+                        "expected_demand": "Ожидаемый расход",
+                        "stockout_probability": "Вероятность нехватки",
+                        "required_stock": "Нужный запас",
+                        "shortfall": "Дефицит",
+                    }
+                )
+                st.dataframe(simulation_display_df, width="content")
+
+    # Визуализации
+    elif page == "Визуализации":
+        st.title("📈 Визуализации")
 
-            fig = px.line(
-                monthly_replacements,
-                x="month",
+        tab1, tab2, tab3 = st.tabs(
+            ["Распределение запчастей", "История замен", "Анализ сроков"]
+        )
+
+        with tab1:
+            st.subheader("Распределение запчастей по оборудованию")
+            parts_by_equipment = (
+                st.session_state.spare_parts_df.groupby("parent_equipment")
+                .size()
+                .reset_index(name="count")
+            )
+            fig = px.bar(
+                parts_by_equipment,
+                x="parent_equipment",
                 y="count",
-                title="Количество замен по месяцам",
+                title="Количество запчастей по типам оборудования",
                 labels={
-                    "month": "Месяц",
+                    "parent_equipment": "Тип Оборудования",
                     "count": "Количество",
                 },
             )
             st.plotly_chart(fig, config=dict(displayModeBar=False))
-        else:
-            st.info("Нет данных о заменах")
 
-    with tab3:
-        st.subheader("Анализ сроков полезного использования")
-        fig = px.histogram(
-            st.session_state.spare_parts_df,
-            x="useful_life_months",
-            # y="count",
-            title="Распределение сроков полезного использования запчастей",
-            labels={
-                "count": "Количество запчастей",
-                "useful_life_months": "Срок службы (месяцы)",
-            },
-        )
-        st.plotly_chart(fig, config=dict(displayModeBar=False))
+        with tab2:
+            st.subheader("История замен по времени")
+            if not st.session_state.replacements_df.empty:
+                replacements_over_time = st.session_state.replacements_df.copy()
+                replacements_over_time["month"] = replacements_over_time[
+                    "replacement_date"
+                ].dt.to_period("M")
+                monthly_replacements = (
+                    replacements_over_time.groupby("month")
+                    .size()
+                    .reset_index(name="count")
+                )
+                monthly_replacements["month"] = monthly_replacements["month"].astype(
+                    str
+                )
 
-        fig2 = px.histogram(
-            st.session_state.spare_parts_df,
-            x="procurement_time_days",
-            # y="count",
-            title="Распределение сроков закупки запчастей",
-            labels={
-                "count": "Количество запчастей",
-                "procurement_time_days": "Срок закупки (Дни)",
-            },
-        )
-        st.plotly_chart(fig2, config=dict(displayModeBar=False))
+                fig = px.line(
+                    monthly_replacements,
+                    x="month",
+                    y="count",
+                    title="Количество замен по месяцам",
+                    labels={
+                        "month": "Месяц",
+                        "count": "Количество",
+                    },
+                )
+                st.plotly_chart(fig, config=dict(displayModeBar=False))
+            else:
+                st.info("Нет данных о заменах")
+
+        with tab3:
+            st.subheader("Анализ сроков полезного использования")
+            fig = px.histogram(
+                st.session_state.spare_parts_df,
+                x="useful_life_months",
+                # y="count",
+                title="Распределение сроков полезного использования запчастей",
+                labels={
+                    "count": "Количество запчастей",
+                    "useful_life_months": "Срок службы (месяцы)",
+                },
+            )
+            st.plotly_chart(fig, config=dict(displayModeBar=False))
+
+            fig2 = px.histogram(
+                st.session_state.spare_parts_df,
+                x="procurement_time_days",
+                # y="count",
+                title="Распределение сроков закупки запчастей",
+                labels={
+                    "count": "Количество запчастей",
+                    "procurement_time_days": "Срок закупки (Дни)",
+                },
+            )
+            st.plotly_chart(fig2, config=dict(displayModeBar=False))
+finally:
+    # Итоги по SQL-запросам текущего перезапуска
+    end_rerun(query_stats)
+    set_write_scope(None)
+
+record_first_run()
+if DEV_MODE:
+    first_run_ms, deferred_ms = startup_report()
+    with st.sidebar.expander("⏱️ Холодный старт"):
+        st.caption(f"Первая страница процесса готова через {first_run_ms:.0f} мс")
+        if deferred_ms:
+            st.caption("Отложенные импорты, мс")
+            st.dataframe(
+                pd.Series(deferred_ms, name="мс").rename_axis("Модуль").round(1)
+            )
+        if st.button("Профиль импорта", key="import_profile_btn"):
+            st.dataframe(import_profile().head(30), hide_index=True)
+if DEV_MODE and query_stats.over_budget:
+    st.sidebar.warning(
+        f"Страница выполнила {query_stats.count} SQL-запросов "
+        f"(бюджет {QUERY_BUDGET}, {query_stats.total_ms:.0f} мс)"
+    )
+    for statement, count in query_stats.suspected_n_plus_one():
+        st.sidebar.caption(f"Возможный N+1 ({count}×): {statement[:200]}")
@@ -0,0 +1,56 @@
+import argparse
+
+from database import USE_DATABASE, create_tables, engine
+from partitioning import history_status, partition_history
+from utils import configure_logging
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Перенос истории замен в таблицу, секционированную по годам "
+        "(PostgreSQL)"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Только показать состояние таблицы, ничего не менять",
+    )
+    parser.add_argument(
+        "--move-undated",
+        action="store_true",
+        help="Перенести замены без даты в replacement_records_undated "
+        "(иначе при их наличии перенос отменяется)",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not USE_DATABASE:
+        parser.error("Перенос истории требует базу данных (USE_DATABASE=true)")
+    if engine.dialect.name != "postgresql":
+        parser.error("Секционирование истории поддерживается только в PostgreSQL")
+
+    create_tables()
+    status = history_status(engine)
+    print(
+        f"Секционирована: {'да' if status['partitioned'] else 'нет'}, "
+        f"строк: {status['rows']}, годы: {status['first_year']}-"
+        f"{status['last_year']}, без даты: {status['undated']}"
+    )
+    if args.dry_run or status["partitioned"]:
+        return
+
+    try:
+        result = partition_history(engine, move_undated=args.move_undated)
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    if result["converted"]:
+        print(
+            f"Перенесено строк: {result['rows']}, "
+            f"без даты (в replacement_records_undated): {result['undated']}"
+        )
+    else:
+        print("Таблица уже секционирована другим процессом")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-import pandas as pd
 from datetime import datetime, timedelta
 import random
 
@@ -37,9 +36,10 @@ class Equipment:
 
 
 class Workshop:
-    def __init__(self, name, address):
+    def __init__(self, name, address, daily_capacity=None):
         self.name = name
         self.address = address
+        self.daily_capacity = daily_capacity  # Плановых замен в рабочий день
 
 
 class ReplacementRecord:
@@ -190,54 +190,3 @@ def generate_test_data():
         spare_parts,
         replacement_records,
     )
-
-
-# Преобразование в DataFrames для удобства работы
-def create_dataframes(
-    equipment_models, equipment_instances, workshops, spare_parts, replacement_records
-):
-    equipment_df = pd.DataFrame(
-        [
-            {"name": model.name, "qty_in_fleet": model.qty_in_fleet}
-            for model in equipment_models
-        ]
-    )
-
-    workshops_df = pd.DataFrame(
-        [{"name": ws.name, "address": ws.address} for ws in workshops]
-    )
-
-    spare_parts_df = pd.DataFrame(
-        [
-            {
-                "name": sp.name,
-                "useful_life_months": sp.useful_life_months,
-                "parent_equipment": sp.parent_equipment,
-                "qty_per_equipment": sp.qty_per_equipment,
-                "qty_in_stock": sp.qty_in_stock,
-                "procurement_time_days": sp.procurement_time_days,
-            }
-            for sp in spare_parts
-        ]
-    )
-
-    replacements_df = pd.DataFrame(
-        [
-            {
-                "equipment_vin": rr.equipment_name,  # Теперь это VIN
-                "equipment_model": (
-                    rr.equipment_name.split("VIN")[0]
-                    if "VIN" in rr.equipment_name
-                    else rr.equipment_name
-                ),  # Извлекаем модель из VIN
-                "spare_part_name": rr.spare_part_name,
-                "workshop_name": rr.workshop_name,
-                "replacement_date": rr.replacement_date,
-                "replacement_type": rr.replacement_type,
-                "notes": rr.notes,
-            }
-            for rr in replacement_records
-        ]
-    )
-
-    return equipment_df, workshops_df, spare_parts_df, replacements_df
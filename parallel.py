@@ -0,0 +1,239 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from utils import calculate_total_parts_needed, logger
+
+# Параллельный расчет износа по парку: данные разбиваются по моделям
+# оборудования, история замен передается процессам через общую память
+# (массивы NumPy без копирования при передаче), результаты собираются
+# в исходном порядке моделей. Расчет по парку пачками моделей
+# (wear_engine.iter_fleet_results) распределяет по процессам целые пачки.
+
+# Меньше этого количества строк истории замен параллелить невыгодно
+PARALLEL_MIN_ROWS = int(os.getenv("PARALLEL_MIN_ROWS", "1000000"))
+# Сколько порций работы приходится на один процесс (для выравнивания нагрузки)
+CHUNKS_PER_WORKER = 4
+# Сколько пачек на процесс одновременно в работе при расчете пачками
+BATCHES_PER_WORKER = 2
+
+
+def _share_arrays(arrays):
+    """
+    Размещение массивов в одном блоке общей памяти.
+    Возвращает блок и схему размещения: {имя: (смещение, dtype, длина)}
+    """
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = (offset, array.dtype.str, len(array))
+        offset += array.nbytes
+    shm = SharedMemory(create=True, size=max(offset, 1))
+    for name, array in arrays.items():
+        start, dtype, length = layout[name]
+        np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=start)[:] = array
+    return shm, layout
+
+
+def _attach_arrays(shm, layout):
+    return {
+        name: np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=offset)
+        for name, (offset, dtype, length) in layout.items()
+    }
+
+
+def _compute_chunk(
+    shm_name,
+    layout,
+    start,
+    end,
+    part_names,
+    model_names,
+    equipment_df,
+    spare_parts_df,
+    as_of,
+):
+    """Расчет одной порции моделей в рабочем процессе"""
+    shm = SharedMemory(name=shm_name, track=False)
+    try:
+        arrays = _attach_arrays(shm, layout)
+        # Последняя замена по каждой паре (модель, запчасть) считается прямо
+        # по целочисленным кодам в общей памяти, строки восстанавливаются
+        # только для агрегированного результата
+        # Замены позже даты расчета не учитываются
+        known = arrays["replacement_date"][start:end] <= as_of.value
+        key = arrays["model_code"][start:end][known].astype(np.int64) * len(
+            part_names
+        ) + arrays["part_code"][start:end][known].astype(np.int64)
+        latest = (
+            pd.Series(
+                arrays["replacement_date"][start:end][known].view("datetime64[ns]")
+            )
+            .groupby(key)
+            .max()
+        )
+        del arrays, key, known
+    finally:
+        shm.close()
+    codes = latest.index.to_numpy()
+    replacements_df = pd.DataFrame(
+        {
+            "equipment_model": np.asarray(model_names, dtype=object)[
+                codes // len(part_names)
+            ],
+            "spare_part_name": np.asarray(part_names, dtype=object)[
+                codes % len(part_names)
+            ],
+            "replacement_date": latest.to_numpy(),
+        }
+    )
+    return calculate_total_parts_needed(
+        equipment_df, spare_parts_df, replacements_df, as_of=as_of
+    )
+
+
+def _split_chunks(weights, n_chunks):
+    """Разбиение последовательности моделей на непрерывные порции примерно равного веса"""
+    total = weights.sum()
+    target = max(total / max(n_chunks, 1), 1)
+    bounds = [0]
+    acc = 0
+    for i, weight in enumerate(weights):
+        acc += weight
+        if acc >= target and i + 1 < len(weights):
+            bounds.append(i + 1)
+            acc = 0
+    bounds.append(len(weights))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def parallel_total_parts_needed(
+    equipment_df, spare_parts_df, replacements_df, workers=None, as_of=None
+):
+    """
+    Параллельный вариант calculate_total_parts_needed с тем же результатом.
+    Порции моделей считаются в пуле процессов, результат собирается в порядке
+    моделей из equipment_df, поэтому он не зависит от числа процессов.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Одна дата расчета для всех процессов
+    as_of = pd.Timestamp(datetime.now() if as_of is None else as_of)
+    if (
+        workers <= 1
+        or len(replacements_df) < PARALLEL_MIN_ROWS
+        or equipment_df.empty
+        or spare_parts_df.empty
+    ):
+        return calculate_total_parts_needed(
+            equipment_df, spare_parts_df, replacements_df, as_of=as_of
+        )
+
+    equipment_col = (
+        "equipment_name"
+        if "equipment_name" in replacements_df.columns
+        else "equipment_model"
+    )
+    model_names = equipment_df["name"].tolist()
+
+    # Сортируем историю по модели, чтобы каждая порция была непрерывным диапазоном
+    model_code = pd.Categorical(
+        replacements_df[equipment_col], categories=model_names
+    ).codes
+    known = model_code >= 0
+    order = np.argsort(model_code[known], kind="stable")
+    model_code = model_code[known][order].astype(np.int32)
+    part_code, part_names = pd.factorize(
+        replacements_df["spare_part_name"].to_numpy()[known][order]
+    )
+    replacement_date = (
+        pd.to_datetime(replacements_df["replacement_date"])
+        .to_numpy(dtype="datetime64[ns]")[known][order]
+        .view("int64")
+    )
+
+    rows_per_model = np.bincount(model_code, minlength=len(model_names))
+    parts_per_model = (
+        spare_parts_df["parent_equipment"].value_counts().reindex(model_names).fillna(0)
+    ).to_numpy()
+    row_bounds = np.concatenate([[0], np.cumsum(rows_per_model)])
+    chunks = _split_chunks(
+        rows_per_model + parts_per_model, workers * CHUNKS_PER_WORKER
+    )
+
+    shm, layout = _share_arrays(
+        {
+            "model_code": model_code,
+            "part_code": part_code.astype(np.int32),
+            "replacement_date": replacement_date,
+        }
+    )
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            futures = []
+            for first, last in chunks:
+                chunk_models = model_names[first:last]
+                futures.append(
+                    pool.submit(
+                        _compute_chunk,
+                        shm.name,
+                        layout,
+                        int(row_bounds[first]),
+                        int(row_bounds[last]),
+                        list(part_names),
+                        model_names,
+                        equipment_df.iloc[first:last],
+                        spare_parts_df[
+                            spare_parts_df["parent_equipment"].isin(chunk_models)
+                        ],
+                        as_of,
+                    )
+                )
+            # Сборка строго в порядке порций - результат детерминирован
+            results = [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    results = [result for result in results if not result.empty]
+    if not results:
+        return pd.DataFrame()
+    return pd.concat(results, ignore_index=True)
+
+
+def _call_in_worker(function, args):
+    return os.getpid(), function(*args)
+
+
+def imap_batches(function, batches, workers):
+    """
+    function(*args) для каждого args из batches в пуле процессов, результаты -
+    в порядке пачек. Следующие пачки готовятся (batches читается) по мере
+    расчета: одновременно в работе не больше workers * BATCHES_PER_WORKER
+    пачек, поэтому расход памяти не зависит от их общего числа.
+    """
+    pids = set()
+    count = 0
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for args in batches:
+            pending.append(pool.submit(_call_in_worker, function, args))
+            if len(pending) < workers * BATCHES_PER_WORKER:
+                continue
+            pid, result = pending.popleft().result()
+            pids.add(pid)
+            count += 1
+            yield result
+        while pending:
+            pid, result = pending.popleft().result()
+            pids.add(pid)
+            count += 1
+            yield result
+    finally:
+        pool.shutdown(cancel_futures=True)
+    logger.info(f"Рассчитано пачек: {count}, рабочих процессов: {len(pids)}")
@@ -0,0 +1,505 @@
+import os
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+from change_bus import REVISION_TABLE
+from utils import logger
+
+# Хранение истории замен по годам.
+# PostgreSQL: replacement_records - секционированная таблица
+# (PARTITION BY RANGE (replacement_date), секция на год и секция по умолчанию),
+# BRIN-индекс по дате и составные индексы для поиска последних замен.
+# Запросы с условием на дату читают только нужные секции.
+# Перенос существующей таблицы в секционированную - отдельная команда
+# (migrate_history.py), а не часть create_tables(): она пересоздает таблицу.
+# Старые годы выгружаются в сжатые Parquet-файлы и удаляются из БД.
+
+TABLE = "replacement_records"
+# На сколько лет вперед заранее создаются секции
+PARTITIONS_AHEAD = 1
+# Размер пачки строк при выгрузке в архив
+ARCHIVE_CHUNK_ROWS = 50_000
+# Ключ pg_advisory_xact_lock для изменения структуры истории замен: перенос
+# таблицы и создание секций из нескольких процессов выполняются по очереди
+HISTORY_LOCK_KEY = 0x7265706C
+# Таблица для замен без даты (их нельзя поместить в секцию по дате)
+UNDATED_TABLE = f"{TABLE}_undated"
+
+# Индексы для обоих диалектов: последние замены запчасти и история по VIN
+HISTORY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_replacement_records_part_date "
+    "ON replacement_records (spare_part_id, replacement_date)",
+    "CREATE INDEX IF NOT EXISTS ix_replacement_records_equipment_part_date "
+    "ON replacement_records (equipment_id, spare_part_id, replacement_date)",
+]
+POSTGRES_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_replacement_records_id ON replacement_records (id)",
+    "CREATE INDEX IF NOT EXISTS ix_replacement_records_date_brin "
+    "ON replacement_records USING brin (replacement_date)",
+]
+
+# Последняя замена позиции (VIN, запчасть) остается в БД при архивировании:
+# по ней считаются износ, план закупок и даты перехода порогов
+LATEST_CONDITION = """
+r.equipment_id IS NOT NULL AND r.spare_part_id IS NOT NULL AND NOT EXISTS (
+    SELECT 1 FROM {table} n
+    WHERE n.equipment_id = r.equipment_id AND n.spare_part_id = r.spare_part_id
+      AND (n.replacement_date > r.replacement_date
+           OR (n.replacement_date = r.replacement_date AND n.id > r.id))
+)
+"""
+# Строки года, которые переносятся в архив (кроме последних замен позиций)
+ARCHIVE_CONDITION = (
+    "r.replacement_date >= :start AND r.replacement_date < :end "
+    f"AND NOT ({LATEST_CONDITION.format(table=TABLE)})"
+)
+
+ARCHIVE_QUERY = f"""
+SELECT r.id, e.vin AS equipment_vin, m.name AS equipment_model,
+       s.name AS spare_part_name, w.name AS workshop_name,
+       r.replacement_date, r.replacement_type, r.notes,
+       r.equipment_id, r.spare_part_id, r.workshop_id
+FROM {TABLE} r
+LEFT JOIN equipment e ON e.id = r.equipment_id
+LEFT JOIN equipment_models m ON m.id = e.model_id
+LEFT JOIN spare_parts s ON s.id = r.spare_part_id
+LEFT JOIN workshops w ON w.id = r.workshop_id
+WHERE {ARCHIVE_CONDITION}
+ORDER BY r.replacement_date, r.id
+"""
+
+
+def _partition_name(year):
+    return f"{TABLE}_y{year}"
+
+
+def _is_partitioned(conn):
+    return (
+        conn.execute(
+            text("SELECT relkind FROM pg_class WHERE relname = :name"),
+            {"name": TABLE},
+        ).scalar()
+        == "p"
+    )
+
+
+def _partition_years(conn):
+    """Годы, для которых существуют секции"""
+    names = conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :name"
+        ),
+        {"name": TABLE},
+    ).scalars()
+    prefix = _partition_name("")
+    return sorted(
+        int(name[len(prefix) :])
+        for name in names
+        if name.startswith(prefix) and name[len(prefix) :].isdigit()
+    )
+
+
+def _create_partition(conn, year, parent=TABLE):
+    conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {_partition_name(year)} "
+            f"PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        )
+    )
+
+
+def _default_has_year(conn, year):
+    return (
+        conn.execute(
+            text(
+                f"SELECT 1 FROM {TABLE}_default "
+                "WHERE replacement_date >= :start AND replacement_date < :end LIMIT 1"
+            ),
+            {"start": datetime(year, 1, 1), "end": datetime(year + 1, 1, 1)},
+        ).first()
+        is not None
+    )
+
+
+def _lock_history(conn):
+    """Блокировка до конца транзакции (только PostgreSQL)"""
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": HISTORY_LOCK_KEY})
+
+
+def _count_rows(conn, table, where=""):
+    return conn.execute(text(f"SELECT count(*) FROM {table} {where}")).scalar()
+
+
+def _move_undated(conn):
+    """Перенос замен без даты в UNDATED_TABLE, возвращает число строк"""
+    conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {UNDATED_TABLE} "
+            f"(LIKE {TABLE} INCLUDING DEFAULTS)"
+        )
+    )
+    return conn.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {TABLE} WHERE replacement_date IS NULL "
+            f"RETURNING *) INSERT INTO {UNDATED_TABLE} SELECT * FROM moved"
+        )
+    ).rowcount
+
+
+def _convert_to_partitioned(conn):
+    """
+    Перенос существующей таблицы в секционированную: новая таблица с секциями
+    по годам имеющихся данных, копирование строк, замена старой таблицы.
+    Последовательность id сохраняется. Строк без даты быть не должно.
+    """
+    staging = f"{TABLE}_partitioned"
+    conn.execute(
+        text(
+            f"CREATE TABLE {staging} ("
+            "id integer NOT NULL, "
+            "equipment_id integer REFERENCES equipment (id), "
+            "spare_part_id integer REFERENCES spare_parts (id), "
+            "workshop_id integer REFERENCES workshops (id), "
+            "replacement_date timestamp NOT NULL, "
+            "replacement_type varchar, "
+            "notes text, "
+            f"CONSTRAINT {staging}_pkey PRIMARY KEY (id, replacement_date)"
+            ") PARTITION BY RANGE (replacement_date)"
+        )
+    )
+    first_year, last_year = conn.execute(
+        text(
+            f"SELECT min(extract(year FROM replacement_date))::int, "
+            f"max(extract(year FROM replacement_date))::int FROM {TABLE}"
+        )
+    ).one()
+    current_year = datetime.now().year
+    for year in range(
+        min(first_year or current_year, current_year),
+        max(last_year or current_year, current_year) + PARTITIONS_AHEAD + 1,
+    ):
+        _create_partition(conn, year, parent=staging)
+    conn.execute(text(f"CREATE TABLE {TABLE}_default PARTITION OF {staging} DEFAULT"))
+    copied = conn.execute(
+        text(
+            f"INSERT INTO {staging} (id, equipment_id, spare_part_id, workshop_id, "
+            f"replacement_date, replacement_type, notes) "
+            f"SELECT id, equipment_id, spare_part_id, workshop_id, "
+            f"replacement_date, replacement_type, notes FROM {TABLE}"
+        )
+    ).rowcount
+    # Проверка перед удалением старой таблицы: иначе откат всей транзакции
+    if copied != _count_rows(conn, TABLE) or copied != _count_rows(conn, staging):
+        raise RuntimeError(
+            f"Перенос {TABLE}: скопировано {copied} строк из "
+            f"{_count_rows(conn, TABLE)}, таблица не заменена"
+        )
+
+    sequence = conn.execute(
+        text("SELECT pg_get_serial_sequence(:name, 'id')"), {"name": TABLE}
+    ).scalar()
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+    conn.execute(text(f"DROP TABLE {TABLE}"))
+    conn.execute(text(f"ALTER TABLE {staging} RENAME TO {TABLE}"))
+    if sequence:
+        conn.execute(
+            text(
+                f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{sequence}')"
+            )
+        )
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+
+
+def history_status(engine):
+    """
+    Состояние истории замен для migrate_history.py: секционирована ли
+    таблица, сколько в ней строк, годы данных и число замен без даты
+    """
+    with engine.connect() as conn:
+        first_year, last_year = conn.execute(
+            text(
+                f"SELECT min(extract(year FROM replacement_date))::int, "
+                f"max(extract(year FROM replacement_date))::int FROM {TABLE}"
+            )
+        ).one()
+        return {
+            "partitioned": _is_partitioned(conn),
+            "rows": _count_rows(conn, TABLE),
+            "first_year": first_year,
+            "last_year": last_year,
+            "undated": _count_rows(conn, TABLE, "WHERE replacement_date IS NULL"),
+        }
+
+
+def partition_history(engine, move_undated=False):
+    """
+    Перенос replacement_records в секционированную таблицу (PostgreSQL) одной
+    транзакцией под рекомендательной блокировкой: процессы, запущенные
+    одновременно, ждут ее, а затем видят уже перенесенную таблицу.
+    Замены без даты не помещаются ни в одну секцию: без move_undated перенос
+    отменяется (ValueError), с ним они переносятся в UNDATED_TABLE.
+    Возвращает {"converted", "rows", "undated"}.
+    """
+    if engine.dialect.name != "postgresql":
+        raise ValueError("Секционирование истории поддерживается только в PostgreSQL")
+    with engine.begin() as conn:
+        _lock_history(conn)
+        if _is_partitioned(conn):
+            return {"converted": False, "rows": _count_rows(conn, TABLE), "undated": 0}
+        # Запись замен ждет конца переноса (чтение не блокируется): строки,
+        # записанные после копирования, не потеряются вместе со старой таблицей
+        conn.execute(text(f"LOCK TABLE {TABLE} IN EXCLUSIVE MODE"))
+        undated = _count_rows(conn, TABLE, "WHERE replacement_date IS NULL")
+        if undated and not move_undated:
+            raise ValueError(
+                f"В {TABLE} {undated} замен без даты: заполните даты или "
+                f"перенесите эти строки в {UNDATED_TABLE} (--move-undated)"
+            )
+        if undated:
+            undated = _move_undated(conn)
+        _convert_to_partitioned(conn)
+        _ensure_partitions(conn)
+        for statement in POSTGRES_INDEXES + HISTORY_INDEXES:
+            conn.execute(text(statement))
+        rows = _count_rows(conn, TABLE)
+    logger.info(f"{TABLE} секционирована: {rows} строк, без даты - {undated}")
+    return {"converted": True, "rows": rows, "undated": undated}
+
+
+def _ensure_partitions(conn):
+    """Секции на текущий и следующие PARTITIONS_AHEAD лет"""
+    existing = set(_partition_years(conn))
+    current_year = datetime.now().year
+    for year in range(current_year, current_year + PARTITIONS_AHEAD + 1):
+        if year in existing:
+            continue
+        # Строки этого года уже в секции по умолчанию - секцию не создать
+        if _default_has_year(conn, year):
+            logger.warning(
+                f"Секция {_partition_name(year)} не создана: "
+                f"строки за {year} год уже в секции по умолчанию"
+            )
+            continue
+        _create_partition(conn, year)
+
+
+def ensure_history_storage(engine):
+    """
+    Индексы для последних замен и, если таблица уже секционирована
+    (migrate_history.py), секции на текущий и следующий годы. Таблица
+    здесь не переносится: вызывается при каждом запуске процесса.
+    """
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            _lock_history(conn)
+            if _is_partitioned(conn):
+                _ensure_partitions(conn)
+                for statement in POSTGRES_INDEXES:
+                    conn.execute(text(statement))
+            else:
+                logger.warning(
+                    f"{TABLE} не секционирована: выполните " "python migrate_history.py"
+                )
+        for statement in HISTORY_INDEXES:
+            conn.execute(text(statement))
+
+
+def _archive_years(conn, before_year):
+    """Годы раньше before_year, в которых есть строки для архива"""
+    if conn.dialect.name == "postgresql":
+        year = "extract(year FROM r.replacement_date)::int"
+    else:
+        year = "CAST(strftime('%Y', r.replacement_date) AS INTEGER)"
+    return list(
+        conn.execute(
+            text(
+                f"SELECT DISTINCT {year} AS year FROM {TABLE} r "
+                "WHERE r.replacement_date < :end "
+                f"AND NOT ({LATEST_CONDITION.format(table=TABLE)}) ORDER BY year"
+            ),
+            {"end": datetime(before_year, 1, 1)},
+        ).scalars()
+    )
+
+
+def _archive_path(output_dir, year):
+    """
+    Файл архива года; год, оставшийся в БД частично (последние замены),
+    может архивироваться повторно - прежние файлы не перезаписываются
+    """
+    path = os.path.join(output_dir, f"{_partition_name(year)}.parquet")
+    part = 1
+    while os.path.exists(path):
+        part += 1
+        path = os.path.join(output_dir, f"{_partition_name(year)}_{part}.parquet")
+    return path
+
+
+def archive_schema():
+    """Схема Parquet для колонок ARCHIVE_QUERY: задается явно, а не по первой
+    пачке (пачка, где все примечания пусты, дала бы колонке тип null)"""
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("equipment_vin", pa.string()),
+            ("equipment_model", pa.string()),
+            ("spare_part_name", pa.string()),
+            ("workshop_name", pa.string()),
+            ("replacement_date", pa.timestamp("us")),
+            ("replacement_type", pa.string()),
+            ("notes", pa.string()),
+            ("equipment_id", pa.int64()),
+            ("spare_part_id", pa.int64()),
+            ("workshop_id", pa.int64()),
+        ]
+    )
+
+
+def _write_year(conn, year, path):
+    """Выгрузка одного года в Parquet (zstd) пачками, возвращает id строк"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # stream_results - только для этого запроса: execution_options() соединения
+    # включил бы серверный курсор и для DDL удаления года в той же транзакции
+    result = conn.execute(
+        text(ARCHIVE_QUERY),
+        {"start": datetime(year, 1, 1), "end": datetime(year + 1, 1, 1)},
+        execution_options={"stream_results": True},
+    )
+    columns = list(result.keys())
+    schema = archive_schema()
+    ids = []
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in result.partitions(ARCHIVE_CHUNK_ROWS):
+            frame = pd.DataFrame(chunk, columns=columns)
+            frame["replacement_date"] = pd.to_datetime(frame["replacement_date"])
+            writer.write_table(
+                pa.Table.from_pandas(
+                    frame[schema.names], schema=schema, preserve_index=False
+                )
+            )
+            ids.extend(frame["id"].tolist())
+    return ids
+
+
+def _mark_archived_dirty(conn, params):
+    """
+    Позиции и VIN архивируемых строк - в очереди инкрементальных пересчетов
+    дат перехода порогов (wear_events.py) и срока службы (service_life.py)
+    """
+    conn.execute(
+        text(
+            "INSERT INTO wear_event_dirty_positions (equipment_id, spare_part_id) "
+            f"SELECT DISTINCT r.equipment_id, r.spare_part_id FROM {TABLE} r "
+            f"WHERE {ARCHIVE_CONDITION} AND NOT EXISTS (SELECT 1 FROM "
+            "wear_event_dirty_positions d WHERE d.equipment_id = r.equipment_id "
+            "AND d.spare_part_id = r.spare_part_id)"
+        ),
+        params,
+    )
+    conn.execute(
+        text(
+            "INSERT INTO service_life_dirty_equipment (equipment_id) "
+            f"SELECT DISTINCT r.equipment_id FROM {TABLE} r "
+            f"WHERE {ARCHIVE_CONDITION} AND r.equipment_id IS NOT NULL "
+            "AND NOT EXISTS (SELECT 1 FROM service_life_dirty_equipment d "
+            "WHERE d.equipment_id = r.equipment_id)"
+        ),
+        params,
+    )
+
+
+def _drop_year(conn, year, partition_years):
+    """
+    Удаление года из БД: отсоединение секции или удаление строк.
+    Последние замены позиций остаются: из отсоединенной секции они
+    возвращаются в таблицу (в секцию по умолчанию).
+    """
+    params = {"start": datetime(year, 1, 1), "end": datetime(year + 1, 1, 1)}
+    _mark_archived_dirty(conn, params)
+    if year in partition_years:
+        name = _partition_name(year)
+        conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        columns = (
+            "id, equipment_id, spare_part_id, workshop_id, "
+            "replacement_date, replacement_type, notes"
+        )
+        conn.execute(
+            text(
+                f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {name} r "
+                f"WHERE {LATEST_CONDITION.format(table=name)} "
+                f"AND {LATEST_CONDITION.format(table=TABLE)}"
+            )
+        )
+        conn.execute(text(f"DROP TABLE {name}"))
+    else:
+        conn.execute(
+            text(
+                f"DELETE FROM {TABLE} WHERE id IN "
+                f"(SELECT r.id FROM {TABLE} r WHERE {ARCHIVE_CONDITION})"
+            ),
+            params,
+        )
+    # Удаление мимо ORM: ревизия истории замен (change_bus.py) - вручную
+    conn.execute(
+        text(
+            f"UPDATE {REVISION_TABLE} SET revision = revision + 1 "
+            "WHERE table_name = :table"
+        ),
+        {"table": TABLE},
+    )
+
+
+def archive_history(engine, keep_years, output_dir="archive", bus=None):
+    """
+    Перенос истории замен старше keep_years полных лет в Parquet-файлы
+    replacement_records_<год>.parquet. Каждый год выгружается и удаляется
+    в отдельной транзакции; файл записывается до удаления строк.
+    Последняя замена каждой позиции (VIN, запчасть) остается в БД, позиции
+    и VIN перенесенных строк отмечаются для пересчета дат перехода порогов
+    и срока службы; после фиксации года в шину изменений bus (change_bus.py)
+    публикуется удаление перенесенных строк.
+    Возвращает {год: количество строк}.
+    """
+    before_year = datetime.now().year - keep_years
+    os.makedirs(output_dir, exist_ok=True)
+    with engine.connect() as conn:
+        years = _archive_years(conn, before_year)
+
+    archived = {}
+    for year in years:
+        path = _archive_path(output_dir, year)
+        with engine.begin() as conn:
+            partition_years = (
+                set(_partition_years(conn))
+                if engine.dialect.name == "postgresql"
+                else set()
+            )
+            ids = _write_year(conn, year, path)
+            _drop_year(conn, year, partition_years)
+        archived[year] = len(ids)
+        if bus is not None and ids:
+            bus.publish([(TABLE, row_id, "delete") for row_id in ids])
+    return archived
+
+
+def read_archive(output_dir="archive"):
+    """Чтение архивной истории замен из Parquet-файлов в DataFrame"""
+    paths = sorted(
+        os.path.join(output_dir, name)
+        for name in os.listdir(output_dir)
+        if name.startswith(_partition_name("")) and name.endswith(".parquet")
+    )
+    if not paths:
+        return pd.DataFrame()
+    return pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
@@ -0,0 +1,311 @@
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+import pandas as pd
+from logly import logger
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from database import (
+    ReadSessionLocal,
+    SessionLocal,
+    USE_DATABASE,
+    change_bus,
+    FleetResultRun,
+    FleetWearResult,
+    FleetPlanResult,
+)
+from scheduling import update_schedule
+from service_life import refresh_service_life
+from utils import configure_logging
+from wear_engine import iter_fleet_results
+from wear_events import refresh_wear_events
+
+# Заранее рассчитанные износ и календарь закупок по всему парку.
+# Планировщик пересчитывает результаты раз в PRECOMPUTE_INTERVAL_MINUTES и
+# через PRECOMPUTE_DEBOUNCE_SECONDS после изменений в справочниках и истории
+# замен (шина change_bus.py). Каждый пересчет записывается новой версией;
+# страницы читают последнюю завершенную версию одним запросом по индексу
+# run_id, а если она устарела - считают сами. Вместе с результатами
+# актуализируются фактический срок службы (service_life.py), даты перехода
+# порогов (wear_events.py) и расписание плановых замен (scheduling.py).
+
+# Запускать планировщик внутри приложения (false - отдельным процессом
+# python precompute.py --loop)
+PRECOMPUTE_IN_APP = os.getenv("PRECOMPUTE_IN_APP", "true").lower() == "true"
+# Периодичность плановых пересчетов (мин.)
+PRECOMPUTE_INTERVAL_MINUTES = float(os.getenv("PRECOMPUTE_INTERVAL_MINUTES", "15"))
+# Возраст результатов, после которого страницы считают сами (мин.)
+PRECOMPUTE_MAX_AGE_MINUTES = float(os.getenv("PRECOMPUTE_MAX_AGE_MINUTES", "30"))
+# Пауза после изменения перед пересчетом: серия правок - один пересчет (с)
+PRECOMPUTE_DEBOUNCE_SECONDS = float(os.getenv("PRECOMPUTE_DEBOUNCE_SECONDS", "5"))
+# Сколько последних версий хранить (предыдущая нужна читающим во время записи)
+PRECOMPUTE_KEEP_RUNS = 2
+
+WEAR_RESULT_COLUMNS = [
+    "equipment_name",
+    "part_name",
+    "total_needed",
+    "qty_in_stock",
+    "wear_level",
+    "remaining_pct",
+    "procurement_deadline",
+    "procurement_time_days",
+]
+PLAN_RESULT_COLUMNS = ["date", "equipment", "part", "needed", "wear_level"]
+
+
+def _records(frame: pd.DataFrame, run_id: int):
+    # NaT/NaN -> None, numpy-типы -> типы Python
+    frame = frame.astype(object).where(frame.notna(), None)
+    return [dict(record, run_id=run_id) for record in frame.to_dict("records")]
+
+
+def recompute(
+    db: Session, read_db: Optional[Session] = None, batch_size: int = 20
+) -> int:
+    """
+    Пересчет износа и календаря закупок по всему парку в новую версию
+    результатов. Строки пишутся пачками моделей; версия становится видна
+    страницам только после записи целиком. Возвращает id версии.
+    """
+    read_db = db if read_db is None else read_db
+    computed_at = datetime.now()
+    run = FleetResultRun(status="running", computed_at=computed_at)
+    db.add(run)
+    db.commit()
+    run_id = run.id
+    wear_rows = plan_rows = 0
+    try:
+        for wear_df, plan_df in iter_fleet_results(
+            read_db, batch_size=batch_size, as_of=computed_at
+        ):
+            if not wear_df.empty:
+                db.execute(
+                    insert(FleetWearResult),
+                    _records(wear_df[WEAR_RESULT_COLUMNS], run_id),
+                )
+            if not plan_df.empty:
+                db.execute(
+                    insert(FleetPlanResult),
+                    _records(plan_df[PLAN_RESULT_COLUMNS], run_id),
+                )
+            wear_rows += len(wear_df)
+            plan_rows += len(plan_df)
+        run.status = "done"
+        run.finished_at = datetime.now()
+        run.wear_rows = wear_rows
+        run.plan_rows = plan_rows
+        db.commit()
+    except Exception:
+        db.rollback()
+        run.status = "failed"
+        run.finished_at = datetime.now()
+        db.commit()
+        raise
+    # Старые версии и версии пересчетов, прерванных больше суток назад
+    keep_from = db.execute(
+        select(FleetResultRun.id)
+        .where(FleetResultRun.status == "done")
+        .order_by(FleetResultRun.id.desc())
+        .limit(1)
+        .offset(PRECOMPUTE_KEEP_RUNS - 1)
+    ).scalar()
+    if keep_from:
+        expired = list(
+            db.scalars(
+                select(FleetResultRun.id).where(
+                    FleetResultRun.id < keep_from,
+                    (FleetResultRun.status != "running")
+                    | (FleetResultRun.computed_at < computed_at - timedelta(days=1)),
+                )
+            )
+        )
+        if expired:
+            for model in (FleetWearResult, FleetPlanResult):
+                db.execute(delete(model).where(model.run_id.in_(expired)))
+            db.execute(delete(FleetResultRun).where(FleetResultRun.id.in_(expired)))
+            db.commit()
+    return run_id
+
+
+def load_precomputed(
+    db: Session,
+    kind: str,
+    max_age_minutes: float = PRECOMPUTE_MAX_AGE_MINUTES,
+    changed_after: Optional[datetime] = None,
+) -> Optional[Tuple[pd.DataFrame, datetime]]:
+    """
+    Последняя версия результатов ('wear' или 'plan') и момент расчета -
+    один запрос по индексу run_id. None, если результатов нет, они старше
+    max_age_minutes, рассчитаны за другой день или раньше changed_after
+    (изменения, которые сессия уже видела) - тогда страница считает сама.
+    """
+    model, columns = (
+        (FleetWearResult, WEAR_RESULT_COLUMNS)
+        if kind == "wear"
+        else (FleetPlanResult, PLAN_RESULT_COLUMNS)
+    )
+    latest = (
+        select(func.max(FleetResultRun.id))
+        .where(FleetResultRun.status == "done")
+        .scalar_subquery()
+    )
+    stmt = (
+        select(
+            FleetResultRun.computed_at,
+            *[getattr(model, column) for column in columns],
+        )
+        .select_from(FleetResultRun)
+        .outerjoin(model, model.run_id == FleetResultRun.id)
+        .where(FleetResultRun.id == latest)
+        .order_by(model.id)
+    )
+    frame = pd.DataFrame(db.execute(stmt).all(), columns=["computed_at", *columns])
+    if frame.empty:
+        return None
+    computed_at = frame["computed_at"].iloc[0]
+    now = datetime.now()
+    if (
+        computed_at < now - timedelta(minutes=max_age_minutes)
+        or computed_at.date() != now.date()
+        or (changed_after is not None and computed_at < changed_after)
+    ):
+        return None
+    # Версия без строк (пустой парк) - одна строка из outer join
+    frame = frame.dropna(subset=[columns[0]])[columns].reset_index(drop=True)
+    date_column = "procurement_deadline" if kind == "wear" else "date"
+    frame[date_column] = pd.to_datetime(frame[date_column]).astype("datetime64[ns]")
+    return frame, computed_at
+
+
+class PrecomputeScheduler:
+    """
+    Фоновый поток пересчета: по расписанию и после изменений данных.
+    Работает внутри приложения (get_precompute_scheduler) или отдельным
+    процессом (python precompute.py --loop).
+    """
+
+    def __init__(
+        self,
+        interval_minutes=PRECOMPUTE_INTERVAL_MINUTES,
+        debounce_seconds=PRECOMPUTE_DEBOUNCE_SECONDS,
+    ):
+        self.interval = interval_minutes * 60
+        self.debounce = debounce_seconds
+        self.changes = change_bus.subscribe() if change_bus is not None else None
+        self.last_run_at = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="precompute", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _changed(self):
+        if self.changes is None:
+            return False
+        events, overflowed = self.changes.drain()
+        return bool(events) or overflowed
+
+    def run_once(self):
+        db = SessionLocal()
+        read_db = ReadSessionLocal()
+        try:
+            recompute(db, read_db)
+            self.last_error = None
+        except Exception as error:
+            self.last_error = str(error)
+            logger.error(f"Пересчет результатов не выполнен: {error}")
+        finally:
+            read_db.close()
+            db.close()
+        # Производные таблицы - отдельно: ошибка одной не отменяет остальные
+        for refresh, title in (
+            (refresh_service_life, "Фактический срок службы"),
+            (refresh_wear_events, "Даты перехода порогов"),
+            (update_schedule, "Расписание плановых замен"),
+        ):
+            db = SessionLocal()
+            try:
+                refresh(db)
+            except Exception as error:
+                self.last_error = str(error)
+                logger.error(f"{title}: пересчет не выполнен ({error})")
+            finally:
+                db.close()
+        self.last_run_at = time.monotonic()
+
+    def run(self):
+        changed_at = None
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if self._changed():
+                # Отсчет паузы - от последнего изменения серии
+                changed_at = now
+            due = self.last_run_at is None or now - self.last_run_at >= self.interval
+            if due or (changed_at is not None and now - changed_at >= self.debounce):
+                changed_at = None
+                self.run_once()
+                continue
+            self._stop.wait(1)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_precompute_scheduler():
+    """Планировщик пересчета внутри процесса (запускается при первом вызове)"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PrecomputeScheduler()
+            _scheduler.start()
+        return _scheduler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Пересчет износа и плана закупок по всему парку в таблицы результатов"
+    )
+    parser.add_argument(
+        "--loop",
+        action="store_true",
+        help="Работать постоянно: пересчет по расписанию и после изменений",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not USE_DATABASE:
+        parser.error("Пересчет требует базу данных (USE_DATABASE=true)")
+
+    if args.loop:
+        scheduler = PrecomputeScheduler()
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            pass
+        return
+    db = SessionLocal()
+    read_db = ReadSessionLocal()
+    try:
+        run_id = recompute(db, read_db)
+    finally:
+        read_db.close()
+        db.close()
+    print(f"Записана версия результатов {run_id}")
+
+
+if __name__ == "__main__":
+    main()
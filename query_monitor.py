@@ -0,0 +1,126 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from logly import logger
+from sqlalchemy import event
+
+# Режим разработки: предупреждения о превышении бюджета запросов выводятся в UI
+DEV_MODE = os.getenv("APP_ENV", "production").lower() == "development"
+# Порог медленного запроса (мс)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Допустимое количество запросов за один перезапуск страницы
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "50"))
+# Сколько одинаковых запросов за перезапуск считаем признаком N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+
+_local = threading.local()
+_page_totals = {}
+_page_lock = threading.Lock()
+
+
+class QueryStats:
+    """Статистика SQL-запросов одного перезапуска скрипта Streamlit"""
+
+    def __init__(self, page=None):
+        self.page = page
+        self.count = 0
+        self.total_ms = 0.0
+        self.slow = []  # (мс, запрос, параметры)
+        self.statements = Counter()
+
+    def record(self, statement, parameters, elapsed_ms):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.statements[_normalize(statement)] += 1
+        if elapsed_ms >= SLOW_QUERY_MS:
+            self.slow.append((elapsed_ms, statement, parameters))
+
+    def suspected_n_plus_one(self):
+        """Запросы, повторившиеся не менее N_PLUS_ONE_THRESHOLD раз"""
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= N_PLUS_ONE_THRESHOLD
+        ]
+
+    @property
+    def over_budget(self):
+        return self.count > QUERY_BUDGET
+
+
+def _normalize(statement):
+    """Приведение текста запроса к единому виду (без лишних пробелов)"""
+    return re.sub(r"\s+", " ", statement).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Время начала - в контексте выполнения запроса, а не в стеке соединения:
+    # после ошибки запроса (after_cursor_execute не вызывается) в соединении
+    # пула не остается лишней отметки
+    context.query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - context.query_start_time) * 1000
+    if elapsed_ms >= SLOW_QUERY_MS:
+        logger.warning(
+            f"Медленный запрос ({elapsed_ms:.1f} мс): {_normalize(statement)} | параметры: {parameters}"
+        )
+    stats = getattr(_local, "stats", None)
+    if stats is not None:
+        stats.record(statement, parameters, elapsed_ms)
+
+
+def install_query_hooks(engine):
+    """Подключение счетчиков запросов к движку SQLAlchemy"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def begin_rerun(page=None):
+    """
+    Начало учета запросов для текущего перезапуска скрипта.
+    Streamlit выполняет каждый перезапуск в своем потоке, поэтому статистика
+    хранится в thread-local и не смешивается между сессиями.
+    """
+    _local.stats = QueryStats(page)
+    return _local.stats
+
+
+def end_rerun(stats):
+    """Завершение учета: агрегирование по страницам и журналирование"""
+    if getattr(_local, "stats", None) is stats:
+        _local.stats = None
+
+    with _page_lock:
+        totals = _page_totals.setdefault(
+            stats.page,
+            {"reruns": 0, "queries": 0, "total_ms": 0.0, "max_queries": 0},
+        )
+        totals["reruns"] += 1
+        totals["queries"] += stats.count
+        totals["total_ms"] += stats.total_ms
+        totals["max_queries"] = max(totals["max_queries"], stats.count)
+
+    for statement, count in stats.suspected_n_plus_one():
+        logger.warning(
+            f"Подозрение на N+1 на странице '{stats.page}': запрос выполнен {count} раз: {statement}"
+        )
+    if stats.over_budget:
+        logger.warning(
+            f"Страница '{stats.page}' превысила бюджет запросов: {stats.count} > {QUERY_BUDGET}"
+        )
+    else:
+        logger.info(
+            f"Страница '{stats.page}': {stats.count} запросов, {stats.total_ms:.1f} мс"
+        )
+
+
+def get_page_totals():
+    """Сводная статистика запросов по страницам с момента запуска процесса"""
+    with _page_lock:
+        return {page: dict(totals) for page, totals in _page_totals.items()}
@@ -0,0 +1,144 @@
+import os
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# Точка заказа и страховой запас по каждой запчасти каталога.
+# Спрос (шт. в день) и его дисперсия оцениваются по недельному количеству
+# замен за последние REORDER_HISTORY_MONTHS; для запчастей без замен в этом
+# периоде - по справочнику (позиции парка / срок службы, пуассоновский разброс).
+# Срок поставки - procurement_time_days с разбросом REORDER_LEAD_TIME_CV
+# (фактические сроки поставок не учитываются).
+#   страховой запас SS = z * sqrt(L * D + d^2 * sL^2),  точка заказа = d * L + SS
+# Статистика спроса считается один раз (demand_statistics), а точка заказа
+# для другого уровня сервиса - одной векторной операцией (reorder_points).
+
+DAYS_IN_MONTH = 30.44
+# За сколько последних месяцев история замен используется для оценки спроса
+REORDER_HISTORY_MONTHS = int(os.getenv("REORDER_HISTORY_MONTHS", "24"))
+# Коэффициент вариации срока поставки
+REORDER_LEAD_TIME_CV = float(os.getenv("REORDER_LEAD_TIME_CV", "0.2"))
+# Интервал подсчета замен для оценки разброса спроса (дн.)
+DEMAND_BUCKET_DAYS = 7
+
+
+def demand_statistics(
+    equipment_df,
+    spare_parts_df,
+    replacements_df,
+    as_of=None,
+    history_months=REORDER_HISTORY_MONTHS,
+):
+    """
+    Спрос по каждой запчасти каталога: по строке на (модель, запчасть) с
+    остатком, сроком поставки, источником оценки (history/catalog), средним
+    спросом и дисперсией спроса в штуках за день
+    """
+    columns = [
+        "equipment_name",
+        "part_name",
+        "qty_in_stock",
+        "procurement_time_days",
+        "demand_source",
+        "daily_demand",
+        "daily_variance",
+    ]
+    if spare_parts_df.empty:
+        return pd.DataFrame(columns=columns)
+
+    as_of = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+    parts = (
+        spare_parts_df[
+            [
+                "name",
+                "parent_equipment",
+                "qty_per_equipment",
+                "qty_in_stock",
+                "useful_life_months",
+                "procurement_time_days",
+            ]
+        ]
+        .rename(columns={"name": "part_name", "parent_equipment": "equipment_name"})
+        .merge(
+            equipment_df[["name", "qty_in_fleet"]].rename(
+                columns={"name": "equipment_name"}
+            ),
+            on="equipment_name",
+            how="left",
+        )
+    )
+
+    # Количество замен по неделям: сумма и сумма квадратов по запчасти,
+    # недели без замен дают нули
+    n_buckets = max(int(history_months * DAYS_IN_MONTH // DEMAND_BUCKET_DAYS), 2)
+    start = as_of - pd.Timedelta(days=n_buckets * DEMAND_BUCKET_DAYS)
+    if replacements_df.empty:
+        history = pd.DataFrame(columns=["equipment_name", "part_name", "bucket"])
+    else:
+        dates = pd.to_datetime(replacements_df["replacement_date"])
+        recent = (dates > start) & (dates <= as_of)
+        history = pd.DataFrame(
+            {
+                "equipment_name": replacements_df["equipment_model"][recent],
+                "part_name": replacements_df["spare_part_name"][recent],
+                "bucket": (as_of - dates[recent]).dt.days // DEMAND_BUCKET_DAYS,
+            }
+        )
+    counts = history.groupby(["equipment_name", "part_name", "bucket"]).size()
+    sums = (
+        pd.DataFrame({"total": counts, "total_sq": counts**2})
+        .groupby(level=["equipment_name", "part_name"])
+        .sum()
+        .reset_index()
+    )
+    parts = parts.merge(sums, on=["equipment_name", "part_name"], how="left")
+
+    units = parts["qty_per_equipment"].fillna(1).astype(float)
+    total = parts["total"].fillna(0).astype(float)
+    total_sq = parts["total_sq"].fillna(0).astype(float)
+    bucket_mean = total / n_buckets
+    bucket_variance = (total_sq - total**2 / n_buckets) / (n_buckets - 1)
+    from_history = total > 0
+
+    # Оценка по справочнику: каждая позиция парка меняется раз в срок службы
+    fleet_units = parts["qty_in_fleet"].fillna(0).astype(float) * units
+    catalog_demand = fleet_units / (
+        parts["useful_life_months"].astype(float) * DAYS_IN_MONTH
+    )
+    parts["demand_source"] = np.where(from_history, "history", "catalog")
+    parts["daily_demand"] = np.where(
+        from_history, bucket_mean * units / DEMAND_BUCKET_DAYS, catalog_demand
+    )
+    parts["daily_variance"] = np.where(
+        from_history,
+        bucket_variance * units**2 / DEMAND_BUCKET_DAYS,
+        catalog_demand * units,
+    )
+    parts["procurement_time_days"] = parts["procurement_time_days"].fillna(0)
+    return parts[columns].reset_index(drop=True)
+
+
+def reorder_points(stats, service_level=0.95, lead_time_cv=REORDER_LEAD_TIME_CV):
+    """
+    Страховой запас и точка заказа для уровня сервиса service_level
+    (вероятность обойтись без нехватки за срок поставки) по результату
+    demand_statistics. Добавляет lead_time_demand, safety_stock,
+    reorder_point, below_reorder_point и shortfall (до точки заказа).
+    """
+    z = NormalDist().inv_cdf(service_level)
+    lead_time = stats["procurement_time_days"].to_numpy(dtype=float)
+    demand = stats["daily_demand"].to_numpy(dtype=float)
+    variance = stats["daily_variance"].to_numpy(dtype=float)
+    lead_time_demand = demand * lead_time
+    sigma = np.sqrt(lead_time * variance + demand**2 * (lead_time_cv * lead_time) ** 2)
+    safety_stock = np.ceil(np.maximum(z * sigma, 0))
+    reorder_point = np.ceil(lead_time_demand) + safety_stock
+    stock = stats["qty_in_stock"].fillna(0).to_numpy(dtype=float)
+    return stats.assign(
+        lead_time_demand=lead_time_demand,
+        safety_stock=safety_stock.astype(int),
+        reorder_point=reorder_point.astype(int),
+        below_reorder_point=stock <= reorder_point,
+        shortfall=np.maximum(reorder_point - stock, 0).astype(int),
+    )
@@ -0,0 +1,115 @@
+import os
+import re
+import threading
+import time
+
+from logly import logger
+from sqlalchemy import event, text
+
+# Маршрутизация чтения на реплику (DATABASE_READ_URL).
+# Чтение идет на реплику, только если ее отставание не больше
+# REPLICA_MAX_LAG_SECONDS и за это же время не было записи в основную БД
+# из того же источника, иначе только что сохраненные данные могли бы еще не
+# дойти до реплики. Источник - сессия Streamlit (set_write_scope в начале
+# перезапуска страницы); записи потоков без сессии (фоновые пересчеты,
+# командные скрипты) учитываются общей отметкой процесса и не отправляют
+# чтение сессий на основную БД. Записи других процессов (api.py, batch.py,
+# precompute.py --loop, другие экземпляры приложения) здесь не видны:
+# "чтение своих записей" выполняется только в пределах процесса.
+
+# Допустимое отставание реплики (сек.)
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+# Как часто проверять отставание реплики (сек.)
+REPLICA_LAG_CHECK_SECONDS = 2.0
+
+_WRITE_STATEMENT = re.compile(
+    r"^\s*(INSERT|UPDATE|DELETE|MERGE|CREATE|ALTER|DROP|TRUNCATE)\b", re.IGNORECASE
+)
+
+_lock = threading.Lock()
+_local = threading.local()
+# Время последней записи по источникам: ключ сессии или None (без сессии)
+_last_write = {}
+_lag = {"checked_at": float("-inf"), "seconds": 0.0}
+
+POSTGRES_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+def set_write_scope(key):
+    """
+    Источник записей и чтения текущего потока (ключ сессии Streamlit;
+    None - без сессии). Streamlit выполняет каждый перезапуск в своем потоке.
+    """
+    _local.key = key
+
+
+def record_write():
+    """
+    Отметка записи для источника текущего потока - для записей, выполненных
+    за него другим потоком (отложенная запись замен, write_queue.py)
+    """
+    now = time.monotonic()
+    with _lock:
+        _last_write[getattr(_local, "key", None)] = now
+        # Отметки старше допустимого отставания больше не влияют на чтение
+        if len(_last_write) > 1000:
+            for key, written_at in list(_last_write.items()):
+                if now - written_at > REPLICA_MAX_LAG_SECONDS:
+                    del _last_write[key]
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _WRITE_STATEMENT.match(statement):
+        record_write()
+
+
+def install_write_tracking(engine):
+    """Учет времени последней записи в основную БД по источникам"""
+    if not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def seconds_since_write():
+    """Сколько секунд прошло с последней записи источника текущего потока"""
+    with _lock:
+        written_at = _last_write.get(getattr(_local, "key", None), float("-inf"))
+    return time.monotonic() - written_at
+
+
+def replica_lag_seconds(read_engine):
+    """
+    Отставание реплики в секундах (с кэшированием на REPLICA_LAG_CHECK_SECONDS).
+    Для SQLite (две копии файла при локальной проверке) отставание не
+    измеряется и считается нулевым; недоступная реплика - бесконечное отставание.
+    """
+    now = time.monotonic()
+    with _lock:
+        if now - _lag["checked_at"] < REPLICA_LAG_CHECK_SECONDS:
+            return _lag["seconds"]
+    if read_engine.dialect.name == "postgresql":
+        try:
+            with read_engine.connect() as conn:
+                lag = float(conn.execute(text(POSTGRES_LAG_QUERY)).scalar() or 0.0)
+        except Exception as error:
+            logger.warning(f"Реплика недоступна, чтение с основной БД: {error}")
+            lag = float("inf")
+    else:
+        lag = 0.0
+    with _lock:
+        _lag.update(checked_at=now, seconds=lag)
+    return lag
+
+
+def use_replica(read_engine, primary_engine):
+    """Можно ли сейчас читать с реплики"""
+    if read_engine is primary_engine:
+        return False
+    if seconds_since_write() <= REPLICA_MAX_LAG_SECONDS:
+        return False
+    return replica_lag_seconds(read_engine) <= REPLICA_MAX_LAG_SECONDS
@@ -0,0 +1,182 @@
+import argparse
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from database import ReadSessionLocal, USE_DATABASE
+from export import EXPORT_FORMATS, write_xlsx
+from utils import configure_logging
+from wear_engine import get_model_names, iter_fleet_results
+
+# Отчеты по всему парку: "Анализ износа" (износ каждой запчасти каждой модели)
+# и "План закупок" (календарь закупок). Расчет идет пачками моделей
+# (iter_fleet_results), строки каждой пачки сразу дописываются в книгу XLSX,
+# поэтому отчет не собирается в памяти целиком.
+
+# Вид отчета: (название листа, колонки, подписи колонок, ширина колонок)
+REPORT_KINDS = {
+    "wear": (
+        "Анализ износа",
+        [
+            "equipment_name",
+            "part_name",
+            "total_needed",
+            "qty_in_stock",
+            "wear_level",
+            "remaining_pct",
+            "procurement_deadline",
+            "procurement_time_days",
+        ],
+        {
+            "equipment_name": "Оборудование",
+            "part_name": "Запчасть",
+            "total_needed": "Требуется",
+            "qty_in_stock": "На складе",
+            "wear_level": "Степень износа",
+            "remaining_pct": "Остаток (%)",
+            "procurement_deadline": "Срок закупки",
+            "procurement_time_days": "Время на закупку, дн.",
+        },
+        {
+            "equipment_name": 28,
+            "part_name": 28,
+            "wear_level": 16,
+            "remaining_pct": 12,
+            "procurement_deadline": 18,
+            "procurement_time_days": 22,
+        },
+    ),
+    "procurement": (
+        "План закупок",
+        ["date", "equipment", "part", "needed", "wear_level"],
+        {
+            "date": "Дата",
+            "equipment": "Оборудование",
+            "part": "Запчасть",
+            "needed": "Требуется",
+            "wear_level": "Срочность",
+        },
+        {"date": 18, "equipment": 28, "part": 28, "wear_level": 12},
+    ),
+}
+# Форматы отчетов (PDF не поддерживается: нет библиотеки с кириллицей)
+REPORT_FORMATS = {"xlsx": EXPORT_FORMATS["xlsx"]}
+# Оформление ячеек: зона износа - цветом, процент остатка - числом с 2 знаками
+REPORT_CELL_STYLES = {
+    "wear_level": lambda value: value,
+    "remaining_pct": lambda value: "number",
+}
+# Сколько раз за отчет обновлять прогресс (и проверять отмену), если парк
+# не слишком велик
+REPORT_PROGRESS_STEPS = 20
+
+
+class ReportCancelled(Exception):
+    """Генерация отчета отменена пользователем"""
+
+
+def iter_report_chunks(
+    db: Session,
+    kind: str,
+    as_of: Optional[datetime] = None,
+    batch_size: Optional[int] = None,
+    progress: Optional[Callable[[float, str], None]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Строки отчета пачками моделей оборудования (по умолчанию - не больше
+    20 моделей и не меньше REPORT_PROGRESS_STEPS пачек на парк).
+    После записи каждой пачки вызывается progress(доля, сообщение);
+    исключение из progress (например, ReportCancelled) прерывает генерацию.
+    """
+    if kind not in REPORT_KINDS:
+        raise ValueError(f"Неизвестный вид отчета: {kind}")
+    model_names = get_model_names(db)
+    if batch_size is None:
+        batch_size = min(20, max(1, -(-len(model_names) // REPORT_PROGRESS_STEPS)))
+    done = 0
+    for wear_df, plan_df in iter_fleet_results(
+        db, model_names, batch_size, as_of=as_of
+    ):
+        if kind == "wear":
+            frame = wear_df
+        else:
+            # Календарь по оборудованию: внутри модели - по дате закупки
+            frame = plan_df.sort_values(["equipment", "date"], kind="stable")
+        yield frame
+        done = min(done + batch_size, len(model_names))
+        if progress is not None:
+            progress(
+                done / len(model_names),
+                f"Обработано моделей: {done} из {len(model_names)}",
+            )
+
+
+def build_report(
+    db: Session,
+    kind: str,
+    path: str,
+    fmt: str = "xlsx",
+    as_of: Optional[datetime] = None,
+    batch_size: Optional[int] = None,
+    progress: Optional[Callable[[float, str], None]] = None,
+) -> int:
+    """Генерация отчета в файл, возвращает количество строк"""
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат отчета: {fmt}")
+    sheet_name, columns, headers, widths = REPORT_KINDS[kind]
+    return write_xlsx(
+        iter_report_chunks(db, kind, as_of, batch_size, progress),
+        path,
+        columns=columns,
+        sheet_name=sheet_name,
+        headers=headers,
+        widths=widths,
+        styles={
+            column: style
+            for column, style in REPORT_CELL_STYLES.items()
+            if column in columns
+        },
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Отчет по всему парку: анализ износа или план закупок (XLSX)"
+    )
+    parser.add_argument("kind", choices=sorted(REPORT_KINDS), help="Вид отчета")
+    parser.add_argument("output", help="Путь к файлу отчета")
+    parser.add_argument(
+        "--as-of",
+        type=datetime.fromisoformat,
+        help="Дата расчета в формате ГГГГ-ММ-ДД (по умолчанию - момент запуска)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Количество моделей оборудования, обрабатываемых за один проход",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not USE_DATABASE:
+        parser.error("Отчеты требуют базу данных (USE_DATABASE=true)")
+
+    db = ReadSessionLocal()
+    try:
+        rows = build_report(
+            db,
+            args.kind,
+            args.output,
+            as_of=args.as_of,
+            batch_size=args.batch_size,
+            progress=lambda fraction, message: print(message),
+        )
+    finally:
+        db.close()
+    print(f"Записано {rows} строк в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
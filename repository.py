@@ -0,0 +1,848 @@
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import crud
+from database import SessionLocal, ReadSessionLocal, USE_DATABASE
+from wear_engine import (
+    EQUIPMENT_COLUMNS,
+    REPLACEMENT_COLUMNS,
+    SPARE_PART_COLUMNS,
+    WORKSHOP_COLUMNS,
+    load_snapshot,
+)
+
+# Единый доступ к справочникам и истории замен для обоих режимов работы:
+#   SqlRepository    - функции crud.py поверх SQLAlchemy (USE_DATABASE=true);
+#   MemoryRepository - таблицы в памяти по колонкам с хеш-индексами по id,
+#                      названиям и VIN (USE_DATABASE=false, тесты, замеры).
+# Методы обеих реализаций совпадают с функциями crud.py без аргумента db и
+# возвращают записи-кортежи (не объекты ORM), а load_snapshot() - те же
+# DataFrame, что и wear_engine.load_snapshot. Поиск, снимки износа, задания
+# отчетов и прочие служебные таблицы есть только в БД и сюда не входят.
+
+EquipmentModelRecord = namedtuple(
+    "EquipmentModelRecord", ["id", "name", "qty_in_fleet"]
+)
+EquipmentRecord = namedtuple("EquipmentRecord", ["id", "model_id", "vin"])
+WorkshopRecord = namedtuple(
+    "WorkshopRecord", ["id", "name", "address", "daily_capacity"]
+)
+SparePartRecord = namedtuple(
+    "SparePartRecord",
+    [
+        "id",
+        "name",
+        "useful_life_months",
+        "equipment_model_id",
+        "qty_per_equipment",
+        "qty_in_stock",
+        "procurement_time_days",
+    ],
+)
+# Запись о замене вместе с VIN, моделью, запчастью и мастерской
+ReplacementRow = namedtuple(
+    "ReplacementRow",
+    [
+        "id",
+        "equipment_id",
+        "spare_part_id",
+        "workshop_id",
+        "replacement_date",
+        "replacement_type",
+        "notes",
+        "equipment_vin",
+        "equipment_model",
+        "spare_part_name",
+        "workshop_name",
+    ],
+)
+
+
+class SqlRepository:
+    """
+    Хранилище в БД: каждый вызов - отдельная сессия и функция crud.py.
+    Списочные запросы и снимок данных читаются через read_session_factory
+    (реплика, если она задана), остальное - через основную БД.
+    """
+
+    def __init__(self, session_factory=None, read_session_factory=None):
+        self.session_factory = session_factory or SessionLocal
+        self.read_session_factory = read_session_factory or ReadSessionLocal
+
+    def _call(self, func, *args, read=False, **kwargs):
+        factory = self.read_session_factory if read else self.session_factory
+        db = factory()
+        try:
+            return func(db, *args, **kwargs)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _model(obj) -> Optional[EquipmentModelRecord]:
+        return obj and EquipmentModelRecord(obj.id, obj.name, obj.qty_in_fleet)
+
+    @staticmethod
+    def _equipment(obj) -> Optional[EquipmentRecord]:
+        return obj and EquipmentRecord(obj.id, obj.model_id, obj.vin)
+
+    @staticmethod
+    def _workshop(obj) -> Optional[WorkshopRecord]:
+        return obj and WorkshopRecord(obj.id, obj.name, obj.address, obj.daily_capacity)
+
+    @staticmethod
+    def _spare_part(obj) -> Optional[SparePartRecord]:
+        return obj and SparePartRecord(
+            obj.id,
+            obj.name,
+            obj.useful_life_months,
+            obj.equipment_model_id,
+            obj.qty_per_equipment,
+            obj.qty_in_stock,
+            obj.procurement_time_days,
+        )
+
+    @staticmethod
+    def _replacement(obj) -> ReplacementRow:
+        # Связи подгружены запросом (crud.get_replacement_history_page)
+        return ReplacementRow(
+            obj.id,
+            obj.equipment_id,
+            obj.spare_part_id,
+            obj.workshop_id,
+            obj.replacement_date,
+            obj.replacement_type,
+            obj.notes,
+            obj.equipment.vin,
+            obj.equipment.model.name,
+            obj.spare_part.name,
+            obj.workshop.name,
+        )
+
+    # Модели оборудования
+    def create_equipment_model(
+        self, name: str, qty_in_fleet: int
+    ) -> EquipmentModelRecord:
+        return self._model(self._call(crud.create_equipment_model, name, qty_in_fleet))
+
+    def get_equipment_model(self, model_id: int) -> Optional[EquipmentModelRecord]:
+        return self._model(self._call(crud.get_equipment_model, model_id))
+
+    def get_equipment_model_by_name(self, name: str) -> Optional[EquipmentModelRecord]:
+        return self._model(self._call(crud.get_equipment_model_by_name, name))
+
+    def get_all_equipment_models(self) -> List[EquipmentModelRecord]:
+        return [self._model(obj) for obj in self._call(crud.get_all_equipment_models)]
+
+    def update_equipment_model(
+        self,
+        model_id: int,
+        name: Optional[str] = None,
+        qty_in_fleet: Optional[int] = None,
+    ) -> Optional[EquipmentModelRecord]:
+        return self._model(
+            self._call(crud.update_equipment_model, model_id, name, qty_in_fleet)
+        )
+
+    def delete_equipment_model(self, model_id: int) -> bool:
+        return self._call(crud.delete_equipment_model, model_id)
+
+    # Экземпляры оборудования
+    def create_equipment(self, model_id: int, vin: str) -> EquipmentRecord:
+        return self._equipment(self._call(crud.create_equipment, model_id, vin))
+
+    def get_equipment(self, equipment_id: int) -> Optional[EquipmentRecord]:
+        return self._equipment(self._call(crud.get_equipment, equipment_id))
+
+    def get_equipment_by_vin(self, vin: str) -> Optional[EquipmentRecord]:
+        return self._equipment(self._call(crud.get_equipment_by_vin, vin))
+
+    def get_equipment_by_model(self, model_id: int) -> List[EquipmentRecord]:
+        return [
+            self._equipment(obj)
+            for obj in self._call(crud.get_equipment_by_model, model_id, read=True)
+        ]
+
+    def find_vins_by_prefix(
+        self, prefix: str, model_id: Optional[int] = None, limit: int = 20
+    ) -> List[str]:
+        return self._call(crud.find_vins_by_prefix, prefix, model_id, limit, read=True)
+
+    def get_all_equipment(self) -> List[EquipmentRecord]:
+        return [self._equipment(obj) for obj in self._call(crud.get_all_equipment)]
+
+    def update_equipment(
+        self,
+        equipment_id: int,
+        vin: Optional[str] = None,
+        model_id: Optional[int] = None,
+    ) -> Optional[EquipmentRecord]:
+        return self._equipment(
+            self._call(crud.update_equipment, equipment_id, vin, model_id)
+        )
+
+    def delete_equipment(self, equipment_id: int) -> bool:
+        return self._call(crud.delete_equipment, equipment_id)
+
+    # Мастерские
+    def create_workshop(
+        self, name: str, address: str, daily_capacity: Optional[int] = None
+    ) -> WorkshopRecord:
+        return self._workshop(
+            self._call(crud.create_workshop, name, address, daily_capacity)
+        )
+
+    def get_all_workshops(self) -> List[WorkshopRecord]:
+        return [self._workshop(obj) for obj in self._call(crud.get_all_workshops)]
+
+    def update_workshop(
+        self,
+        workshop_id: int,
+        address: Optional[str] = None,
+        daily_capacity: Optional[int] = None,
+    ) -> Optional[WorkshopRecord]:
+        return self._workshop(
+            self._call(crud.update_workshop, workshop_id, address, daily_capacity)
+        )
+
+    # Запчасти
+    def create_spare_part(
+        self,
+        name: str,
+        useful_life_months: int,
+        equipment_model_id: int,
+        qty_per_equipment: int,
+        qty_in_stock: int,
+        procurement_time_days: int,
+    ) -> SparePartRecord:
+        return self._spare_part(
+            self._call(
+                crud.create_spare_part,
+                name,
+                useful_life_months,
+                equipment_model_id,
+                qty_per_equipment,
+                qty_in_stock,
+                procurement_time_days,
+            )
+        )
+
+    def get_spare_parts_by_equipment_model(
+        self, equipment_model_id: int
+    ) -> List[SparePartRecord]:
+        return [
+            self._spare_part(obj)
+            for obj in self._call(
+                crud.get_spare_parts_by_equipment_model, equipment_model_id
+            )
+        ]
+
+    def get_all_spare_parts(self) -> List[SparePartRecord]:
+        return [self._spare_part(obj) for obj in self._call(crud.get_all_spare_parts)]
+
+    def update_spare_part(
+        self,
+        spare_part_id: int,
+        useful_life_months: Optional[int] = None,
+        qty_per_equipment: Optional[int] = None,
+        qty_in_stock: Optional[int] = None,
+        procurement_time_days: Optional[int] = None,
+    ) -> Optional[SparePartRecord]:
+        return self._spare_part(
+            self._call(
+                crud.update_spare_part,
+                spare_part_id,
+                useful_life_months,
+                qty_per_equipment,
+                qty_in_stock,
+                procurement_time_days,
+            )
+        )
+
+    # Замены
+    def create_replacement_record(
+        self,
+        equipment_id: int,
+        spare_part_id: int,
+        workshop_id: int,
+        replacement_date: datetime,
+        replacement_type: str,
+        notes: Optional[str] = None,
+    ) -> int:
+        return self._call(
+            crud.create_replacement_record,
+            equipment_id,
+            spare_part_id,
+            workshop_id,
+            replacement_date,
+            replacement_type,
+            notes,
+        ).id
+
+    def create_replacement_records(self, records: List[dict]) -> List[int]:
+        return self._call(crud.create_replacement_records, records)
+
+    def resolve_replacement_refs(self, items: List[dict]) -> List[Optional[dict]]:
+        return self._call(crud.resolve_replacement_refs, items)
+
+    def get_replacement_history_page(
+        self,
+        equipment_model_id: Optional[int] = None,
+        vin: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = 100,
+    ) -> List[ReplacementRow]:
+        return [
+            self._replacement(obj)
+            for obj in self._call(
+                crud.get_replacement_history_page,
+                equipment_model_id,
+                vin,
+                offset,
+                limit,
+                read=True,
+            )
+        ]
+
+    def get_replacement_records_by_equipment_model(
+        self, equipment_model_id: int
+    ) -> List[ReplacementRow]:
+        # Один запрос со связями вместо ленивой подгрузки по каждой записи
+        return self.get_replacement_history_page(equipment_model_id, limit=None)
+
+    def get_all_replacement_records(self) -> List[ReplacementRow]:
+        return self.get_replacement_history_page(limit=None)
+
+    def count_replacement_history(
+        self, equipment_model_id: Optional[int] = None, vin: Optional[str] = None
+    ) -> int:
+        return self._call(
+            crud.count_replacement_history, equipment_model_id, vin, read=True
+        )
+
+    def load_snapshot(
+        self, model_names: Optional[List[str]] = None
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        return self._call(load_snapshot, model_names, read=True)
+
+
+class ColumnTable:
+    """
+    Таблица в памяти по колонкам: список значений на колонку, хеш-индекс
+    id -> номер строки, уникальные индексы (значение -> id) и неуникальные
+    (значение -> множество id). Удаление - перенос последней строки на место
+    удаляемой, без сдвига колонок.
+    """
+
+    def __init__(self, columns, unique=(), indexed=()):
+        self.columns = {column: [] for column in columns}
+        self.ids = []
+        self.positions = {}
+        self.unique = {column: {} for column in unique}
+        self.indexed = {column: defaultdict(set) for column in indexed}
+        self.next_id = 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _check_unique(self, values: dict, row_id: Optional[int] = None) -> None:
+        for column, index in self.unique.items():
+            if column in values and index.get(values[column], row_id) != row_id:
+                raise ValueError(f"{column}={values[column]!r} уже существует")
+
+    def _index(self, row_id: int, values: dict, add: bool = True) -> None:
+        for column, index in self.unique.items():
+            if column in values:
+                if add:
+                    index[values[column]] = row_id
+                else:
+                    index.pop(values[column], None)
+        for column, index in self.indexed.items():
+            if column in values:
+                if add:
+                    index[values[column]].add(row_id)
+                else:
+                    index[values[column]].discard(row_id)
+
+    def insert(self, values: dict) -> int:
+        self._check_unique(values)
+        row_id = self.next_id
+        self.next_id += 1
+        self.positions[row_id] = len(self.ids)
+        self.ids.append(row_id)
+        for column, data in self.columns.items():
+            data.append(values.get(column))
+        self._index(row_id, values)
+        return row_id
+
+    def get(self, row_id: int) -> Optional[dict]:
+        position = self.positions.get(row_id)
+        if position is None:
+            return None
+        row = {"id": row_id}
+        for column, data in self.columns.items():
+            row[column] = data[position]
+        return row
+
+    def find(self, column: str, value) -> Optional[dict]:
+        """Строка по уникальному индексу"""
+        return self.get(self.unique[column].get(value))
+
+    def select(self, column: str, value) -> List[int]:
+        """id строк по неуникальному индексу (по возрастанию)"""
+        return sorted(self.indexed[column].get(value, ()))
+
+    def update(self, row_id: int, values: dict) -> Optional[dict]:
+        old = self.get(row_id)
+        if old is None:
+            return None
+        self._check_unique(values, row_id)
+        position = self.positions[row_id]
+        self._index(row_id, {column: old[column] for column in values}, add=False)
+        for column, value in values.items():
+            self.columns[column][position] = value
+        self._index(row_id, values)
+        return self.get(row_id)
+
+    def delete(self, row_id: int) -> Optional[dict]:
+        old = self.get(row_id)
+        if old is None:
+            return None
+        self._index(row_id, old, add=False)
+        position = self.positions.pop(row_id)
+        last = len(self.ids) - 1
+        if position != last:
+            moved_id = self.ids[last]
+            self.ids[position] = moved_id
+            self.positions[moved_id] = position
+            for data in self.columns.values():
+                data[position] = data[last]
+        self.ids.pop()
+        for data in self.columns.values():
+            data.pop()
+        return old
+
+    def rows(self, ids=None) -> List[dict]:
+        return [
+            self.get(row_id) for row_id in (sorted(self.ids) if ids is None else ids)
+        ]
+
+    def frame(self) -> pd.DataFrame:
+        """Все строки одним DataFrame (индекс - id, по возрастанию)"""
+        return pd.DataFrame(
+            {column: list(data) for column, data in self.columns.items()},
+            index=pd.Index(list(self.ids), name="id"),
+        ).sort_index()
+
+
+class MemoryRepository:
+    """
+    Хранилище в памяти с тем же набором методов, что у SqlRepository:
+    поиск по id, названию модели/мастерской и VIN - по хеш-индексам,
+    VIN по префиксу - двоичным поиском по отсортированным спискам.
+    """
+
+    def __init__(self):
+        self.models = ColumnTable(EQUIPMENT_COLUMNS, unique=["name"])
+        self.equipment = ColumnTable(
+            ["model_id", "vin"], unique=["vin"], indexed=["model_id"]
+        )
+        self.workshops = ColumnTable(WORKSHOP_COLUMNS, unique=["name"])
+        self.spare_parts = ColumnTable(
+            [field for field in SparePartRecord._fields if field != "id"],
+            indexed=["equipment_model_id"],
+        )
+        self.replacements = ColumnTable(
+            [
+                "equipment_id",
+                "spare_part_id",
+                "workshop_id",
+                "replacement_date",
+                "replacement_type",
+                "notes",
+            ],
+            indexed=["equipment_id"],
+        )
+        # Отсортированные VIN: все (ключ None) и по каждой модели
+        self._sorted_vins: Dict[Optional[int], List[str]] = defaultdict(list)
+
+    def _index_vin(self, model_id: Optional[int], vin: str, add: bool = True) -> None:
+        # VIN без модели (модель удалена) - только в общем списке
+        for key in (None,) if model_id is None else (None, model_id):
+            vins = self._sorted_vins[key]
+            if add:
+                insort(vins, vin)
+            else:
+                del vins[bisect_left(vins, vin)]
+
+    # Модели оборудования
+    def create_equipment_model(
+        self, name: str, qty_in_fleet: int
+    ) -> EquipmentModelRecord:
+        model_id = self.models.insert({"name": name, "qty_in_fleet": qty_in_fleet})
+        return self.get_equipment_model(model_id)
+
+    def get_equipment_model(self, model_id: int) -> Optional[EquipmentModelRecord]:
+        row = self.models.get(model_id)
+        return row and EquipmentModelRecord(**row)
+
+    def get_equipment_model_by_name(self, name: str) -> Optional[EquipmentModelRecord]:
+        row = self.models.find("name", name)
+        return row and EquipmentModelRecord(**row)
+
+    def get_all_equipment_models(self) -> List[EquipmentModelRecord]:
+        return [EquipmentModelRecord(**row) for row in self.models.rows()]
+
+    def update_equipment_model(
+        self,
+        model_id: int,
+        name: Optional[str] = None,
+        qty_in_fleet: Optional[int] = None,
+    ) -> Optional[EquipmentModelRecord]:
+        values = {"name": name, "qty_in_fleet": qty_in_fleet}
+        row = self.models.update(
+            model_id, {key: value for key, value in values.items() if value is not None}
+        )
+        return row and EquipmentModelRecord(**row)
+
+    def delete_equipment_model(self, model_id: int) -> bool:
+        if self.models.delete(model_id) is None:
+            return False
+        # Как в БД: у экземпляров и запчастей модели ссылка обнуляется
+        for equipment_id in self.equipment.select("model_id", model_id):
+            self.equipment.update(equipment_id, {"model_id": None})
+        self._sorted_vins.pop(model_id, None)
+        for spare_part_id in self.spare_parts.select("equipment_model_id", model_id):
+            self.spare_parts.update(spare_part_id, {"equipment_model_id": None})
+        return True
+
+    # Экземпляры оборудования
+    def create_equipment(self, model_id: int, vin: str) -> EquipmentRecord:
+        vin = crud.normalize_vin(vin)
+        equipment_id = self.equipment.insert({"model_id": model_id, "vin": vin})
+        self._index_vin(model_id, vin)
+        return self.get_equipment(equipment_id)
+
+    def get_equipment(self, equipment_id: int) -> Optional[EquipmentRecord]:
+        row = self.equipment.get(equipment_id)
+        return row and EquipmentRecord(**row)
+
+    def get_equipment_by_vin(self, vin: str) -> Optional[EquipmentRecord]:
+        row = self.equipment.find("vin", crud.normalize_vin(vin))
+        return row and EquipmentRecord(**row)
+
+    def get_equipment_by_model(self, model_id: int) -> List[EquipmentRecord]:
+        return [
+            EquipmentRecord(**row)
+            for row in self.equipment.rows(self.equipment.select("model_id", model_id))
+        ]
+
+    def find_vins_by_prefix(
+        self, prefix: str, model_id: Optional[int] = None, limit: int = 20
+    ) -> List[str]:
+        prefix = crud.normalize_vin(prefix or "")
+        vins = self._sorted_vins.get(model_id, [])
+        result = []
+        for position in range(bisect_left(vins, prefix), len(vins)):
+            if len(result) >= limit or not vins[position].startswith(prefix):
+                break
+            result.append(vins[position])
+        return result
+
+    def get_all_equipment(self) -> List[EquipmentRecord]:
+        return [EquipmentRecord(**row) for row in self.equipment.rows()]
+
+    def update_equipment(
+        self,
+        equipment_id: int,
+        vin: Optional[str] = None,
+        model_id: Optional[int] = None,
+    ) -> Optional[EquipmentRecord]:
+        old = self.equipment.get(equipment_id)
+        if old is None:
+            return None
+        values = {
+            "vin": None if vin is None else crud.normalize_vin(vin),
+            "model_id": model_id,
+        }
+        row = self.equipment.update(
+            equipment_id,
+            {key: value for key, value in values.items() if value is not None},
+        )
+        self._index_vin(old["model_id"], old["vin"], add=False)
+        self._index_vin(row["model_id"], row["vin"])
+        return EquipmentRecord(**row)
+
+    def delete_equipment(self, equipment_id: int) -> bool:
+        old = self.equipment.delete(equipment_id)
+        if old is None:
+            return False
+        self._index_vin(old["model_id"], old["vin"], add=False)
+        # Как в БД: у замен этого VIN ссылка обнуляется
+        for replacement_id in self.replacements.select("equipment_id", equipment_id):
+            self.replacements.update(replacement_id, {"equipment_id": None})
+        return True
+
+    # Мастерские
+    def create_workshop(
+        self, name: str, address: str, daily_capacity: Optional[int] = None
+    ) -> WorkshopRecord:
+        workshop_id = self.workshops.insert(
+            {"name": name, "address": address, "daily_capacity": daily_capacity}
+        )
+        return WorkshopRecord(**self.workshops.get(workshop_id))
+
+    def get_all_workshops(self) -> List[WorkshopRecord]:
+        return [WorkshopRecord(**row) for row in self.workshops.rows()]
+
+    def update_workshop(
+        self,
+        workshop_id: int,
+        address: Optional[str] = None,
+        daily_capacity: Optional[int] = None,
+    ) -> Optional[WorkshopRecord]:
+        values = {"address": address, "daily_capacity": daily_capacity}
+        row = self.workshops.update(
+            workshop_id,
+            {key: value for key, value in values.items() if value is not None},
+        )
+        return row and WorkshopRecord(**row)
+
+    # Запчасти
+    def create_spare_part(
+        self,
+        name: str,
+        useful_life_months: int,
+        equipment_model_id: int,
+        qty_per_equipment: int,
+        qty_in_stock: int,
+        procurement_time_days: int,
+    ) -> SparePartRecord:
+        spare_part_id = self.spare_parts.insert(
+            {
+                "name": name,
+                "useful_life_months": useful_life_months,
+                "equipment_model_id": equipment_model_id,
+                "qty_per_equipment": qty_per_equipment,
+                "qty_in_stock": qty_in_stock,
+                "procurement_time_days": procurement_time_days,
+            }
+        )
+        return SparePartRecord(**self.spare_parts.get(spare_part_id))
+
+    def get_spare_parts_by_equipment_model(
+        self, equipment_model_id: int
+    ) -> List[SparePartRecord]:
+        return [
+            SparePartRecord(**row)
+            for row in self.spare_parts.rows(
+                self.spare_parts.select("equipment_model_id", equipment_model_id)
+            )
+        ]
+
+    def get_all_spare_parts(self) -> List[SparePartRecord]:
+        return [SparePartRecord(**row) for row in self.spare_parts.rows()]
+
+    def update_spare_part(
+        self,
+        spare_part_id: int,
+        useful_life_months: Optional[int] = None,
+        qty_per_equipment: Optional[int] = None,
+        qty_in_stock: Optional[int] = None,
+        procurement_time_days: Optional[int] = None,
+    ) -> Optional[SparePartRecord]:
+        values = {
+            "useful_life_months": useful_life_months,
+            "qty_per_equipment": qty_per_equipment,
+            "qty_in_stock": qty_in_stock,
+            "procurement_time_days": procurement_time_days,
+        }
+        row = self.spare_parts.update(
+            spare_part_id,
+            {key: value for key, value in values.items() if value is not None},
+        )
+        return row and SparePartRecord(**row)
+
+    # Замены
+    def create_replacement_record(
+        self,
+        equipment_id: int,
+        spare_part_id: int,
+        workshop_id: int,
+        replacement_date: datetime,
+        replacement_type: str,
+        notes: Optional[str] = None,
+    ) -> int:
+        return self.replacements.insert(
+            {
+                "equipment_id": equipment_id,
+                "spare_part_id": spare_part_id,
+                "workshop_id": workshop_id,
+                "replacement_date": replacement_date,
+                "replacement_type": replacement_type,
+                "notes": notes,
+            }
+        )
+
+    def create_replacement_records(self, records: List[dict]) -> List[int]:
+        return [self.replacements.insert(record) for record in records]
+
+    def resolve_replacement_refs(self, items: List[dict]) -> List[Optional[dict]]:
+        refs = []
+        for item in items:
+            eq = self.equipment.find("vin", crud.normalize_vin(item["equipment_vin"]))
+            ws = self.workshops.find("name", item["workshop_name"])
+            sp_id = eq and next(
+                (
+                    sp_id
+                    for sp_id in self.spare_parts.select(
+                        "equipment_model_id", eq["model_id"]
+                    )
+                    if self.spare_parts.get(sp_id)["name"] == item["spare_part_name"]
+                ),
+                None,
+            )
+            if eq and sp_id and ws:
+                refs.append(
+                    {
+                        "equipment_id": eq["id"],
+                        "spare_part_id": sp_id,
+                        "workshop_id": ws["id"],
+                        "equipment_model": self.models.get(eq["model_id"])["name"],
+                    }
+                )
+            else:
+                refs.append(None)
+        return refs
+
+    def _replacement_row(self, row: dict) -> Optional[ReplacementRow]:
+        """Строка истории с названиями; None - ссылка удалена (как при JOIN в БД)"""
+        eq = self.equipment.get(row["equipment_id"])
+        model = eq and self.models.get(eq["model_id"])
+        spare_part = self.spare_parts.get(row["spare_part_id"])
+        workshop = self.workshops.get(row["workshop_id"])
+        if not (model and spare_part and workshop):
+            return None
+        return ReplacementRow(
+            **row,
+            equipment_vin=eq["vin"],
+            equipment_model=model["name"],
+            spare_part_name=spare_part["name"],
+            workshop_name=workshop["name"],
+        )
+
+    def _replacement_history_ids(
+        self, equipment_model_id: Optional[int] = None, vin: Optional[str] = None
+    ) -> List[int]:
+        if vin is not None:
+            eq = self.equipment.find("vin", vin)
+            if eq is None or equipment_model_id not in (None, eq["model_id"]):
+                return []
+            equipment_ids = [eq["id"]]
+        elif equipment_model_id is not None:
+            equipment_ids = self.equipment.select("model_id", equipment_model_id)
+        else:
+            return list(self.replacements.ids)
+        return [
+            replacement_id
+            for equipment_id in equipment_ids
+            for replacement_id in self.replacements.select("equipment_id", equipment_id)
+        ]
+
+    def get_replacement_history_page(
+        self,
+        equipment_model_id: Optional[int] = None,
+        vin: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = 100,
+    ) -> List[ReplacementRow]:
+        """Страница истории замен (новые сверху)"""
+        rows = sorted(
+            self.replacements.rows(
+                self._replacement_history_ids(equipment_model_id, vin)
+            ),
+            key=lambda row: (row["replacement_date"], row["id"]),
+            reverse=True,
+        )
+        end = None if limit is None else offset + limit
+        return list(islice(filter(None, map(self._replacement_row, rows)), offset, end))
+
+    def get_replacement_records_by_equipment_model(
+        self, equipment_model_id: int
+    ) -> List[ReplacementRow]:
+        return self.get_replacement_history_page(equipment_model_id, limit=None)
+
+    def get_all_replacement_records(self) -> List[ReplacementRow]:
+        return self.get_replacement_history_page(limit=None)
+
+    def count_replacement_history(
+        self, equipment_model_id: Optional[int] = None, vin: Optional[str] = None
+    ) -> int:
+        return sum(
+            self._replacement_row(row) is not None
+            for row in self.replacements.rows(
+                self._replacement_history_ids(equipment_model_id, vin)
+            )
+        )
+
+    def load_snapshot(
+        self, model_names: Optional[List[str]] = None
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        Снимок в формате wear_engine.load_snapshot: названия подставляются
+        по id векторно, строки с удаленными ссылками отбрасываются (как при
+        JOIN в БД)
+        """
+        equipment_df = self.models.frame()
+        model_name = equipment_df["name"]
+        vins = self.equipment.frame()
+        workshop_name = self.workshops.frame()["name"]
+        part_name = self.spare_parts.frame()["name"]
+
+        parts = self.spare_parts.frame()
+        parts["parent_equipment"] = parts["equipment_model_id"].map(model_name)
+        spare_parts_df = parts.dropna(subset=["parent_equipment"])[SPARE_PART_COLUMNS]
+
+        history = self.replacements.frame()
+        history["equipment_vin"] = history["equipment_id"].map(vins["vin"])
+        history["equipment_model"] = (
+            history["equipment_id"].map(vins["model_id"]).map(model_name)
+        )
+        history["spare_part_name"] = history["spare_part_id"].map(part_name)
+        history["workshop_name"] = history["workshop_id"].map(workshop_name)
+        history["replacement_date"] = pd.to_datetime(history["replacement_date"])
+        replacements_df = history.dropna(
+            subset=[
+                "equipment_vin",
+                "equipment_model",
+                "spare_part_name",
+                "workshop_name",
+            ]
+        )[REPLACEMENT_COLUMNS]
+
+        workshops_df = self.workshops.frame()[WORKSHOP_COLUMNS]
+        if model_names is not None:
+            equipment_df = equipment_df[equipment_df["name"].isin(model_names)]
+            spare_parts_df = spare_parts_df[
+                spare_parts_df["parent_equipment"].isin(model_names)
+            ]
+            replacements_df = replacements_df[
+                replacements_df["equipment_model"].isin(model_names)
+            ]
+        return (
+            equipment_df[EQUIPMENT_COLUMNS],
+            workshops_df,
+            spare_parts_df,
+            replacements_df,
+        )
+
+
+def create_repository():
+    """Хранилище текущего режима: БД (USE_DATABASE=true) или пустое в памяти"""
+    if USE_DATABASE:
+        return SqlRepository()
+    return MemoryRepository()
@@ -0,0 +1,478 @@
+import argparse
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, insert, or_, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from database import (
+    SessionLocal,
+    USE_DATABASE,
+    EquipmentModel,
+    Equipment,
+    Workshop,
+    SparePart,
+    ReplacementRecord,
+    WearThresholdEvent,
+    ScheduledReplacement,
+)
+from service_life import DAYS_IN_MONTH
+from utils import configure_logging
+from wear_events import refresh_wear_events
+
+# Расписание плановых замен по мастерским с учетом их дневной мощности.
+# Работа - замена запчасти на VIN: можно начинать с перехода в красную зону,
+# нужно успеть до окончания срока полезного использования (даты - из
+# wear_threshold_events). Жадный алгоритм: работы по возрастанию крайнего
+# срока, каждая - в ближайший свободный день мастерской, где эту запчасть
+# меняли в прошлый раз, иначе - в ближайший свободный день любой мастерской.
+# После записи замен перепланируются только изменившиеся позиции, остальные
+# назначения не меняются. Расписание обновляется фоновым пересчетом
+# (precompute.py) и командой python scheduling.py, а не при показе страницы;
+# одновременные обновления из разных процессов выполняются по очереди.
+
+# Горизонт планирования (дн.)
+SCHEDULE_HORIZON_DAYS = int(os.getenv("SCHEDULE_HORIZON_DAYS", "92"))
+# Мощность мастерской, если daily_capacity не задана (замен в рабочий день)
+WORKSHOP_DAILY_CAPACITY = int(os.getenv("WORKSHOP_DAILY_CAPACITY", "4"))
+# Рабочих дней в неделе (5 - с понедельника по пятницу)
+SCHEDULE_WORKDAYS = int(os.getenv("SCHEDULE_WORKDAYS", "5"))
+# Сколько позиций перепланировать за один запрос
+POSITIONS_CHUNK = 1000
+# Ключ pg_advisory_xact_lock для записи расписания
+SCHEDULE_LOCK_KEY = 0x7363686C
+
+SCHEDULE_STATUSES = ["planned", "late", "unscheduled"]
+
+
+class WorkshopSchedule:
+    """
+    Календарь загрузки мастерских: мощность и загрузка - матрицы
+    мастерская x день горизонта, поиск свободного дня - векторный
+    """
+
+    def __init__(self, capacities: Dict[int, int], start: date, days: int):
+        self.start = start
+        self.days = days
+        self.workshop_ids = list(capacities)
+        self.rows = {workshop_id: i for i, workshop_id in enumerate(self.workshop_ids)}
+        workdays = np.array(
+            [
+                (start + timedelta(days=day)).weekday() < SCHEDULE_WORKDAYS
+                for day in range(days)
+            ]
+        )
+        self.capacity = np.outer(
+            np.array(list(capacities.values()), dtype=int), workdays
+        ).astype(int)
+        self.load = np.zeros_like(self.capacity)
+        self.assignments = {}
+
+    def _day(self, value: date) -> int:
+        return (value - self.start).days
+
+    def reserve(self, workshop_id: int, scheduled_date: date):
+        """Учет уже назначенной работы (при перепланировании части позиций)"""
+        day = self._day(scheduled_date)
+        if workshop_id in self.rows and 0 <= day < self.days:
+            self.load[self.rows[workshop_id], day] += 1
+
+    def _first_free(self, rows: List[int], first: int, last: int):
+        """Ближайший день в [first, last] со свободной мощностью: (строка, день)"""
+        first, last = max(first, 0), min(last, self.days - 1)
+        if first > last or not rows:
+            return None
+        free = self.load[rows, first : last + 1] < self.capacity[rows, first : last + 1]
+        has_free = free.any(axis=1)
+        if not has_free.any():
+            return None
+        offsets = np.where(has_free, free.argmax(axis=1), self.days)
+        best = offsets.min()
+        # Из мастерских со свободным днем - наименее загруженная в этот день
+        candidates = np.flatnonzero(offsets == best)
+        loads = self.load[[rows[i] for i in candidates], first + best]
+        return rows[candidates[loads.argmin()]], first + best
+
+    def place(
+        self,
+        position: Tuple[int, int],
+        release_date: date,
+        due_date: date,
+        preferred_workshop_id: Optional[int] = None,
+    ) -> str:
+        """Назначение работы, возвращает статус ('planned', 'late', 'unscheduled')"""
+        release, due = self._day(release_date), self._day(due_date)
+        all_rows = list(range(len(self.workshop_ids)))
+        slot = None
+        if preferred_workshop_id in self.rows:
+            slot = self._first_free([self.rows[preferred_workshop_id]], release, due)
+        if slot is None:
+            slot = self._first_free(all_rows, release, due)
+        status = "planned"
+        if slot is None:
+            # Крайний срок не выдержать - как можно раньше после него
+            slot = self._first_free(all_rows, release, self.days - 1)
+            status = "late" if slot is not None else "unscheduled"
+        if slot is not None:
+            self.load[slot] += 1
+        self.assignments[position] = (slot, status)
+        return status
+
+    def plan(self, jobs: pd.DataFrame):
+        """Жадное назначение работ по возрастанию крайнего срока"""
+        jobs = jobs.sort_values(["due_date", "release_date"], kind="stable")
+        for job in jobs.itertuples(index=False):
+            self.place(
+                (job.equipment_id, job.spare_part_id),
+                job.release_date,
+                job.due_date,
+                None if pd.isna(job.workshop_id) else int(job.workshop_id),
+            )
+
+    def records(self, jobs: pd.DataFrame) -> List[dict]:
+        """Строки scheduled_replacements для назначенных работ"""
+        records = []
+        for job in jobs.itertuples(index=False):
+            position = (job.equipment_id, job.spare_part_id)
+            slot, status = self.assignments[position]
+            records.append(
+                {
+                    "equipment_id": job.equipment_id,
+                    "spare_part_id": job.spare_part_id,
+                    "workshop_id": (
+                        self.workshop_ids[slot[0]] if slot is not None else None
+                    ),
+                    "scheduled_date": (
+                        self.start + timedelta(days=int(slot[1]))
+                        if slot is not None
+                        else None
+                    ),
+                    "release_date": job.release_date,
+                    "due_date": job.due_date,
+                    "last_replacement": job.last_replacement.to_pydatetime(),
+                    "status": status,
+                }
+            )
+        return records
+
+
+def load_capacities(db: Session) -> Dict[int, int]:
+    """Дневная мощность мастерских (не задана - WORKSHOP_DAILY_CAPACITY)"""
+    return {
+        workshop_id: (WORKSHOP_DAILY_CAPACITY if capacity is None else max(capacity, 0))
+        for workshop_id, capacity in db.execute(
+            select(Workshop.id, Workshop.daily_capacity).order_by(Workshop.id)
+        )
+    }
+
+
+def _jobs_query():
+    """
+    Работы по позициям: переход в красную зону, последняя замена, срок
+    службы и мастерская последней замены
+    """
+    return (
+        select(
+            WearThresholdEvent.equipment_id,
+            WearThresholdEvent.spare_part_id,
+            WearThresholdEvent.event_date,
+            WearThresholdEvent.last_replacement,
+            SparePart.useful_life_months,
+            ReplacementRecord.workshop_id,
+        )
+        .join(SparePart, SparePart.id == WearThresholdEvent.spare_part_id)
+        .outerjoin(
+            ReplacementRecord,
+            (ReplacementRecord.equipment_id == WearThresholdEvent.equipment_id)
+            & (ReplacementRecord.spare_part_id == WearThresholdEvent.spare_part_id)
+            & (
+                ReplacementRecord.replacement_date
+                == WearThresholdEvent.last_replacement
+            ),
+        )
+        .where(WearThresholdEvent.threshold == "red")
+    )
+
+
+def _jobs_frame(rows) -> pd.DataFrame:
+    frame = pd.DataFrame(
+        rows,
+        columns=[
+            "equipment_id",
+            "spare_part_id",
+            "red_date",
+            "last_replacement",
+            "useful_life_months",
+            "workshop_id",
+        ],
+    ).drop_duplicates(["equipment_id", "spare_part_id"])
+    frame["last_replacement"] = pd.to_datetime(frame["last_replacement"])
+    frame["release_date"] = pd.to_datetime(frame["red_date"]).dt.date
+    frame["due_date"] = (
+        frame["last_replacement"]
+        + pd.to_timedelta(
+            frame["useful_life_months"].astype(float) * DAYS_IN_MONTH, unit="D"
+        )
+    ).dt.date
+    return frame.drop(columns=["red_date", "useful_life_months"])
+
+
+def load_jobs(
+    db: Session,
+    horizon_end: Optional[date] = None,
+    positions: Optional[List[Tuple[int, int]]] = None,
+) -> pd.DataFrame:
+    """
+    Работы, которые можно начать до horizon_end (выборка по индексу
+    event_date), или работы позиций positions: equipment_id, spare_part_id,
+    last_replacement, workshop_id, release_date, due_date
+    """
+    stmt = _jobs_query()
+    if horizon_end is not None:
+        stmt = stmt.where(
+            WearThresholdEvent.event_date
+            < datetime.combine(horizon_end, datetime.min.time())
+        )
+    if positions is None:
+        return _jobs_frame(db.execute(stmt).all())
+    rows = []
+    for start in range(0, len(positions), POSITIONS_CHUNK):
+        rows += db.execute(
+            stmt.where(
+                tuple_(
+                    WearThresholdEvent.equipment_id,
+                    WearThresholdEvent.spare_part_id,
+                ).in_(positions[start : start + POSITIONS_CHUNK])
+            )
+        ).all()
+    return _jobs_frame(rows)
+
+
+def _changed_positions(db: Session, start: date, horizon_end: date):
+    """
+    Позиции, которые нужно перепланировать: с новой заменой (или без
+    событий), назначенные на прошедший день и новые - вошедшие в горизонт
+    """
+    red = (
+        (WearThresholdEvent.equipment_id == ScheduledReplacement.equipment_id)
+        & (WearThresholdEvent.spare_part_id == ScheduledReplacement.spare_part_id)
+        & (WearThresholdEvent.threshold == "red")
+    )
+    stale = (
+        select(ScheduledReplacement.equipment_id, ScheduledReplacement.spare_part_id)
+        .outerjoin(WearThresholdEvent, red)
+        .where(
+            or_(
+                WearThresholdEvent.last_replacement.is_(None),
+                WearThresholdEvent.last_replacement
+                != ScheduledReplacement.last_replacement,
+                ScheduledReplacement.scheduled_date < start,
+            )
+        )
+    )
+    new = (
+        select(WearThresholdEvent.equipment_id, WearThresholdEvent.spare_part_id)
+        .outerjoin(ScheduledReplacement, red)
+        .where(
+            WearThresholdEvent.threshold == "red",
+            WearThresholdEvent.event_date
+            < datetime.combine(horizon_end, datetime.min.time()),
+            ScheduledReplacement.equipment_id.is_(None),
+        )
+    )
+    return sorted({tuple(row) for stmt in (stale, new) for row in db.execute(stmt)})
+
+
+def _lock_schedule(db: Session) -> None:
+    """
+    Блокировка записи расписания до конца транзакции (PostgreSQL): иначе
+    одновременные перепланирования вставляют одни и те же позиции
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEDULE_LOCK_KEY}
+        )
+
+
+def build_schedule(
+    db: Session,
+    start: Optional[date] = None,
+    horizon_days: int = SCHEDULE_HORIZON_DAYS,
+) -> WorkshopSchedule:
+    """Полное планирование всех работ горизонта (расписание перезаписывается)"""
+    start = date.today() if start is None else start
+    refresh_wear_events(db)
+    _lock_schedule(db)
+    schedule = WorkshopSchedule(load_capacities(db), start, horizon_days)
+    jobs = load_jobs(db, start + timedelta(days=horizon_days))
+    schedule.plan(jobs)
+    try:
+        db.execute(delete(ScheduledReplacement))
+        if not jobs.empty:
+            db.execute(insert(ScheduledReplacement), schedule.records(jobs))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return schedule
+
+
+def replan_positions(
+    db: Session,
+    positions: Iterable[Tuple[int, int]],
+    start: Optional[date] = None,
+    horizon_days: int = SCHEDULE_HORIZON_DAYS,
+) -> WorkshopSchedule:
+    """
+    Перепланирование отдельных позиций: назначения остальных работ
+    занимают мощность мастерских и не меняются
+    """
+    start = date.today() if start is None else start
+    positions = sorted(set(positions))
+    _lock_schedule(db)
+    schedule = WorkshopSchedule(load_capacities(db), start, horizon_days)
+    changed = set(positions)
+    for equipment_id, spare_part_id, workshop_id, scheduled_date in db.execute(
+        select(
+            ScheduledReplacement.equipment_id,
+            ScheduledReplacement.spare_part_id,
+            ScheduledReplacement.workshop_id,
+            ScheduledReplacement.scheduled_date,
+        ).where(ScheduledReplacement.scheduled_date >= start)
+    ):
+        if (equipment_id, spare_part_id) not in changed:
+            schedule.reserve(workshop_id, scheduled_date)
+    # Работа, начало которой ушло за горизонт, из расписания удаляется
+    jobs = load_jobs(db, start + timedelta(days=horizon_days), positions)
+    schedule.plan(jobs)
+    try:
+        for chunk_start in range(0, len(positions), POSITIONS_CHUNK):
+            db.execute(
+                delete(ScheduledReplacement).where(
+                    tuple_(
+                        ScheduledReplacement.equipment_id,
+                        ScheduledReplacement.spare_part_id,
+                    ).in_(positions[chunk_start : chunk_start + POSITIONS_CHUNK])
+                )
+            )
+        if not jobs.empty:
+            db.execute(insert(ScheduledReplacement), schedule.records(jobs))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return schedule
+
+
+def update_schedule(
+    db: Session,
+    start: Optional[date] = None,
+    horizon_days: int = SCHEDULE_HORIZON_DAYS,
+    full: bool = False,
+) -> int:
+    """
+    Актуализация расписания: при первом запуске (или full=True) - полное
+    планирование, иначе - только изменившиеся позиции.
+    Возвращает количество спланированных работ.
+    """
+    start = date.today() if start is None else start
+    if full or db.query(ScheduledReplacement).first() is None:
+        return len(build_schedule(db, start, horizon_days).assignments)
+    refresh_wear_events(db)
+    # Изменившиеся позиции - после завершения записи другого процесса
+    _lock_schedule(db)
+    positions = _changed_positions(db, start, start + timedelta(days=horizon_days))
+    if not positions:
+        db.rollback()
+        return 0
+    return len(replan_positions(db, positions, start, horizon_days).assignments)
+
+
+def get_schedule(db: Session) -> pd.DataFrame:
+    """
+    Расписание с названиями: scheduled_date, workshop, vin, equipment_model,
+    spare_part_name, release_date, due_date, status
+    """
+    stmt = (
+        select(
+            ScheduledReplacement.scheduled_date,
+            Workshop.name,
+            Equipment.vin,
+            EquipmentModel.name,
+            SparePart.name,
+            ScheduledReplacement.release_date,
+            ScheduledReplacement.due_date,
+            ScheduledReplacement.status,
+        )
+        .join(Equipment, Equipment.id == ScheduledReplacement.equipment_id)
+        .join(EquipmentModel, EquipmentModel.id == Equipment.model_id)
+        .join(SparePart, SparePart.id == ScheduledReplacement.spare_part_id)
+        .outerjoin(Workshop, Workshop.id == ScheduledReplacement.workshop_id)
+        .order_by(ScheduledReplacement.scheduled_date, Workshop.name)
+    )
+    frame = pd.DataFrame(
+        db.execute(stmt).all(),
+        columns=[
+            "scheduled_date",
+            "workshop",
+            "vin",
+            "equipment_model",
+            "spare_part_name",
+            "release_date",
+            "due_date",
+            "status",
+        ],
+    )
+    for column in ["scheduled_date", "release_date", "due_date"]:
+        frame[column] = pd.to_datetime(frame[column])
+    return frame
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Расписание плановых замен по мастерским с учетом их мощности"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Спланировать заново все работы (по умолчанию - только изменившиеся)",
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=SCHEDULE_HORIZON_DAYS,
+        help="Горизонт планирования в днях",
+    )
+    parser.add_argument(
+        "--start",
+        type=lambda value: datetime.fromisoformat(value).date(),
+        help="Начало горизонта в формате ГГГГ-ММ-ДД (по умолчанию - сегодня)",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not USE_DATABASE:
+        parser.error("Планирование требует базу данных (USE_DATABASE=true)")
+
+    db = SessionLocal()
+    try:
+        planned = update_schedule(db, args.start, args.days, args.full)
+        schedule = get_schedule(db)
+    finally:
+        db.close()
+    print(f"Спланировано работ: {planned}")
+    print(schedule["status"].value_counts().to_string())
+    print(
+        schedule.dropna(subset=["scheduled_date"])
+        .groupby("workshop")
+        .size()
+        .rename("Работ")
+        .to_string()
+    )
+
+
+if __name__ == "__main__":
+    main()
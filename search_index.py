@@ -0,0 +1,91 @@
+import os
+
+from sqlalchemy import text
+
+# Индексы для полнотекстового и нечеткого поиска.
+# PostgreSQL: pg_trgm (GIN-индексы по триграммам) и tsvector по примечаниям.
+# SQLite (локальная замена PostgreSQL): виртуальная таблица FTS5 с триграммным
+# токенизатором, синхронизируемая триггерами.
+
+# Сколько кандидатов из каждого источника участвует в ранжировании
+SEARCH_MAX_HITS = int(os.getenv("SEARCH_MAX_HITS", "1000"))
+# Минимальная длина запроса для триграммного индекса
+SEARCH_MIN_TRIGRAM = 3
+
+# (вид результата, таблица, столбец с текстом)
+SEARCH_SOURCES = [
+    ("replacement", "replacement_records", "notes"),
+    ("equipment", "equipment", "vin"),
+    ("spare_part", "spare_parts", "name"),
+    ("workshop", "workshops", "name"),
+]
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_replacement_records_notes_trgm "
+    "ON replacement_records USING gin (notes gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_replacement_records_notes_fts "
+    "ON replacement_records USING gin (to_tsvector('russian', coalesce(notes, '')))",
+    "CREATE INDEX IF NOT EXISTS ix_equipment_vin_trgm "
+    "ON equipment USING gin (vin gin_trgm_ops)",
+    # Подсказки по началу VIN (LIKE 'prefix%' при любой сортировке БД)
+    "CREATE INDEX IF NOT EXISTS ix_equipment_vin_prefix "
+    "ON equipment (vin varchar_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_spare_parts_name_trgm "
+    "ON spare_parts USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_workshops_name_trgm "
+    "ON workshops USING gin (name gin_trgm_ops)",
+]
+
+
+def _rowid(kind, ref):
+    """
+    rowid строки FTS5 по виду и id исходной записи: удаление и обновление
+    идут по rowid, без просмотра всего индекса
+    """
+    codes = [source[0] for source in SEARCH_SOURCES]
+    return f"{ref} * {len(codes)} + {codes.index(kind)}"
+
+
+def _sqlite_ddl():
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index "
+        "USING fts5(body, kind UNINDEXED, ref_id UNINDEXED, tokenize='trigram')"
+    ]
+    for kind, table, column in SEARCH_SOURCES:
+        insert = (
+            f"INSERT INTO search_index (rowid, body, kind, ref_id) "
+            f"VALUES ({_rowid(kind, 'new.id')}, coalesce(new.{column}, ''), "
+            f"'{kind}', new.id);"
+        )
+        delete = f"DELETE FROM search_index WHERE rowid = {_rowid(kind, 'old.id')};"
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} "
+            f"BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} "
+            f"BEGIN {delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE OF "
+            f"{column} ON {table} BEGIN {delete} {insert} END",
+        ]
+    return statements
+
+
+def ensure_search_indexes(engine):
+    """Создание поисковых индексов (повторный вызов ничего не меняет)"""
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+        elif engine.dialect.name == "sqlite":
+            for statement in _sqlite_ddl():
+                conn.execute(text(statement))
+            # Первичное заполнение индекса по уже существующим данным
+            if conn.execute(text("SELECT count(*) FROM search_index")).scalar() == 0:
+                for kind, table, column in SEARCH_SOURCES:
+                    conn.execute(
+                        text(
+                            f"INSERT INTO search_index (rowid, body, kind, ref_id) "
+                            f"SELECT {_rowid(kind, 'id')}, coalesce({column}, ''), "
+                            f"'{kind}', id FROM {table}"
+                        )
+                    )
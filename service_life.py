@@ -0,0 +1,222 @@
+from datetime import datetime
+from typing import List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from database import (
+    EquipmentModel,
+    SparePart,
+    ReplacementRecord,
+    ReplacementInterval,
+    PartLifeStats,
+    ServiceLifeDirtyEquipment,
+)
+
+# Фактический срок службы запчастей по истории замен.
+# Интервалы между последовательными заменами одной запчасти на одном VIN
+# считаются в БД оконной функцией LAG() и хранятся в replacement_intervals;
+# пересчитываются только VIN, отмеченные в service_life_dirty_equipment.
+# Пересчет выполняет фоновый пересчет результатов (precompute.py), страницы
+# только читают part_life_stats.
+
+DAYS_IN_MONTH = 30.44
+# Ключ pg_advisory_xact_lock для пересчета: процессы выполняют его по очереди
+SERVICE_LIFE_LOCK_KEY = 0x6C696665
+
+
+def _interval_days(dialect_name, current, previous):
+    """Разница дат в днях для текущего диалекта SQL"""
+    if dialect_name == "postgresql":
+        return func.extract("epoch", current - previous) / 86400.0
+    return func.julianday(current) - func.julianday(previous)
+
+
+def _rebuild_intervals(db: Session, equipment_ids: List[int]) -> None:
+    """Пересчет интервалов для указанных VIN (LAG по equipment_id, spare_part_id)"""
+    db.execute(
+        delete(ReplacementInterval).where(
+            ReplacementInterval.equipment_id.in_(equipment_ids)
+        )
+    )
+    history = select(
+        ReplacementRecord.id,
+        ReplacementRecord.equipment_id,
+        ReplacementRecord.spare_part_id,
+        ReplacementRecord.replacement_type,
+        ReplacementRecord.replacement_date,
+        func.lag(ReplacementRecord.replacement_date)
+        .over(
+            partition_by=(
+                ReplacementRecord.equipment_id,
+                ReplacementRecord.spare_part_id,
+            ),
+            order_by=(ReplacementRecord.replacement_date, ReplacementRecord.id),
+        )
+        .label("previous_date"),
+    ).where(ReplacementRecord.equipment_id.in_(equipment_ids))
+    history = history.subquery()
+
+    db.execute(
+        insert(ReplacementInterval).from_select(
+            [
+                "replacement_id",
+                "equipment_id",
+                "spare_part_id",
+                "replacement_type",
+                "interval_days",
+            ],
+            select(
+                history.c.id,
+                history.c.equipment_id,
+                history.c.spare_part_id,
+                history.c.replacement_type,
+                _interval_days(
+                    db.get_bind().dialect.name,
+                    history.c.replacement_date,
+                    history.c.previous_date,
+                ),
+            ).where(history.c.previous_date.is_not(None)),
+        )
+    )
+
+
+def _rebuild_stats(db: Session, spare_part_ids: List[int]) -> None:
+    """Пересчет статистики интервалов для указанных запчастей"""
+    intervals = pd.DataFrame(
+        db.execute(
+            select(
+                ReplacementInterval.spare_part_id,
+                ReplacementInterval.interval_days,
+                ReplacementInterval.replacement_type,
+            ).where(ReplacementInterval.spare_part_id.in_(spare_part_ids))
+        ).all(),
+        columns=["spare_part_id", "interval_days", "replacement_type"],
+    )
+    grouped = intervals.groupby("spare_part_id")
+    days = grouped["interval_days"]
+    stats = pd.DataFrame(
+        {
+            "n_intervals": days.count(),
+            "median_days": days.median(),
+            "p10_days": days.quantile(0.1),
+            "p90_days": days.quantile(0.9),
+            "unscheduled_share": (intervals["replacement_type"] == "unscheduled")
+            .groupby(intervals["spare_part_id"])
+            .mean(),
+        }
+    )
+
+    refreshed_at = datetime.now()
+    db.execute(
+        delete(PartLifeStats).where(PartLifeStats.spare_part_id.in_(spare_part_ids))
+    )
+    rows = []
+    for spare_part_id in spare_part_ids:
+        row = {"spare_part_id": spare_part_id, "refreshed_at": refreshed_at}
+        if spare_part_id in stats.index:
+            values = stats.loc[spare_part_id]
+            row.update(
+                n_intervals=int(values["n_intervals"]),
+                median_days=float(values["median_days"]),
+                p10_days=float(values["p10_days"]),
+                p90_days=float(values["p90_days"]),
+                unscheduled_share=float(values["unscheduled_share"]),
+            )
+        else:
+            row["n_intervals"] = 0
+        rows.append(row)
+    if rows:
+        db.execute(insert(PartLifeStats), rows)
+
+
+def refresh_service_life(db: Session, full: bool = False) -> int:
+    """
+    Инкрементальный пересчет фактического срока службы.
+    Обрабатываются только VIN с измененной историей замен; при первом запуске
+    (или full=True) - вся история. Возвращает количество пересчитанных VIN.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        # Иначе одновременные пересчеты вставляют одни и те же строки статистики
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": SERVICE_LIFE_LOCK_KEY}
+        )
+    if full or db.query(PartLifeStats).first() is None:
+        equipment_ids = list(
+            db.scalars(select(ReplacementRecord.equipment_id).distinct())
+        )
+    else:
+        equipment_ids = list(db.scalars(select(ServiceLifeDirtyEquipment.equipment_id)))
+    if not equipment_ids:
+        db.rollback()
+        return 0
+
+    # Запчасти, статистику которых нужно обновить: до и после пересчета интервалов
+    affected_parts = set(
+        db.scalars(
+            select(ReplacementInterval.spare_part_id)
+            .where(ReplacementInterval.equipment_id.in_(equipment_ids))
+            .distinct()
+        )
+    )
+    affected_parts.update(
+        db.scalars(
+            select(ReplacementRecord.spare_part_id)
+            .where(ReplacementRecord.equipment_id.in_(equipment_ids))
+            .distinct()
+        )
+    )
+
+    try:
+        _rebuild_intervals(db, equipment_ids)
+        _rebuild_stats(db, sorted(part for part in affected_parts if part is not None))
+        db.execute(
+            delete(ServiceLifeDirtyEquipment).where(
+                ServiceLifeDirtyEquipment.equipment_id.in_(equipment_ids)
+            )
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(equipment_ids)
+
+
+def get_service_life_frame(db: Session) -> pd.DataFrame:
+    """Справочный срок службы рядом с фактическим (в месяцах)"""
+    rows = db.execute(
+        select(
+            SparePart.name,
+            EquipmentModel.name,
+            SparePart.useful_life_months,
+            PartLifeStats.n_intervals,
+            PartLifeStats.median_days,
+            PartLifeStats.p10_days,
+            PartLifeStats.p90_days,
+            PartLifeStats.unscheduled_share,
+        )
+        .join(EquipmentModel, SparePart.equipment_model_id == EquipmentModel.id)
+        .outerjoin(PartLifeStats, PartLifeStats.spare_part_id == SparePart.id)
+        .order_by(SparePart.id)
+    ).all()
+    frame = pd.DataFrame(
+        rows,
+        columns=[
+            "name",
+            "parent_equipment",
+            "useful_life_months",
+            "n_intervals",
+            "median_days",
+            "p10_days",
+            "p90_days",
+            "unscheduled_share",
+        ],
+    )
+    for column in ["median", "p10", "p90"]:
+        frame[f"{column}_months"] = np.round(
+            frame.pop(f"{column}_days").astype(float) / DAYS_IN_MONTH, 1
+        )
+    frame["n_intervals"] = frame["n_intervals"].fillna(0).astype(int)
+    return frame
@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+
+# Моделирование расхода запчастей методом Монте-Карло.
+# Интервалы между заменами одной запчасти на одном VIN берутся из истории замен
+# (включая внеплановые отказы), по ним подбирается логнормальное распределение,
+# и для каждой запчасти разом моделируются тысячи вариантов расхода на горизонте.
+
+DAYS_IN_MONTH = 30.44
+# Минимум наблюдаемых интервалов для подбора распределения по истории
+MIN_INTERVALS = 3
+# Разброс срока службы, если по истории интервалов недостаточно
+DEFAULT_SIGMA = 0.25
+# Ограничение размера массива одной порции вариантов (позиций x вариантов)
+MAX_BLOCK_ELEMENTS = 4_000_000
+
+
+def estimate_failure_intervals(replacements_df):
+    """
+    Интервалы между последовательными заменами запчасти на одном VIN.
+    Возвращает по строке на (модель, запчасть): количество интервалов,
+    параметры логнормального распределения (mu, sigma от логарифма дней),
+    медиану интервала и долю внеплановых замен.
+    """
+    columns = [
+        "equipment_model",
+        "spare_part_name",
+        "n_intervals",
+        "mu",
+        "sigma",
+        "median_interval_days",
+        "unscheduled_share",
+    ]
+    if replacements_df.empty:
+        return pd.DataFrame(columns=columns)
+
+    history = replacements_df.sort_values(
+        ["equipment_vin", "spare_part_name", "replacement_date"], kind="stable"
+    )
+    intervals = (
+        history.groupby(["equipment_vin", "spare_part_name"])["replacement_date"]
+        .diff()
+        .dt.total_seconds()
+        / 86400
+    )
+    history = history.assign(interval_days=intervals)
+    history["log_interval"] = np.log(history["interval_days"].where(lambda x: x > 0))
+    history["unscheduled"] = history["replacement_type"] == "unscheduled"
+
+    grouped = history.groupby(["equipment_model", "spare_part_name"])
+    stats = grouped.agg(
+        n_intervals=("log_interval", "count"),
+        mu=("log_interval", "mean"),
+        sigma=("log_interval", "std"),
+        median_interval_days=("interval_days", "median"),
+        unscheduled_share=("unscheduled", "mean"),
+    ).reset_index()
+    return stats[columns]
+
+
+def _latest_by_vin(replacements_df):
+    if replacements_df.empty:
+        return pd.DataFrame(
+            columns=["equipment_model", "spare_part_name", "replacement_date"]
+        )
+    return (
+        replacements_df.groupby(
+            ["equipment_model", "spare_part_name", "equipment_vin"]
+        )["replacement_date"]
+        .max()
+        .reset_index()
+    )
+
+
+def _draw_intervals(rng, mu, sigma, early_share, size):
+    # float32 вдвое сокращает объем генерируемых данных, точности в днях достаточно
+    intervals = rng.standard_normal(size, dtype=np.float32)
+    intervals *= sigma
+    intervals += mu
+    np.exp(intervals, out=intervals)
+    if early_share > 0:
+        # Внеплановые отказы: часть интервалов обрывается раньше срока
+        early = rng.random(size, dtype=np.float32) < early_share
+        intervals[early] *= rng.random(int(early.sum()), dtype=np.float32)
+    return intervals
+
+
+def _simulate_part_demand(rng, mu, sigma, early_share, ages, horizon_days, n_paths):
+    """
+    Расход одной запчасти по всем позициям на горизонте в n_paths вариантах.
+    ages - возраст каждой позиции (дни с последней замены, NaN - неизвестен).
+    Возвращает массив длины n_paths с количеством замен в каждом варианте.
+    """
+    n_positions = len(ages)
+    block_paths = max(1, MAX_BLOCK_ELEMENTS // n_positions)
+    unknown = np.isnan(ages)
+    known_ages = np.where(unknown, 0.0, ages).astype(np.float32)
+
+    demand = np.zeros(n_paths, dtype=np.int64)
+    for start in range(0, n_paths, block_paths):
+        paths = min(block_paths, n_paths - start)
+        shape = (paths, n_positions)
+
+        # Первая замена: остаток срока текущей запчасти; при неизвестном возрасте -
+        # равномерно распределенный остаток интервала
+        first = _draw_intervals(rng, mu, sigma, early_share, shape)
+        first = np.where(
+            unknown, first * rng.random(shape, dtype=np.float32), first - known_ages
+        )
+        next_failure = np.maximum(first, 0.0, dtype=np.float32).ravel()
+
+        # Дальше разыгрываются только позиции, у которых замена попала в горизонт,
+        # поэтому объем работы пропорционален числу замен, а не их верхней оценке
+        index = np.flatnonzero(next_failure <= horizon_days)
+        next_failure = next_failure[index]
+        block_demand = np.zeros(paths, dtype=np.int64)
+        while index.size:
+            block_demand += np.bincount(index // n_positions, minlength=paths)
+            next_failure += _draw_intervals(rng, mu, sigma, early_share, index.size)
+            within = next_failure <= horizon_days
+            index = index[within]
+            next_failure = next_failure[within]
+        demand[start : start + paths] = block_demand
+    return demand
+
+
+def simulate_stock(
+    equipment_df,
+    spare_parts_df,
+    replacements_df,
+    horizon_months=12,
+    n_paths=1000,
+    service_level=0.95,
+    as_of=None,
+    seed=None,
+):
+    """
+    Моделирование расхода запчастей на горизонте horizon_months.
+    Для каждой запчасти возвращает ожидаемый расход, вероятность нехватки
+    текущего складского остатка и запас, обеспечивающий уровень сервиса
+    service_level (доля вариантов без нехватки).
+    """
+    rng = np.random.default_rng(seed)
+    as_of = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+    horizon_days = horizon_months * DAYS_IN_MONTH
+
+    # Параметры распределения и размер парка - одним merge на весь каталог
+    parts = spare_parts_df.merge(
+        equipment_df[["name", "qty_in_fleet"]].rename(
+            columns={"name": "parent_equipment"}
+        ),
+        on="parent_equipment",
+        how="left",
+    ).merge(
+        estimate_failure_intervals(replacements_df).rename(
+            columns={
+                "equipment_model": "parent_equipment",
+                "spare_part_name": "name",
+            }
+        ),
+        on=["parent_equipment", "name"],
+        how="left",
+    )
+    parts["qty_in_fleet"] = parts["qty_in_fleet"].fillna(0).astype(int)
+    parts["unscheduled_share"] = parts["unscheduled_share"].fillna(0.0)
+    from_history = parts["n_intervals"].fillna(0) >= MIN_INTERVALS
+    parts["distribution_source"] = np.where(from_history, "history", "catalog")
+    parts["mu"] = parts["mu"].where(
+        from_history, np.log(parts["useful_life_months"] * DAYS_IN_MONTH)
+    )
+    parts["sigma"] = (
+        parts["sigma"].where(from_history & (parts["sigma"] > 0)).fillna(DEFAULT_SIGMA)
+    )
+    # Внеплановые отказы в истории уже входят в наблюдаемые интервалы,
+    # для срока из справочника они добавляются как досрочные отказы
+    parts["early_share"] = parts["unscheduled_share"].where(~from_history, 0.0)
+
+    # Возраст позиций с известной последней заменой (по VIN)
+    latest = _latest_by_vin(replacements_df)
+    latest["age_days"] = (as_of - latest["replacement_date"]).dt.total_seconds() / 86400
+    ages_by_part = {
+        key: group.to_numpy()
+        for key, group in latest.groupby(["equipment_model", "spare_part_name"])[
+            "age_days"
+        ]
+    }
+
+    result = []
+    for part in parts.itertuples(index=False):
+        # Возраст позиций: известные VIN из истории, остальные - неизвестен
+        known_ages = ages_by_part.get((part.parent_equipment, part.name), np.empty(0))[
+            : part.qty_in_fleet
+        ]
+        vin_ages = np.concatenate(
+            [known_ages, np.full(max(part.qty_in_fleet - len(known_ages), 0), np.nan)]
+        )
+        ages = np.repeat(vin_ages, part.qty_per_equipment)
+
+        if len(ages):
+            demand = _simulate_part_demand(
+                rng,
+                part.mu,
+                part.sigma,
+                part.early_share,
+                ages,
+                horizon_days,
+                n_paths,
+            )
+        else:
+            demand = np.zeros(n_paths, dtype=np.int64)
+
+        required_stock = int(np.ceil(np.quantile(demand, service_level)))
+        result.append(
+            {
+                "equipment_name": part.parent_equipment,
+                "part_name": part.name,
+                "positions": len(ages),
+                "distribution_source": part.distribution_source,
+                "median_interval_days": float(np.exp(part.mu)),
+                "unscheduled_share": part.unscheduled_share,
+                "qty_in_stock": part.qty_in_stock,
+                "expected_demand": float(demand.mean()),
+                "stockout_probability": float((demand > part.qty_in_stock).mean()),
+                "required_stock": required_stock,
+                "shortfall": max(required_stock - int(part.qty_in_stock), 0),
+            }
+        )
+
+    return pd.DataFrame(result)
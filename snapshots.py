@@ -0,0 +1,176 @@
+import argparse
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, insert
+
+from database import (
+    SessionLocal,
+    ReadSessionLocal,
+    USE_DATABASE,
+    WearSnapshot,
+    PartWearSnapshot,
+)
+from utils import WEAR_ZONES, calculate_wear_trajectory, configure_logging
+from wear_engine import (
+    get_model_names,
+    load_equipment_frame,
+    load_replacement_dates_frame,
+    load_spare_parts_frame,
+)
+
+# Ежедневные снимки износа парка: количество запчастей по модели и зоне
+# и оставшийся срок каждой запчасти модели. Повторный расчет за те же даты
+# заменяет ранее записанные строки, поэтому задание можно перезапускать
+# и досчитывать пропущенные периоды.
+
+# Сколько дней считается и записывается за одну транзакцию
+SNAPSHOT_CHUNK_DAYS = 31
+# Сколько моделей оборудования загружается за один проход
+SNAPSHOT_MODEL_BATCH = 50
+
+
+def build_snapshots(equipment_df, spare_parts_df, replacements_df, dates):
+    """
+    Снимки износа на даты dates (один векторный расчет на все даты).
+    Возвращает (zone_counts, part_levels) - строки для wear_snapshots
+    и part_wear_snapshots.
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(dates)).normalize()
+    positions, remaining_pct, zones = calculate_wear_trajectory(
+        equipment_df, spare_parts_df, replacements_df, dates
+    )
+    n_positions = len(positions)
+    frame = pd.DataFrame(
+        {
+            "snapshot_date": np.tile(dates.date, n_positions),
+            "equipment_model": np.repeat(
+                positions["equipment_name"].to_numpy(), len(dates)
+            ),
+            "spare_part_name": np.repeat(positions["part_name"].to_numpy(), len(dates)),
+            "units": np.repeat(
+                positions["total_needed"].to_numpy(dtype=np.int64), len(dates)
+            ),
+            "remaining_pct": remaining_pct.ravel(),
+            "zone": zones.ravel(),
+        }
+    )
+
+    zone_counts = (
+        frame.groupby(["snapshot_date", "equipment_model", "zone"])
+        .agg(parts_count=("zone", "size"), units=("units", "sum"))
+        .reset_index()
+    )
+    zone_counts["wear_level"] = np.asarray(WEAR_ZONES)[zone_counts.pop("zone")]
+
+    # Одноименные запчасти модели сводятся в одну строку по худшему значению
+    part_levels = (
+        frame.groupby(["snapshot_date", "equipment_model", "spare_part_name"])
+        .agg(remaining_pct=("remaining_pct", "min"), zone=("zone", "max"))
+        .reset_index()
+    )
+    part_levels["wear_level"] = np.asarray(WEAR_ZONES)[part_levels.pop("zone")]
+    return zone_counts, part_levels
+
+
+def write_snapshots(db, date_from, date_to, model_names=None, read_db=None):
+    """
+    Расчет и запись снимков за даты с date_from по date_to включительно.
+    Строки за эти даты (для всех моделей или для model_names) перезаписываются.
+    Исходные данные читаются через read_db (например, с реплики), если задана.
+    Возвращает количество записанных строк (zone_counts, part_levels).
+    """
+    read_db = db if read_db is None else read_db
+    if model_names is None:
+        model_names = get_model_names(read_db)
+    zone_rows = part_rows = 0
+    for start in range(0, len(model_names), SNAPSHOT_MODEL_BATCH):
+        batch = model_names[start : start + SNAPSHOT_MODEL_BATCH]
+        equipment_df = load_equipment_frame(read_db, batch)
+        spare_parts_df = load_spare_parts_frame(read_db, batch)
+        replacements_df = load_replacement_dates_frame(read_db, batch)
+
+        chunk_start = date_from
+        while chunk_start <= date_to:
+            chunk_end = min(
+                chunk_start + timedelta(days=SNAPSHOT_CHUNK_DAYS - 1), date_to
+            )
+            zone_counts, part_levels = build_snapshots(
+                equipment_df,
+                spare_parts_df,
+                replacements_df,
+                pd.date_range(chunk_start, chunk_end, freq="D"),
+            )
+            try:
+                for table in (WearSnapshot, PartWearSnapshot):
+                    db.execute(
+                        delete(table).where(
+                            table.snapshot_date >= chunk_start,
+                            table.snapshot_date <= chunk_end,
+                            table.equipment_model.in_(batch),
+                        )
+                    )
+                if not zone_counts.empty:
+                    db.execute(insert(WearSnapshot), zone_counts.to_dict("records"))
+                if not part_levels.empty:
+                    db.execute(insert(PartWearSnapshot), part_levels.to_dict("records"))
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            zone_rows += len(zone_counts)
+            part_rows += len(part_levels)
+            chunk_start = chunk_end + timedelta(days=1)
+    return zone_rows, part_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Ежедневные снимки износа парка для графиков динамики"
+    )
+    parser.add_argument(
+        "--from",
+        dest="date_from",
+        type=lambda value: datetime.fromisoformat(value).date(),
+        help="Первая дата в формате ГГГГ-ММ-ДД (по умолчанию - сегодня)",
+    )
+    parser.add_argument(
+        "--to",
+        dest="date_to",
+        type=lambda value: datetime.fromisoformat(value).date(),
+        help="Последняя дата в формате ГГГГ-ММ-ДД (по умолчанию - сегодня)",
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        help="Модели оборудования (по умолчанию - весь парк)",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not USE_DATABASE:
+        parser.error("Снимки износа требуют базу данных (USE_DATABASE=true)")
+
+    date_to = args.date_to or date.today()
+    date_from = args.date_from or date_to
+    if date_from > date_to:
+        parser.error("Дата --from позже даты --to")
+
+    db = SessionLocal()
+    read_db = ReadSessionLocal()
+    try:
+        zone_rows, part_rows = write_snapshots(
+            db, date_from, date_to, args.models, read_db
+        )
+    finally:
+        read_db.close()
+        db.close()
+    print(
+        f"Снимки за {date_from} - {date_to}: {zone_rows} строк по зонам, "
+        f"{part_rows} строк по запчастям"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import importlib
+import re
+import subprocess
+import sys
+import threading
+import time
+from types import ModuleType
+
+# Холодный старт приложения: тяжелые модули (plotly и т.п.) импортируются
+# при первом обращении со страницы, которой они нужны, один раз на процесс
+# (модули остаются в sys.modules между перезапусками скрипта Streamlit).
+# Время отложенных импортов учитывается, полный профиль импорта по модулям
+# строится запуском python -X importtime в отдельном процессе.
+
+# Модули, которые main.py импортирует при запуске
+STARTUP_MODULES = [
+    "streamlit",
+    "pandas",
+    "utils",
+    "database",
+    "crud",
+    "wear_engine",
+    "search_index",
+    "repository",
+    "query_monitor",
+    "replica",
+    "typeahead",
+    "write_queue",
+]
+# Модули, импорт которых отложен до первой страницы, где они нужны
+DEFERRED_MODULES = [
+    "plotly.express",
+    "init_db",
+    "models",
+    "simulation",
+    "allocation",
+    "service_life",
+    "jobs",
+    "export",
+    "parallel",
+]
+
+# Момент импорта этого модуля - начало отсчета холодного старта процесса
+PROCESS_STARTED = time.perf_counter()
+
+_lock = threading.Lock()
+_import_ms = {}
+_first_run_ms = None
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+
+def timed_import(name):
+    """Импорт модуля с учетом времени (если он еще не был импортирован)"""
+    if name in sys.modules:
+        return sys.modules[name]
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    with _lock:
+        _import_ms.setdefault(name, (time.perf_counter() - started) * 1000)
+    return module
+
+
+class LazyModule(ModuleType):
+    """Модуль, который импортируется при первом обращении к его атрибуту"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def __getattr__(self, attribute):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = timed_import(self.__name__)
+            self.__dict__["_module"] = module
+        return getattr(module, attribute)
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def record_first_run():
+    """Отметка окончания первого перезапуска страницы в процессе"""
+    global _first_run_ms
+    with _lock:
+        if _first_run_ms is None:
+            _first_run_ms = (time.perf_counter() - PROCESS_STARTED) * 1000
+
+
+def startup_report():
+    """
+    Время до первой готовой страницы процесса (мс, None - еще не готова)
+    и время отложенных импортов {модуль: мс}
+    """
+    with _lock:
+        return _first_run_ms, dict(_import_ms)
+
+
+def import_profile(modules=None):
+    """
+    Профиль импорта модулей в чистом процессе (python -X importtime):
+    DataFrame module, depth, self_ms, cumulative_ms по убыванию cumulative_ms
+    """
+    import pandas as pd
+
+    modules = STARTUP_MODULES if modules is None else modules
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append(
+                {
+                    "module": module,
+                    "depth": len(indent) // 2,
+                    "self_ms": int(self_us) / 1000,
+                    "cumulative_ms": int(cumulative_us) / 1000,
+                }
+            )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return (
+        pd.DataFrame(rows, columns=["module", "depth", "self_ms", "cumulative_ms"])
+        .sort_values("cumulative_ms", ascending=False)
+        .reset_index(drop=True)
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Профиль времени импорта модулей приложения (мс)"
+    )
+    parser.add_argument(
+        "modules",
+        nargs="*",
+        help="Модули (по умолчанию - импортируемые main.py при запуске)",
+    )
+    parser.add_argument(
+        "--deferred",
+        action="store_true",
+        help="Профиль отложенных модулей (plotly и т.п.)",
+    )
+    parser.add_argument("--top", type=int, default=30, help="Сколько модулей показать")
+    args = parser.parse_args(argv)
+
+    modules = args.modules or (DEFERRED_MODULES if args.deferred else None)
+    profile = import_profile(modules)
+    top_level = profile[profile["depth"] == 0]
+    print(profile.head(args.top).to_string(index=False))
+    print(f"Всего: {top_level['cumulative_ms'].sum():.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+from bisect import bisect_left
+
+# Подсказки по началу значения (VIN, модели, запчасти) вместо выпадающих
+# списков со всем справочником: в виджет попадают только первые совпадения.
+
+# Сколько подсказок показывать
+TYPEAHEAD_LIMIT = int(os.getenv("TYPEAHEAD_LIMIT", "20"))
+
+
+class PrefixIndex:
+    """
+    Отсортированный индекс строк для поиска по префиксу без учета регистра.
+    Поиск - двоичный (bisect) до первого совпадения и последовательное чтение
+    не более limit следующих строк.
+    """
+
+    def __init__(self, values):
+        pairs = sorted(
+            {(str(value).casefold(), str(value)) for value in values if value == value}
+        )
+        self._keys = [key for key, _ in pairs]
+        self._values = [value for _, value in pairs]
+
+    def __len__(self):
+        return len(self._values)
+
+    def search(self, prefix, limit=TYPEAHEAD_LIMIT):
+        """Первые limit значений, начинающихся с prefix (в алфавитном порядке)"""
+        prefix = (prefix or "").strip().casefold()
+        result = []
+        for position in range(bisect_left(self._keys, prefix), len(self._keys)):
+            if len(result) >= limit or not self._keys[position].startswith(prefix):
+                break
+            result.append(self._values[position])
+        return result
@@ -1,43 +1,65 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from logly import logger
 from functools import wraps
+import threading
 
 
 cust_color = {"INFO": "GREEN", "ERROR": "BRIGHT_RED"}
-logger.configure(
-    level="INFO",
-    json=False,
-    color=True,
-    # console=True,                 # Вывод в log-файлы
-    # console_levels=cons_levels,   # Вывод в log-файлы
-    level_colors=cust_color,
-    # color_callback=custom_color,
-    auto_sink=True,
-    # auto_sink_levels=a_sink_levels,
-)
+_logging_configured = False
+# logly зависает при одновременной записи из нескольких потоков
+# (фоновые отчеты, сессии Streamlit) - записи журнала по очереди
+_log_lock = threading.Lock()
+
+
+def configure_logging():
+    """
+    Настройка logly - один раз, при запуске приложения или утилиты,
+    а не при импорте utils
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+    logger.configure(
+        level="INFO",
+        json=False,
+        color=True,
+        # console=True,                 # Вывод в log-файлы
+        # console_levels=cons_levels,   # Вывод в log-файлы
+        level_colors=cust_color,
+        # color_callback=custom_color,
+        auto_sink=True,
+        # auto_sink_levels=a_sink_levels,
+    )
+    _logging_configured = True
 
 
 def funcenter(func):  # Измеряем время на работу функций
     @wraps(func)
     def wrapper(*a, **kw):
         result = func(*a, **kw)
-        logger.info(f"Вошли в метод {func.__name__}")
+        with _log_lock:
+            logger.info(f"Вошли в метод {func.__name__}")
         return result
 
     return wrapper
 
 
+# Зоны износа в порядке кодов массива зон (calculate_wear_trajectory)
+WEAR_ZONES = ["green", "yellow", "red"]
+
+
 # @funcenter
-def calculate_wear_level(replacement_date, useful_life_months):
+def calculate_wear_level(replacement_date, useful_life_months, as_of=None):
     """
-    Расчет степени износа запчасти
+    Расчет степени износа запчасти на дату as_of (по умолчанию - текущий момент)
     Возвращает: 'green', 'yellow', 'red' и процент оставшегося срока
     """
     if pd.isna(replacement_date):
         return "red", 0  # Если нет даты замены, считаем полностью изношенной
 
-    current_date = datetime.now()
+    current_date = datetime.now() if as_of is None else as_of
     months_passed = (
         current_date - replacement_date
     ).days / 30.44  # Среднее количество дней в месяце
@@ -113,68 +135,257 @@ def get_replacement_type_display(replacement_type):
     return types.get(replacement_type, replacement_type)
 
 
+def _fleet_positions(equipment_df, spare_parts_df):
+    """Позиции парка: каждая запчасть каждой модели с количеством в парке"""
+    positions = equipment_df[["name", "qty_in_fleet"]].rename(
+        columns={"name": "equipment_name"}
+    )
+    parts = spare_parts_df[
+        [
+            "name",
+            "parent_equipment",
+            "qty_per_equipment",
+            "qty_in_stock",
+            "useful_life_months",
+            "procurement_time_days",
+        ]
+    ].rename(columns={"name": "part_name", "parent_equipment": "equipment_name"})
+    positions = positions.merge(parts, on="equipment_name", how="inner")
+    # Общее количество необходимых запчастей
+    positions["total_needed"] = (
+        positions["qty_in_fleet"] * positions["qty_per_equipment"]
+    )
+    return positions
+
+
+def _replacement_history(replacements_df):
+    """История замен с единым названием столбца модели оборудования"""
+    # Проверяем оба возможных названия столбца
+    equipment_col = (
+        "equipment_name"
+        if "equipment_name" in replacements_df.columns
+        else "equipment_model"
+    )
+    return pd.DataFrame(
+        {
+            "equipment_name": replacements_df[equipment_col],
+            "part_name": replacements_df["spare_part_name"],
+            "replacement_date": pd.to_datetime(replacements_df["replacement_date"]),
+        }
+    )
+
+
 @funcenter
-def calculate_total_parts_needed(equipment_df, spare_parts_df, replacements_df):
+def calculate_total_parts_needed(
+    equipment_df, spare_parts_df, replacements_df, as_of=None
+):
     """
     Расчет общего количества необходимых запчастей для всего парка.
+    Расчет векторизован: последняя замена по каждой паре (оборудование, запчасть)
+    находится одним groupby, износ и сроки закупки - операциями над столбцами.
+    as_of - дата, на которую считается износ (по умолчанию - текущий момент);
+    замены позже этой даты не учитываются
     """
-    result = []
+    if equipment_df.empty or spare_parts_df.empty:
+        return pd.DataFrame()
 
-    for _, equipment in equipment_df.iterrows():
-        equipment_name = equipment["name"]
-        qty_in_fleet = equipment["qty_in_fleet"]
+    positions = _fleet_positions(equipment_df, spare_parts_df)
+    if positions.empty:
+        return pd.DataFrame()
+    as_of = pd.Timestamp(datetime.now() if as_of is None else as_of)
 
-        # Запчасти для этого оборудования
-        equipment_parts = spare_parts_df[
-            spare_parts_df["parent_equipment"] == equipment_name
+    # Последние замены (не позже as_of) для каждой запчасти в каждом оборудовании
+    if replacements_df.empty:
+        positions["last_replacement"] = pd.NaT
+    else:
+        history = _replacement_history(replacements_df)
+        last_replacements = (
+            history[history["replacement_date"] <= as_of]
+            .groupby(["equipment_name", "part_name"])["replacement_date"]
+            .max()
+            .rename("last_replacement")
+            .reset_index()
+        )
+        positions = positions.merge(
+            last_replacements, on=["equipment_name", "part_name"], how="left"
+        )
+
+    last_replacement = pd.to_datetime(positions["last_replacement"])
+    useful_life_months = positions["useful_life_months"].astype(float)
+
+    # Степень износа (та же формула, что и в calculate_wear_level)
+    months_passed = (as_of - last_replacement).dt.days / 30.44
+    remaining_pct = (useful_life_months - months_passed) / useful_life_months * 100
+    positions["wear_level"] = np.select(
+        [remaining_pct > 25, remaining_pct > 10], ["green", "yellow"], default="red"
+    )
+    positions["remaining_pct"] = remaining_pct.fillna(0).clip(lower=0)
+
+    # Крайняя дата инициации закупки (та же формула, что и в calculate_procurement_deadline)
+    positions["procurement_deadline"] = (
+        last_replacement
+        + pd.to_timedelta(useful_life_months * 30.44, unit="D").dt.round("us")
+        - pd.to_timedelta(positions["procurement_time_days"], unit="D")
+    )
+
+    return positions[
+        [
+            "equipment_name",
+            "part_name",
+            "total_needed",
+            "qty_in_stock",
+            "wear_level",
+            "remaining_pct",
+            "procurement_deadline",
+            "procurement_time_days",
         ]
+    ].reset_index(drop=True)
+
 
-        for _, part in equipment_parts.iterrows():
-            part_name = part["name"]
-            qty_per_equipment = part["qty_per_equipment"]
-            qty_in_stock = part["qty_in_stock"]
-            useful_life_months = part["useful_life_months"]
-            procurement_time_days = part["procurement_time_days"]
-
-            # Общее количество необходимых запчастей
-            total_needed = qty_in_fleet * qty_per_equipment
-
-            # Последние замены для этой запчасти в этом оборудовании
-            # Проверяем оба возможных названия столбца
-            equipment_col = (
-                "equipment_name"
-                if "equipment_name" in replacements_df.columns
-                else "equipment_model"
-            )
-            part_replacements = replacements_df[
-                (replacements_df[equipment_col] == equipment_name)
-                & (replacements_df["spare_part_name"] == part_name)
-            ].sort_values("replacement_date", ascending=False)
-
-            if not part_replacements.empty:
-                last_replacement = part_replacements.iloc[0]["replacement_date"]
-                wear_level, remaining_pct = calculate_wear_level(
-                    last_replacement, useful_life_months
-                )
-                procurement_deadline = calculate_procurement_deadline(
-                    last_replacement, useful_life_months, procurement_time_days
-                )
-            else:
-                wear_level = "red"
-                remaining_pct = 0
-                procurement_deadline = None
-
-            result.append(
-                {
-                    "equipment_name": equipment_name,
-                    "part_name": part_name,
-                    "total_needed": total_needed,
-                    "qty_in_stock": qty_in_stock,
-                    "wear_level": wear_level,
-                    "remaining_pct": remaining_pct,
-                    "procurement_deadline": procurement_deadline,
-                    "procurement_time_days": procurement_time_days,
-                }
-            )
-
-    return pd.DataFrame(result)
+def calculate_wear_trajectory(equipment_df, spare_parts_df, replacements_df, dates):
+    """
+    Износ всех позиций парка сразу на все даты из dates - одним векторным
+    расчетом, без цикла по датам.
+    На каждую дату учитываются только замены не позже нее: прошлые даты
+    показывают состояние парка на тот момент, будущие - прогноз без новых замен.
+    Возвращает (positions, remaining_pct, zones):
+      positions     - позиции парка (equipment_name, part_name, total_needed, ...);
+      remaining_pct - массив (позиции x даты), оставшийся срок в процентах;
+      zones         - массив (позиции x даты) кодов зон, см. WEAR_ZONES.
+    Значения совпадают с calculate_total_parts_needed(as_of=дата).
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    if equipment_df.empty or spare_parts_df.empty:
+        positions = pd.DataFrame(
+            columns=[
+                "equipment_name",
+                "part_name",
+                "total_needed",
+                "useful_life_months",
+            ]
+        )
+    else:
+        positions = _fleet_positions(equipment_df, spare_parts_df)
+    n_positions, n_dates = len(positions), len(dates)
+    date_ns = dates.to_numpy(dtype="datetime64[ns]").view("int64")
+
+    # Последняя замена не позже каждой даты: история сортируется по
+    # (позиция, дата), и для всех пар (позиция, дата) разом ищется место
+    # вставки. Даты заменяются рангами, чтобы ключ (позиция, дата) поместился
+    # в int64.
+    last_ns = np.full((n_positions, n_dates), np.iinfo(np.int64).min)
+    if n_positions and not replacements_df.empty:
+        history = _replacement_history(replacements_df).dropna(
+            subset=["replacement_date"]
+        )
+        position_index = pd.MultiIndex.from_frame(
+            positions[["equipment_name", "part_name"]]
+        )
+        codes = position_index.get_indexer(
+            pd.MultiIndex.from_frame(history[["equipment_name", "part_name"]])
+        )
+        known = codes >= 0
+        codes = codes[known].astype(np.int64)
+        history_ns = (
+            history["replacement_date"]
+            .to_numpy(dtype="datetime64[ns]")[known]
+            .view("int64")
+        )
+        values, ranks = np.unique(
+            np.concatenate([history_ns, date_ns]), return_inverse=True
+        )
+        n_ranks = len(values)
+        keys = codes * n_ranks + ranks[: len(history_ns)]
+        order = np.argsort(keys, kind="stable")
+        keys, history_ns = keys[order], history_ns[order]
+
+        queries = (
+            np.arange(n_positions, dtype=np.int64)[:, None] * n_ranks
+            + ranks[len(history_ns) :][None, :]
+        )
+        found = np.searchsorted(keys, queries, side="right") - 1
+        valid = found >= 0
+        found = np.where(valid, found, 0)
+        valid &= keys[found] // n_ranks == np.arange(n_positions)[:, None]
+        last_ns = np.where(valid, history_ns[found], last_ns)
+
+    # Степень износа (та же формула, что и в calculate_wear_level)
+    has_replacement = last_ns != np.iinfo(np.int64).min
+    days_passed = np.floor_divide(
+        date_ns[None, :] - np.where(has_replacement, last_ns, 0),
+        86_400 * 10**9,
+    )
+    useful_life_months = positions["useful_life_months"].to_numpy(dtype=float)[:, None]
+    remaining_pct = (
+        (useful_life_months - days_passed / 30.44) / useful_life_months * 100
+    )
+    remaining_pct = np.where(has_replacement, remaining_pct, np.nan)
+    zones = np.select(
+        [remaining_pct > 25, remaining_pct > 10], [0, 1], default=2
+    ).astype(np.int8)
+    remaining_pct = np.clip(np.nan_to_num(remaining_pct, nan=0.0), 0, None)
+    return positions.reset_index(drop=True), remaining_pct, zones
+
+
+def wear_trajectory_frame(positions, dates, remaining_pct, zones):
+    """
+    Результат calculate_wear_trajectory в длинном формате (строка на позицию
+    и дату): date, equipment_name, part_name, remaining_pct, wear_level
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    n_positions = len(positions)
+    return pd.DataFrame(
+        {
+            "date": np.tile(dates.to_numpy(), n_positions),
+            "equipment_name": np.repeat(
+                positions["equipment_name"].to_numpy(), len(dates)
+            ),
+            "part_name": np.repeat(positions["part_name"].to_numpy(), len(dates)),
+            "remaining_pct": remaining_pct.ravel(),
+            "wear_level": np.asarray(WEAR_ZONES)[zones.ravel()],
+        }
+    )
+
+
+def select_procurement_needed(procurement_data):
+    """Запчасти, требующие закупки: желтая и красная зоны или нехватка на складе"""
+    return procurement_data[
+        (procurement_data["wear_level"].isin(["yellow", "red"]))
+        | (procurement_data["qty_in_stock"] < procurement_data["total_needed"])
+    ].copy()
+
+
+def build_procurement_plan(procurement_data):
+    """
+    Формирование плана закупок по результатам calculate_total_parts_needed.
+    Возвращает: запчасти, требующие закупки, и календарный план закупок
+    (по строке на каждую возможную дату закупки).
+    """
+    plan_columns = ["date", "equipment", "part", "needed", "wear_level"]
+    if procurement_data.empty:
+        return procurement_data, pd.DataFrame(columns=plan_columns)
+
+    procurement_needed = select_procurement_needed(procurement_data)
+
+    # Расчет дат закупки
+    procurement_needed["next_procurement_dates"] = procurement_needed[
+        "procurement_deadline"
+    ].apply(lambda x: get_next_procurement_dates(x) if pd.notna(x) else [])
+
+    # Группировка по датам
+    plan_df = (
+        procurement_needed.explode("next_procurement_dates")
+        .dropna(subset=["next_procurement_dates"])
+        .rename(
+            columns={
+                "next_procurement_dates": "date",
+                "equipment_name": "equipment",
+                "part_name": "part",
+            }
+        )
+    )
+    plan_df["needed"] = plan_df["total_needed"] - plan_df["qty_in_stock"]
+    plan_df = plan_df[plan_columns].sort_values("date", kind="stable")
+    plan_df["date"] = pd.to_datetime(plan_df["date"])
+
+    return procurement_needed, plan_df.reset_index(drop=True)
@@ -0,0 +1,398 @@
+from collections import defaultdict
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, aliased
+from typing import Iterator, List, Optional, Tuple
+
+from database import EquipmentModel, Equipment, Workshop, SparePart, ReplacementRecord
+from utils import build_procurement_plan, calculate_total_parts_needed
+
+# Расчет износа и плана закупок без Streamlit: загрузка снимка данных из БД
+# в те же DataFrame, с которыми работает main.py, и расчет по ним.
+
+EQUIPMENT_COLUMNS = ["name", "qty_in_fleet"]
+WORKSHOP_COLUMNS = ["name", "address", "daily_capacity"]
+SPARE_PART_COLUMNS = [
+    "name",
+    "useful_life_months",
+    "parent_equipment",
+    "qty_per_equipment",
+    "qty_in_stock",
+    "procurement_time_days",
+]
+REPLACEMENT_COLUMNS = [
+    "equipment_vin",
+    "equipment_model",
+    "spare_part_name",
+    "workshop_name",
+    "replacement_date",
+    "replacement_type",
+    "notes",
+]
+
+
+def _read_frame(db: Session, stmt, columns: List[str]) -> pd.DataFrame:
+    """Выполнение запроса одним SELECT и преобразование результата в DataFrame"""
+    return pd.DataFrame(db.execute(stmt).all(), columns=columns)
+
+
+def _read_indexed_frame(db: Session, stmt, columns: List[str]) -> pd.DataFrame:
+    """
+    То же для запроса, первая колонка которого - id записи: id становится
+    индексом, чтобы строки можно было точечно обновлять (см. change_bus.py)
+    """
+    return _read_frame(db, stmt, ["id", *columns]).set_index("id")
+
+
+def _filter_ids(stmt, column, ids: Optional[List[int]]):
+    if ids is not None:
+        stmt = stmt.where(column.in_(ids))
+    return stmt
+
+
+def _filter_models(stmt, model_names: Optional[List[str]]):
+    if model_names is not None:
+        stmt = stmt.where(EquipmentModel.name.in_(model_names))
+    return stmt
+
+
+def load_equipment_frame(
+    db: Session,
+    model_names: Optional[List[str]] = None,
+    ids: Optional[List[int]] = None,
+) -> pd.DataFrame:
+    stmt = select(
+        EquipmentModel.id, EquipmentModel.name, EquipmentModel.qty_in_fleet
+    ).order_by(EquipmentModel.id)
+    stmt = _filter_ids(_filter_models(stmt, model_names), EquipmentModel.id, ids)
+    return _read_indexed_frame(db, stmt, EQUIPMENT_COLUMNS)
+
+
+def load_workshops_frame(db: Session, ids: Optional[List[int]] = None) -> pd.DataFrame:
+    stmt = select(
+        Workshop.id, Workshop.name, Workshop.address, Workshop.daily_capacity
+    ).order_by(Workshop.id)
+    return _read_indexed_frame(
+        db, _filter_ids(stmt, Workshop.id, ids), WORKSHOP_COLUMNS
+    )
+
+
+def load_spare_parts_frame(
+    db: Session,
+    model_names: Optional[List[str]] = None,
+    ids: Optional[List[int]] = None,
+) -> pd.DataFrame:
+    stmt = (
+        select(
+            SparePart.id,
+            SparePart.name,
+            SparePart.useful_life_months,
+            EquipmentModel.name,
+            SparePart.qty_per_equipment,
+            SparePart.qty_in_stock,
+            SparePart.procurement_time_days,
+        )
+        .join(EquipmentModel, SparePart.equipment_model_id == EquipmentModel.id)
+        .order_by(SparePart.id)
+    )
+    stmt = _filter_ids(_filter_models(stmt, model_names), SparePart.id, ids)
+    return _read_indexed_frame(db, stmt, SPARE_PART_COLUMNS)
+
+
+def load_replacements_frame(
+    db: Session,
+    model_names: Optional[List[str]] = None,
+    ids: Optional[List[int]] = None,
+    equipment_ids: Optional[List[int]] = None,
+) -> pd.DataFrame:
+    """Полная история замен (VIN, модель, запчасть и мастерская - через JOIN)"""
+    stmt = (
+        select(
+            ReplacementRecord.id,
+            Equipment.vin,
+            EquipmentModel.name,
+            SparePart.name,
+            Workshop.name,
+            ReplacementRecord.replacement_date,
+            ReplacementRecord.replacement_type,
+            ReplacementRecord.notes,
+        )
+        .join(Equipment, ReplacementRecord.equipment_id == Equipment.id)
+        .join(EquipmentModel, Equipment.model_id == EquipmentModel.id)
+        .join(SparePart, ReplacementRecord.spare_part_id == SparePart.id)
+        .join(Workshop, ReplacementRecord.workshop_id == Workshop.id)
+        .order_by(ReplacementRecord.id)
+    )
+    stmt = _filter_ids(_filter_models(stmt, model_names), ReplacementRecord.id, ids)
+    stmt = _filter_ids(stmt, ReplacementRecord.equipment_id, equipment_ids)
+    frame = _read_indexed_frame(db, stmt, REPLACEMENT_COLUMNS)
+    frame["replacement_date"] = pd.to_datetime(frame["replacement_date"])
+    return frame
+
+
+def load_replacement_dates_frame(
+    db: Session, model_names: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """История замен без примечаний и мастерских: модель, запчасть, дата"""
+    stmt = (
+        select(
+            EquipmentModel.name,
+            SparePart.name,
+            ReplacementRecord.replacement_date,
+        )
+        .join(Equipment, ReplacementRecord.equipment_id == Equipment.id)
+        .join(EquipmentModel, Equipment.model_id == EquipmentModel.id)
+        .join(SparePart, ReplacementRecord.spare_part_id == SparePart.id)
+    )
+    frame = _read_frame(
+        db,
+        _filter_models(stmt, model_names),
+        ["equipment_model", "spare_part_name", "replacement_date"],
+    )
+    frame["replacement_date"] = pd.to_datetime(frame["replacement_date"])
+    return frame
+
+
+def load_latest_replacements_frame(
+    db: Session,
+    model_names: Optional[List[str]] = None,
+    as_of: Optional[datetime] = None,
+) -> pd.DataFrame:
+    """
+    Только последние замены по каждой паре (модель, запчасть из каталога модели).
+    Для расчета износа этого достаточно, а объем не зависит от длины истории:
+    дата последней замены берется по индексу (spare_part_id, replacement_date)
+    для каждой запчасти с тем же названием, без чтения всей истории.
+    as_of - учитывать только замены не позже этой даты.
+    """
+    catalog_part = aliased(SparePart)
+    used_part = aliased(SparePart)
+    last_replacement = (
+        select(func.max(ReplacementRecord.replacement_date))
+        .join(Equipment, ReplacementRecord.equipment_id == Equipment.id)
+        .where(
+            ReplacementRecord.spare_part_id == used_part.id,
+            Equipment.model_id == EquipmentModel.id,
+        )
+    )
+    if as_of is not None:
+        last_replacement = last_replacement.where(
+            ReplacementRecord.replacement_date <= as_of
+        )
+    last_replacement = last_replacement.scalar_subquery()
+    per_part = _filter_models(
+        select(
+            EquipmentModel.name.label("equipment_model"),
+            catalog_part.name.label("spare_part_name"),
+            last_replacement.label("replacement_date"),
+        )
+        .join(catalog_part, catalog_part.equipment_model_id == EquipmentModel.id)
+        .join(used_part, used_part.name == catalog_part.name),
+        model_names,
+    ).subquery()
+    stmt = (
+        select(
+            per_part.c.equipment_model,
+            per_part.c.spare_part_name,
+            func.max(per_part.c.replacement_date),
+        )
+        .where(per_part.c.replacement_date.is_not(None))
+        .group_by(per_part.c.equipment_model, per_part.c.spare_part_name)
+    )
+    frame = _read_frame(
+        db, stmt, ["equipment_model", "spare_part_name", "replacement_date"]
+    )
+    frame["replacement_date"] = pd.to_datetime(frame["replacement_date"])
+    return frame
+
+
+def load_snapshot(
+    db: Session, model_names: Optional[List[str]] = None
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Снимок данных в формате session_state приложения:
+    (equipment_df, workshops_df, spare_parts_df, replacements_df)
+    """
+    return (
+        load_equipment_frame(db, model_names),
+        load_workshops_frame(db),
+        load_spare_parts_frame(db, model_names),
+        load_replacements_frame(db, model_names),
+    )
+
+
+def upsert_rows(frame: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Обновление строк frame с теми же id (индекс) и добавление новых;
+    порядок существующих строк сохраняется
+    """
+    existing = rows.index.intersection(frame.index)
+    if len(existing):
+        frame = frame.copy()
+        frame.loc[existing, rows.columns] = rows.loc[existing]
+    added = rows.drop(index=existing)
+    if len(added):
+        frame = pd.concat([frame, added[frame.columns]])
+    return frame
+
+
+def patch_snapshot(
+    db: Session,
+    snapshot: Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame],
+    events,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Точечное обновление снимка load_snapshot по событиям шины изменений
+    (change_bus.py): перечитываются только измененные записи, удаленные
+    записи убираются. Переименование модели или изменение VIN перечитывает
+    зависящие от них строки запчастей и истории замен; строки, которые
+    больше не проходят JOIN снимка (ссылка обнулена при удалении
+    родителя), тоже убираются.
+    """
+    equipment_df, workshops_df, spare_parts_df, replacements_df = snapshot
+    # Для каждой записи важна последняя операция (id может быть занят снова)
+    last_ops = {
+        (change.table, change.id): change.op
+        for change in sorted(events, key=lambda change: change.revision)
+    }
+    changed, deleted = defaultdict(set), defaultdict(set)
+    for (table, row_id), op in last_ops.items():
+        (deleted if op == "delete" else changed)[table].add(row_id)
+
+    def drop_deleted(frame, table):
+        return frame.drop(index=list(deleted[table]), errors="ignore")
+
+    def reload(frame, table, loaded):
+        missing = changed[table] - set(loaded.index)
+        return upsert_rows(frame, loaded).drop(index=list(missing), errors="ignore")
+
+    renamed_models = []
+    if changed["equipment_models"]:
+        models = load_equipment_frame(db, ids=list(changed["equipment_models"]))
+        known = models.index.intersection(equipment_df.index)
+        renamed_models = list(
+            models.loc[known, "name"][
+                models.loc[known, "name"] != equipment_df.loc[known, "name"]
+            ]
+        )
+        equipment_df = upsert_rows(equipment_df, models)
+    equipment_df = drop_deleted(equipment_df, "equipment_models")
+
+    if changed["workshops"]:
+        workshops_df = upsert_rows(
+            workshops_df, load_workshops_frame(db, ids=list(changed["workshops"]))
+        )
+    workshops_df = drop_deleted(workshops_df, "workshops")
+
+    if changed["spare_parts"]:
+        spare_parts_df = reload(
+            spare_parts_df,
+            "spare_parts",
+            load_spare_parts_frame(db, ids=list(changed["spare_parts"])),
+        )
+    if renamed_models:
+        spare_parts_df = upsert_rows(
+            spare_parts_df, load_spare_parts_frame(db, renamed_models)
+        )
+    spare_parts_df = drop_deleted(spare_parts_df, "spare_parts")
+    if deleted["equipment_models"]:
+        # Запчасти и техника удаленной модели отвязаны от нее и в снимок не входят
+        known_models = equipment_df["name"]
+        spare_parts_df = spare_parts_df[
+            spare_parts_df["parent_equipment"].isin(known_models)
+        ]
+        replacements_df = replacements_df[
+            replacements_df["equipment_model"].isin(known_models)
+        ]
+
+    if changed["replacement_records"]:
+        replacements_df = reload(
+            replacements_df,
+            "replacement_records",
+            load_replacements_frame(db, ids=list(changed["replacement_records"])),
+        )
+    if changed["equipment"]:
+        replacements_df = upsert_rows(
+            replacements_df,
+            load_replacements_frame(db, equipment_ids=list(changed["equipment"])),
+        )
+    if renamed_models:
+        replacements_df = upsert_rows(
+            replacements_df, load_replacements_frame(db, renamed_models)
+        )
+    replacements_df = drop_deleted(replacements_df, "replacement_records")
+    return equipment_df, workshops_df, spare_parts_df, replacements_df
+
+
+def compute_fleet(
+    equipment_df: pd.DataFrame,
+    spare_parts_df: pd.DataFrame,
+    replacements_df: pd.DataFrame,
+    workers: int = 1,
+    as_of: Optional[datetime] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Расчет износа и календарного плана закупок на дату as_of: (wear_df, plan_df)
+    workers > 1 - расчет износа в пуле процессов по моделям оборудования
+    """
+    if workers > 1:
+        # Пул процессов нужен только фоновому пересчету, не страницам
+        from parallel import parallel_total_parts_needed
+
+        wear_df = parallel_total_parts_needed(
+            equipment_df, spare_parts_df, replacements_df, workers=workers, as_of=as_of
+        )
+    else:
+        wear_df = calculate_total_parts_needed(
+            equipment_df, spare_parts_df, replacements_df, as_of=as_of
+        )
+    _, plan_df = build_procurement_plan(wear_df)
+    return wear_df, plan_df
+
+
+def get_model_names(db: Session) -> List[str]:
+    return list(db.scalars(select(EquipmentModel.name).order_by(EquipmentModel.id)))
+
+
+def iter_fleet_results(
+    db: Session,
+    model_names: Optional[List[str]] = None,
+    batch_size: int = 20,
+    workers: int = 1,
+    as_of: Optional[datetime] = None,
+) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """
+    Расчет по парку пачками моделей оборудования на дату as_of.
+    В памяти одновременно находятся только справочники и последние замены
+    batch_size моделей, поэтому объем памяти ограничен при любом размере парка.
+    workers > 1 - пачки считаются в пуле процессов (данные читаются в этом
+    процессе), результаты - в том же порядке пачек.
+    """
+    if model_names is None:
+        model_names = get_model_names(db)
+    # Одна дата расчета для всех пачек
+    as_of = datetime.now() if as_of is None else as_of
+    batches = (
+        (
+            load_equipment_frame(db, batch),
+            load_spare_parts_frame(db, batch),
+            load_latest_replacements_frame(db, batch, as_of),
+            1,
+            as_of,
+        )
+        for batch in (
+            model_names[start : start + batch_size]
+            for start in range(0, len(model_names), batch_size)
+        )
+    )
+    if workers > 1:
+        # Последние замены пачки - строка на пару (модель, запчасть): делить
+        # пачку по процессам невыгодно, параллельно считаются сами пачки
+        from parallel import imap_batches
+
+        yield from imap_batches(compute_fleet, batches, workers)
+    else:
+        for args in batches:
+            yield compute_fleet(*args)
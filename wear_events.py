@@ -0,0 +1,293 @@
+import argparse
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, func, insert, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from database import (
+    SessionLocal,
+    USE_DATABASE,
+    EquipmentModel,
+    Equipment,
+    SparePart,
+    ReplacementRecord,
+    WearThresholdEvent,
+    WearEventDirtyPosition,
+)
+from service_life import DAYS_IN_MONTH
+from utils import configure_logging
+
+# Даты перехода порогов для каждой позиции (VIN, запчасть): когда после
+# последней замены останется 25% срока (желтая зона), 10% (красная зона) и
+# крайний срок инициации закупки. Формулы - те же, что в
+# calculate_total_parts_needed, поэтому "что станет желтым/красным в ближайшие
+# N дней" - выборка диапазона по индексу event_date, без расчета по парку.
+# Пересчитываются только позиции, отмеченные в wear_event_dirty_positions.
+# Пересчет выполняет фоновый пересчет результатов (precompute.py), страницы
+# только читают wear_threshold_events.
+
+# Пороги: название -> оставшийся срок (%), при котором позиция переходит в зону
+THRESHOLDS = {"yellow": 25, "red": 10}
+# Дополнительное событие - крайний срок инициации закупки
+DEADLINE = "deadline"
+EVENT_KINDS = [*THRESHOLDS, DEADLINE]
+# Сколько позиций обрабатывать за один запрос при инкрементальном пересчете
+POSITIONS_CHUNK = 1000
+# Ключ pg_advisory_xact_lock для пересчета: процессы выполняют его по очереди
+WEAR_EVENTS_LOCK_KEY = 0x77656172
+
+
+def _first_day(useful_life_months: np.ndarray, pct: float) -> np.ndarray:
+    """
+    Первый целый день после замены, когда оставшийся срок не больше pct%
+    (дни считаются целыми, как .dt.days в calculate_total_parts_needed)
+    """
+
+    def remaining(days):
+        return (useful_life_months - days / DAYS_IN_MONTH) / useful_life_months * 100
+
+    days = np.ceil(useful_life_months * DAYS_IN_MONTH * (1 - pct / 100))
+    # Поправка на округление при сравнении с порогом
+    days = np.where(remaining(days - 1) <= pct, days - 1, days)
+    return np.where(remaining(days) > pct, days + 1, days)
+
+
+def threshold_events_frame(positions: pd.DataFrame) -> pd.DataFrame:
+    """
+    События перехода порогов для позиций (equipment_id, spare_part_id,
+    last_replacement, useful_life_months, procurement_time_days):
+    строка на позицию и порог (equipment_id, spare_part_id, threshold,
+    event_date, last_replacement)
+    """
+    columns = [
+        "equipment_id",
+        "spare_part_id",
+        "threshold",
+        "event_date",
+        "last_replacement",
+    ]
+    positions = positions.dropna(subset=["last_replacement", "useful_life_months"])
+    if positions.empty:
+        return pd.DataFrame(columns=columns)
+    last_replacement = pd.to_datetime(positions["last_replacement"])
+    useful_life_months = positions["useful_life_months"].to_numpy(dtype=float)
+    events = {
+        threshold: last_replacement
+        + pd.to_timedelta(_first_day(useful_life_months, pct), unit="D")
+        for threshold, pct in THRESHOLDS.items()
+    }
+    # Та же формула, что и в calculate_procurement_deadline
+    events[DEADLINE] = (
+        last_replacement
+        + pd.to_timedelta(useful_life_months * DAYS_IN_MONTH, unit="D").round("us")
+        - pd.to_timedelta(positions["procurement_time_days"].fillna(0), unit="D")
+    )
+    return pd.concat(
+        [
+            positions[["equipment_id", "spare_part_id", "last_replacement"]].assign(
+                threshold=threshold, event_date=event_date
+            )
+            for threshold, event_date in events.items()
+        ],
+        ignore_index=True,
+    )[columns]
+
+
+def _positions_query():
+    """Последняя замена по позициям (только запчасти модели этого VIN)"""
+    return (
+        select(
+            ReplacementRecord.equipment_id,
+            ReplacementRecord.spare_part_id,
+            func.max(ReplacementRecord.replacement_date).label("last_replacement"),
+            SparePart.useful_life_months,
+            SparePart.procurement_time_days,
+        )
+        .join(SparePart, SparePart.id == ReplacementRecord.spare_part_id)
+        .join(
+            Equipment,
+            (Equipment.id == ReplacementRecord.equipment_id)
+            & (Equipment.model_id == SparePart.equipment_model_id),
+        )
+        .group_by(
+            ReplacementRecord.equipment_id,
+            ReplacementRecord.spare_part_id,
+            SparePart.useful_life_months,
+            SparePart.procurement_time_days,
+        )
+    )
+
+
+def _insert_events(db: Session, stmt) -> int:
+    positions = pd.DataFrame(
+        db.execute(stmt).all(),
+        columns=[
+            "equipment_id",
+            "spare_part_id",
+            "last_replacement",
+            "useful_life_months",
+            "procurement_time_days",
+        ],
+    )
+    events = threshold_events_frame(positions)
+    if not events.empty:
+        events = events.astype(object).where(events.notna(), None)
+        db.execute(insert(WearThresholdEvent), events.to_dict("records"))
+    return len(positions)
+
+
+def refresh_wear_events(db: Session, full: bool = False) -> int:
+    """
+    Инкрементальный пересчет дат перехода порогов.
+    Обрабатываются только позиции с измененной историей замен; при первом
+    запуске (или full=True) - весь парк. Возвращает количество позиций.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        # Иначе одновременные пересчеты вставляют одни и те же события
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": WEAR_EVENTS_LOCK_KEY}
+        )
+    try:
+        if full or db.query(WearThresholdEvent).first() is None:
+            db.execute(delete(WearThresholdEvent))
+            count = _insert_events(db, _positions_query())
+            db.execute(delete(WearEventDirtyPosition))
+        else:
+            dirty = db.execute(
+                select(
+                    WearEventDirtyPosition.equipment_id,
+                    WearEventDirtyPosition.spare_part_id,
+                )
+            ).all()
+            count = 0
+            for start in range(0, len(dirty), POSITIONS_CHUNK):
+                chunk = [tuple(row) for row in dirty[start : start + POSITIONS_CHUNK]]
+                db.execute(
+                    delete(WearThresholdEvent).where(
+                        tuple_(
+                            WearThresholdEvent.equipment_id,
+                            WearThresholdEvent.spare_part_id,
+                        ).in_(chunk)
+                    )
+                )
+                # Позиции без замен (все удалены) событий не имеют
+                count += _insert_events(
+                    db,
+                    _positions_query().where(
+                        tuple_(
+                            ReplacementRecord.equipment_id,
+                            ReplacementRecord.spare_part_id,
+                        ).in_(chunk)
+                    ),
+                )
+                db.execute(
+                    delete(WearEventDirtyPosition).where(
+                        tuple_(
+                            WearEventDirtyPosition.equipment_id,
+                            WearEventDirtyPosition.spare_part_id,
+                        ).in_(chunk)
+                    )
+                )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return count
+
+
+def get_threshold_events(
+    db: Session,
+    date_from: datetime,
+    date_to: datetime,
+    thresholds: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    События перехода порогов в периоде [date_from, date_to) - выборка
+    диапазона по индексу event_date: event_date, threshold, vin,
+    equipment_model, spare_part_name, last_replacement, equipment_id,
+    spare_part_id
+    """
+    stmt = (
+        select(
+            WearThresholdEvent.event_date,
+            WearThresholdEvent.threshold,
+            Equipment.vin,
+            EquipmentModel.name,
+            SparePart.name,
+            WearThresholdEvent.last_replacement,
+            WearThresholdEvent.equipment_id,
+            WearThresholdEvent.spare_part_id,
+        )
+        .join(Equipment, Equipment.id == WearThresholdEvent.equipment_id)
+        .join(EquipmentModel, EquipmentModel.id == Equipment.model_id)
+        .join(SparePart, SparePart.id == WearThresholdEvent.spare_part_id)
+        .where(
+            WearThresholdEvent.event_date >= date_from,
+            WearThresholdEvent.event_date < date_to,
+        )
+        .order_by(WearThresholdEvent.event_date)
+    )
+    if thresholds is not None:
+        stmt = stmt.where(WearThresholdEvent.threshold.in_(thresholds))
+    frame = pd.DataFrame(
+        db.execute(stmt).all(),
+        columns=[
+            "event_date",
+            "threshold",
+            "vin",
+            "equipment_model",
+            "spare_part_name",
+            "last_replacement",
+            "equipment_id",
+            "spare_part_id",
+        ],
+    )
+    for column in ["event_date", "last_replacement"]:
+        frame[column] = pd.to_datetime(frame[column])
+    return frame
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Пересчет и просмотр дат перехода позиций в желтую/красную зону"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Пересчитать весь парк (по умолчанию - только измененные позиции)",
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=30,
+        help="Показать события на ближайшие N дней",
+    )
+    parser.add_argument(
+        "--threshold",
+        nargs="+",
+        choices=EVENT_KINDS,
+        help="Виды событий (по умолчанию - все)",
+    )
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if not USE_DATABASE:
+        parser.error("Пересчет требует базу данных (USE_DATABASE=true)")
+
+    db = SessionLocal()
+    try:
+        print(f"Пересчитано позиций: {refresh_wear_events(db, args.full)}")
+        now = datetime.now()
+        events = get_threshold_events(
+            db, now, now + timedelta(days=args.days), args.threshold
+        )
+    finally:
+        db.close()
+    print(events.drop(columns=["equipment_id", "spare_part_id"]).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from logly import logger
+
+from crud import create_replacement_records, resolve_replacement_refs
+
+# Отложенная (write-behind) запись: фоновый поток собирает поступающие записи
+# в пачки и сохраняет каждую пачку одной транзакцией. Отправитель сразу
+# получает Future, в котором позже появится результат или ошибка записи.
+
+# Максимальный размер пачки
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "200"))
+# Сколько ждать следующих записей перед сохранением пачки (мс)
+WRITE_MAX_DELAY_MS = float(os.getenv("WRITE_MAX_DELAY_MS", "200"))
+
+REPLACEMENT_FIELDS = ("replacement_date", "replacement_type", "notes")
+
+
+class WriteBehindQueue:
+    """
+    Очередь отложенной записи.
+    write_batch(db, items) сохраняет пачку и возвращает по одному результату
+    на запись (значение или исключение). Если пачка целиком завершилась
+    ошибкой, записи сохраняются по одной, чтобы ошибка досталась только
+    виновной записи.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        write_batch,
+        batch_size=WRITE_BATCH_SIZE,
+        max_delay_ms=WRITE_MAX_DELAY_MS,
+        name="write-behind",
+    ):
+        self.session_factory = session_factory
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Постановка записи в очередь, возвращает Future с результатом"""
+        if self._closed:
+            raise RuntimeError("Очередь записи закрыта")
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self, timeout=None):
+        """Запись оставшихся элементов и остановка потока"""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        """Пачка: первая запись (ожидание без ограничения) и все, что успели
+        добавить за max_delay, но не больше batch_size"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if entry is None:
+                # Остановка после записи текущей пачки
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _write(self, entries):
+        db = self.session_factory()
+        try:
+            results = self.write_batch(db, [item for item, _ in entries])
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        for (_, future), result in zip(entries, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            except Exception as error:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(error)
+                    continue
+                logger.warning(
+                    f"Пачка из {len(batch)} записей не сохранена ({error}), "
+                    "запись по одной"
+                )
+                for entry in batch:
+                    try:
+                        self._write([entry])
+                    except Exception as item_error:
+                        entry[1].set_exception(item_error)
+
+
+def write_replacements(db, items):
+    """
+    Запись пачки замен, заданных VIN и названиями (как в форме учета замен).
+    Для каждой записи возвращает строку для replacements_df (с id записи)
+    или ValueError, если оборудование, запчасть или мастерская не найдены.
+    """
+    refs = resolve_replacement_refs(db, items)
+    records = [
+        {
+            "equipment_id": ref["equipment_id"],
+            "spare_part_id": ref["spare_part_id"],
+            "workshop_id": ref["workshop_id"],
+            **{field: item[field] for field in REPLACEMENT_FIELDS},
+        }
+        for item, ref in zip(items, refs)
+        if ref is not None
+    ]
+    ids = iter(create_replacement_records(db, records) if records else [])
+    results = []
+    for item, ref in zip(items, refs):
+        if ref is None:
+            results.append(
+                ValueError(
+                    f"Не найдены оборудование {item['equipment_vin']}, "
+                    f"запчасть '{item['spare_part_name']}' "
+                    f"или мастерская '{item['workshop_name']}'"
+                )
+            )
+        else:
+            results.append(
+                {**item, "id": next(ids), "equipment_model": ref["equipment_model"]}
+            )
+    return results
+
+
+_replacement_queue = None
+_replacement_queue_lock = threading.Lock()
+
+
+def get_replacement_queue(session_factory):
+    """Общая для всех сессий очередь записи замен (создается при первом вызове)"""
+    global _replacement_queue
+    with _replacement_queue_lock:
+        if _replacement_queue is None:
+            _replacement_queue = WriteBehindQueue(
+                session_factory, write_replacements, name="replacement-writer"
+            )
+        return _replacement_queue